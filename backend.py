@@ -0,0 +1,324 @@
+# Compute Backend
+
+import os
+import weakref
+import numpy as np
+from core import sample_cosine_hemisphere
+from geometry import intersect_spheres, intersect_triangles, traverse_bvh, INTERSECTION_EPSILON
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+class NumpyBackend:
+    """The reference kernels, written as whole-array NumPy operations.
+
+    Every backend exposes the same kernels: pairwise sphere and triangle intersection, closest-hit BVH traversal
+    over spheres and triangles, and cosine-weighted hemisphere sampling for shading.
+    """
+
+    name = 'numpy'
+
+    def intersect_spheres(self, origins, directions, spheres):
+        """Calculates the hit distances of rays paired with spheres, np.inf where they miss."""
+        return intersect_spheres(origins, directions, spheres)
+
+    def intersect_triangles(self, origins, directions, triangles):
+        """Calculates the hit distances of rays paired with triangles, np.inf where they miss."""
+        return intersect_triangles(origins, directions, triangles)
+
+    def traverse_bvh(self, origins, directions, t_max, bvh, spheres, triangles, roots=None, stats=None):
+        """Finds the closest hit of every ray in a BVH over spheres and triangles.
+
+        Args:
+            origins (np.array): An (N, 3) array of ray origins.
+            directions (np.array): An (N, 3) array of ray directions.
+            t_max (np.array): An (N,) array of the farthest accepted distance per ray.
+            bvh (dict): The flattened hierarchy returned by geometry.build_bvh.
+            spheres (np.array): An (S, 4) array of spheres, referenced by primitive ids below S.
+            triangles (np.array): A (T, 3, 3) array of triangles, referenced by primitive ids from S on.
+            roots (np.array): The node each ray starts at. Defaults to node 0.
+            stats (dict): An optional dictionary in which traversal counters are accumulated.
+
+        Returns:
+            tuple: The hit distance and primitive id per ray, with t_max and -1 for misses.
+        """
+        sphere_count = len(spheres)
+
+        def intersect_primitives(ray_ids, primitive_ids, pair_t_max):
+            t = np.full(len(ray_ids), np.inf)
+            is_sphere = primitive_ids < sphere_count
+            t[is_sphere] = intersect_spheres(origins[ray_ids[is_sphere]], directions[ray_ids[is_sphere]], spheres[primitive_ids[is_sphere]])
+            t[~is_sphere] = intersect_triangles(origins[ray_ids[~is_sphere]], directions[ray_ids[~is_sphere]],
+                                                triangles[primitive_ids[~is_sphere] - sphere_count])
+            return t, np.full(len(ray_ids), -1, dtype=np.int32)
+
+        t, primitive, _ = traverse_bvh(origins, directions, t_max, bvh, intersect_primitives, stats, roots)
+        return t, primitive
+
+    def sample_cosine_hemisphere(self, normals, u_1, u_2):
+        """Samples cosine-weighted directions around unit normals from two uniform sample arrays."""
+        return sample_cosine_hemisphere(normals, u_1, u_2)
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _intersect_sphere(origin, direction, sphere, t_min):
+        # Solve the quadratic for the ray parameter
+        offset_x, offset_y, offset_z = origin[0] - sphere[0], origin[1] - sphere[1], origin[2] - sphere[2]
+        a = direction[0]**2 + direction[1]**2 + direction[2]**2
+        b = offset_x * direction[0] + offset_y * direction[1] + offset_z * direction[2]
+        c = offset_x**2 + offset_y**2 + offset_z**2 - sphere[3]**2
+        discriminant = b * b - a * c
+        if discriminant < 0:
+            return np.inf
+        root = np.sqrt(discriminant)
+        t = (-b - root) / a
+        if t <= t_min:
+            t = (-b + root) / a
+        return t if t > t_min else np.inf
+
+    @numba.njit(cache=True)
+    def _dot(a, b):
+        return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+    @numba.njit(cache=True)
+    def _intersect_triangle(origin, direction, triangle, t_min):
+        # Moller-Trumbore intersection
+        edge_1 = triangle[1] - triangle[0]
+        edge_2 = triangle[2] - triangle[0]
+        p = np.cross(direction, edge_2)
+        determinant = _dot(edge_1, p)
+        if abs(determinant) < 1e-12:
+            return np.inf
+        inverse_determinant = 1 / determinant
+        s = origin - triangle[0]
+        u = _dot(s, p) * inverse_determinant
+        if u < 0 or u > 1:
+            return np.inf
+        q = np.cross(s, edge_1)
+        v = _dot(direction, q) * inverse_determinant
+        if v < 0 or u + v > 1:
+            return np.inf
+        t = _dot(edge_2, q) * inverse_determinant
+        return t if t > t_min else np.inf
+
+    @numba.njit(parallel=True, cache=True)
+    def _intersect_spheres_kernel(origins, directions, spheres, t):
+        for i in numba.prange(len(t)):
+            t[i] = _intersect_sphere(origins[i], directions[i], spheres[i], INTERSECTION_EPSILON)
+
+    @numba.njit(parallel=True, cache=True)
+    def _intersect_triangles_kernel(origins, directions, triangles, t):
+        for i in numba.prange(len(t)):
+            t[i] = _intersect_triangle(origins[i], directions[i], triangles[i], INTERSECTION_EPSILON)
+
+    @numba.njit(parallel=True, cache=True)
+    def _traverse_bvh_kernel(origins, directions, t_max, bounds, children, ranges, indices, spheres, triangles, roots, stack_size, hit_t,
+                             hit_primitive, node_tests):
+        sphere_count = len(spheres)
+        for i in numba.prange(len(origins)):
+            origin, direction = origins[i], directions[i]
+            inverse_direction = 1 / direction
+            closest, primitive, tests = t_max[i], -1, 0
+            stack = np.empty(stack_size, dtype=np.int32)
+            stack[0], depth = roots[i], 1
+            while depth > 0:
+                depth -= 1
+                node = stack[depth]
+                tests += 1
+
+                # Test the node box with the slab method
+                t_near, t_far = -np.inf, np.inf
+                for axis in range(3):
+                    t_0 = (bounds[node, 0, axis] - origin[axis]) * inverse_direction[axis]
+                    t_1 = (bounds[node, 1, axis] - origin[axis]) * inverse_direction[axis]
+                    if not np.isnan(t_0) and not np.isnan(t_1):
+                        t_near = max(t_near, min(t_0, t_1))
+                        t_far = min(t_far, max(t_0, t_1))
+                if t_near > t_far or t_far < 0 or t_near >= closest:
+                    continue
+
+                if children[node, 0] < 0:
+                    # Test the primitives of the leaf
+                    for k in range(ranges[node, 0], ranges[node, 0] + ranges[node, 1]):
+                        candidate = indices[k]
+                        if candidate < sphere_count:
+                            t = _intersect_sphere(origin, direction, spheres[candidate], INTERSECTION_EPSILON)
+                        else:
+                            t = _intersect_triangle(origin, direction, triangles[candidate - sphere_count], INTERSECTION_EPSILON)
+                        if t < closest:
+                            closest, primitive = t, candidate
+                else:
+                    stack[depth], stack[depth + 1] = children[node, 1], children[node, 0]
+                    depth += 2
+            hit_t[i], hit_primitive[i], node_tests[i] = closest, primitive, tests
+
+    @numba.njit(cache=True)
+    def _bvh_depth(children):
+        # Children are stored after their parents, so one forward pass finds the depth of every node
+        depth = np.zeros(len(children), dtype=np.int32)
+        deepest = 0
+        for node in range(len(children)):
+            if children[node, 0] >= 0:
+                depth[children[node, 0]] = depth[children[node, 1]] = depth[node] + 1
+                deepest = max(deepest, depth[node] + 1)
+        return deepest
+
+    @numba.njit(parallel=True, cache=True)
+    def _sample_cosine_hemisphere_kernel(normals, u_1, u_2, directions):
+        for i in numba.prange(len(normals)):
+            normal = normals[i]
+            # Build a tangent frame around the normal
+            if abs(normal[0]) > 0.9:
+                tangent = np.cross(np.array([0.0, 1.0, 0.0]), normal)
+            else:
+                tangent = np.cross(np.array([1.0, 0.0, 0.0]), normal)
+            tangent /= np.sqrt(np.sum(tangent**2))
+            bitangent = np.cross(normal, tangent)
+
+            # Map the samples onto the disk and project them up to the hemisphere
+            radius = np.sqrt(u_1[i])
+            phi = 2 * np.pi * u_2[i]
+            height = np.sqrt(max(0.0, 1 - u_1[i]))
+            directions[i] = radius * np.cos(phi) * tangent + radius * np.sin(phi) * bitangent + height * normal
+
+class NumbaBackend:
+    """Kernels compiled with Numba, parallel over rays and cached on disk next to this module.
+
+    Traversal runs one ray per loop iteration with an explicit node stack, which is the per-ray branching that
+    whole-array NumPy cannot express. Unlike the reference, the pairwise kernels expect one primitive per ray rather
+    than broadcasting. Set NUMBA_CACHE_DIR to move the compiled kernel cache.
+    """
+
+    name = 'numba'
+
+    def __init__(self):
+        self.stack_sizes = {}
+
+    def stack_size(self, children):
+        """Returns the traversal stack size of a BVH, the depth of its deepest node plus two, cached per tree.
+
+        Traversal pops one node and pushes two children, so the stack never holds more than one pending sibling per
+        level above the current node plus the two new children.
+
+        Args:
+            children (np.array): The (M, 2) child node indices of the BVH, see geometry.build_bvh.
+
+        Returns:
+            int: The number of stack entries every ray needs.
+        """
+        key = id(children)
+        entry = self.stack_sizes.get(key)
+        if entry is None or entry[0]() is not children:
+            # Forget the size when the array is freed, since its id may then be reused
+            reference = weakref.ref(children, lambda _, key=key: self.stack_sizes.pop(key, None))
+            entry = self.stack_sizes[key] = (reference, int(_bvh_depth(np.asarray(children))) + 2)
+        return entry[1]
+
+    def intersect_spheres(self, origins, directions, spheres):
+        """Calculates the hit distances of rays paired with spheres, np.inf where they miss."""
+        origins, directions = _as_rows(origins, directions)
+        spheres = np.asarray(spheres, dtype=np.float64).reshape(-1, 4)
+        t = np.empty(len(origins))
+        _intersect_spheres_kernel(origins, directions, np.ascontiguousarray(spheres), t)
+        return t
+
+    def intersect_triangles(self, origins, directions, triangles):
+        """Calculates the hit distances of rays paired with triangles, np.inf where they miss."""
+        origins, directions = _as_rows(origins, directions)
+        triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        t = np.empty(len(origins))
+        _intersect_triangles_kernel(origins, directions, np.ascontiguousarray(triangles), t)
+        return t
+
+    def traverse_bvh(self, origins, directions, t_max, bvh, spheres, triangles, roots=None, stats=None):
+        """Finds the closest hit of every ray in a BVH over spheres and triangles, see NumpyBackend.traverse_bvh."""
+        origins, directions = _as_rows(origins, directions)
+        count = len(origins)
+        hit_t = np.array(t_max, dtype=np.float64)
+        hit_primitive = np.full(count, -1, dtype=np.int32)
+        if len(bvh['bounds']) == 0 or count == 0:
+            return hit_t, hit_primitive
+        roots = np.zeros(count, dtype=np.int32) if roots is None else np.ascontiguousarray(roots, dtype=np.int32)
+        node_tests = np.zeros(count, dtype=np.int64)
+        _traverse_bvh_kernel(origins, directions, np.array(t_max, dtype=np.float64), np.asarray(bvh['bounds']), np.asarray(bvh['children']),
+                             np.asarray(bvh['ranges']), np.asarray(bvh['indices']), np.asarray(spheres).reshape(-1, 4),
+                             np.asarray(triangles).reshape(-1, 3, 3), roots, self.stack_size(bvh['children']), hit_t, hit_primitive,
+                             node_tests)
+        if stats is not None:
+            stats['node_tests'] = stats.get('node_tests', 0) + int(node_tests.sum())
+        return hit_t, hit_primitive
+
+    def sample_cosine_hemisphere(self, normals, u_1, u_2):
+        """Samples cosine-weighted directions around unit normals from two uniform sample arrays."""
+        normals = np.ascontiguousarray(normals, dtype=np.float64)
+        directions = np.empty_like(normals)
+        _sample_cosine_hemisphere_kernel(normals, np.ascontiguousarray(u_1, dtype=np.float64), np.ascontiguousarray(u_2, dtype=np.float64), directions)
+        return directions
+
+def _as_rows(origins, directions):
+    """Converts ray arrays into contiguous float64 rows for the compiled kernels."""
+    return (np.ascontiguousarray(np.asarray(origins, dtype=np.float64).reshape(-1, 3)),
+            np.ascontiguousarray(np.asarray(directions, dtype=np.float64).reshape(-1, 3)))
+
+# Backend Selection
+
+BACKENDS = {'numpy': NumpyBackend}
+if numba is not None:
+    BACKENDS['numba'] = NumbaBackend
+
+def get_backend(name=None):
+    """Returns a compute backend, preferring Numba when it is installed.
+
+    Args:
+        name (str): 'numpy' or 'numba'. Defaults to the PYTHTRACER_BACKEND environment variable, then to the fastest
+            installed backend.
+
+    Returns:
+        NumpyBackend: The backend instance.
+    """
+    name = name or os.environ.get('PYTHTRACER_BACKEND') or ('numba' if numba is not None else 'numpy')
+    if name not in BACKENDS:
+        raise ValueError(f"Unavailable compute backend: {name}")
+    return BACKENDS[name]()
+
+def cross_check_backend(backend, ray_count=4096, seed=0):
+    """Compares the kernels of a backend against the NumPy reference on random rays and primitives.
+
+    Args:
+        backend (NumpyBackend): The backend to check.
+        ray_count (int): The number of random rays.
+        seed (int): The seed of the random scene.
+
+    Returns:
+        dict: The largest absolute difference from the reference per kernel, with misses compared as misses.
+    """
+    from geometry import build_bvh, primitive_bounds
+    reference = NumpyBackend()
+    rng = np.random.default_rng(seed)
+
+    # Build a random scene of small spheres and triangles
+    spheres = np.column_stack([rng.uniform(-5, 5, (64, 3)), rng.uniform(0.1, 0.5, 64)]).astype(np.float32)
+    triangles = (rng.uniform(-5, 5, (256, 1, 3)) + rng.normal(scale=0.5, size=(256, 3, 3))).astype(np.float32)
+    bvh = build_bvh(primitive_bounds(spheres, triangles))
+    origins = rng.uniform(-8, 8, (ray_count, 3))
+    directions = rng.normal(size=(ray_count, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+    def difference(a, b):
+        both = np.isfinite(a) & np.isfinite(b)
+        return float(np.max(np.abs(a[both] - b[both]), initial=0) + np.sum(np.isfinite(a) != np.isfinite(b)))
+
+    pair_spheres = spheres[rng.integers(0, len(spheres), ray_count)]
+    pair_triangles = triangles[rng.integers(0, len(triangles), ray_count)]
+    infinite = np.full(ray_count, np.inf)
+    u_1, u_2 = rng.random(ray_count), rng.random(ray_count)
+    return {
+        'intersect_spheres': difference(reference.intersect_spheres(origins, directions, pair_spheres), backend.intersect_spheres(origins, directions, pair_spheres)),
+        'intersect_triangles': difference(reference.intersect_triangles(origins, directions, pair_triangles), backend.intersect_triangles(origins, directions, pair_triangles)),
+        'traverse_bvh': difference(reference.traverse_bvh(origins, directions, infinite, bvh, spheres, triangles)[0],
+                                   backend.traverse_bvh(origins, directions, infinite, bvh, spheres, triangles)[0]),
+        'sample_cosine_hemisphere': float(np.max(np.abs(reference.sample_cosine_hemisphere(directions, u_1, u_2)
+                                                        - backend.sample_cosine_hemisphere(directions, u_1, u_2)))),
+    }
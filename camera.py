@@ -32,6 +32,55 @@ def generate_depth_of_field(focal_length, aperture, object_distance, image_dista
     depth_of_field = (aperture * (object_distance - image_distance)) / focal_length
     return depth_of_field
 
+def sample_concentric_disk(samples):
+    """Maps samples from the unit square onto the unit disk with Shirley's concentric mapping.
+
+    The mapping preserves the stratification of the input samples, unlike the polar mapping.
+
+    Args:
+        samples (np.array): An (N, 2) array of samples in [0, 1).
+
+    Returns:
+        np.array: An (N, 2) array of points on the unit disk.
+    """
+
+    # Map the samples to [-1, 1] and squash the squares into concentric rings
+    a = 2 * samples[:, 0] - 1
+    b = 2 * samples[:, 1] - 1
+    horizontal = np.abs(a) > np.abs(b)
+    radius = np.where(horizontal, a, b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theta = np.where(horizontal, np.pi / 4 * (b / a), np.pi / 2 - np.pi / 4 * (a / b))
+    theta = np.where((a == 0) & (b == 0), 0, theta)
+    return np.column_stack((radius * np.cos(theta), radius * np.sin(theta)))
+
+def apply_thin_lens(origins, directions, forward, right, up, lens_samples, aperture_radius, focus_distance):
+    """Turns pinhole camera rays into thin-lens rays that converge on the plane of focus.
+
+    Args:
+        origins (np.array): An (N, 3) array of pinhole ray origins.
+        directions (np.array): An (N, 3) array of unit pinhole ray directions.
+        forward (np.array): The unit viewing direction of the camera.
+        right (np.array): The unit right vector of the camera.
+        up (np.array): The unit up vector of the camera.
+        lens_samples (np.array): An (N, 2) array of lens samples in [0, 1).
+        aperture_radius (float): The radius of the lens aperture.
+        focus_distance (float): The distance from the lens to the plane of focus along the viewing direction.
+
+    Returns:
+        tuple: (N, 3) arrays of ray origins on the lens and unit ray directions.
+    """
+
+    # Find where each pinhole ray meets the plane of focus
+    focus_points = origins + directions * (focus_distance / (directions @ forward))[:, None]
+
+    # Move the origins across the aperture and aim them back at the plane of focus
+    lens = sample_concentric_disk(lens_samples) * aperture_radius
+    origins = origins + lens[:, :1] * right + lens[:, 1:] * up
+    directions = focus_points - origins
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return origins, directions
+
 # Motion Blur
 
 def generate_motion_blur(image, exposure_time):
@@ -1,4 +1,7 @@
+import time
 import numpy as np
+from camera import apply_thin_lens
+from sampler import generate_samples, bounce_dimension, DIMENSION_PIXEL, DIMENSION_LENS, BOUNCE_LIGHT, BOUNCE_BSDF, BOUNCE_LOBE
 
 # Camera Ray
 
@@ -166,4 +169,743 @@ def generate_refracted_ray(ray, intersection_point, normal, refractive_index):
     # Store the ray
     refracted_ray = np.array([intersection_point, ray_direction])
 
-    return refracted_ray
\ No newline at end of file
+    return refracted_ray
+
+# Batched Camera Rays
+
+def generate_camera_rays(camera_position, camera_direction, camera_fov, image_width, image_height, tile=None, pixel_offsets=None,
+                         lens_samples=None, aperture_radius=0.0, focus_distance=1.0, pixels=None):
+    """Generates the camera rays of a whole image or tile at once.
+
+    Args:
+        camera_position (np.array): The position of the camera in 3D space.
+        camera_direction (np.array): The direction the camera is pointing in 3D space.
+        camera_fov (float): The horizontal field of view of the camera in radians.
+        image_width (int): The width of the image in pixels.
+        image_height (int): The height of the image in pixels.
+        tile (tuple): The (x0, y0, x1, y1) pixel bounds of the tile to generate rays for. Defaults to the whole image.
+        pixel_offsets (np.array): An (N, 2) array of sample positions inside each pixel in [0, 1). Defaults to the
+            pixel centers.
+        lens_samples (np.array): An (N, 2) array of aperture samples in [0, 1). Defaults to the lens center.
+        aperture_radius (float): The radius of the thin lens. A radius of zero gives a pinhole camera.
+        focus_distance (float): The distance of the plane of focus along the camera direction.
+        pixels (np.array): An (N,) array of row-major pixel indices of the image to generate rays for instead of
+            a tile.
+
+    Returns:
+        tuple: (N, 3) arrays of ray origins and unit ray directions, in row-major pixel order of the tile or in the
+        order of the pixels.
+    """
+    x0, y0, x1, y1 = tile or (0, 0, image_width, image_height)
+
+    # Calculate the camera basis
+    forward = np.asarray(camera_direction, dtype=np.float64)
+    forward = forward / np.linalg.norm(forward)
+    right = np.cross(forward, np.array([0, 1, 0]))
+    right = right / np.linalg.norm(right)
+    up = np.cross(right, forward)
+
+    # Calculate the view plane coordinates of every sample
+    if pixels is None:
+        y, x = np.mgrid[y0:y1, x0:x1]
+    else:
+        y, x = np.divmod(np.asarray(pixels), image_width)
+    if pixel_offsets is None:
+        pixel_offsets = np.full((x.size, 2), 0.5)
+    view_plane_width = 2 * np.tan(camera_fov / 2)
+    view_plane_height = view_plane_width * (image_height / image_width)
+    u = ((x.ravel() + pixel_offsets[:, 0]) / image_width - 0.5) * view_plane_width
+    v = (0.5 - (y.ravel() + pixel_offsets[:, 1]) / image_height) * view_plane_height
+
+    # Generate the camera rays
+    directions = forward + u[:, None] * right + v[:, None] * up
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    origins = np.broadcast_to(np.asarray(camera_position, dtype=np.float64), directions.shape).copy()
+    if aperture_radius > 0 and lens_samples is not None:
+        origins, directions = apply_thin_lens(origins, directions, forward, right, up, lens_samples, aperture_radius, focus_distance)
+    return origins, directions
+
+
+# Ray Sorting
+
+def morton_codes(points, bits=10):
+    """Calculates Morton codes that order points along a Z-order curve through their bounding box.
+
+    Args:
+        points (np.array): An (N, 3) array of points.
+        bits (int): The number of bits per axis, at most 10.
+
+    Returns:
+        np.array: An (N,) array of 3 * bits bit codes.
+    """
+    # Quantize the points inside their bounding box
+    low, high = points.min(axis=0), points.max(axis=0)
+    scale = (2**bits - 1) / np.where(high > low, high - low, 1)
+    quantized = ((points - low) * scale).astype(np.uint32)
+
+    # Spread the bits of every axis two bits apart and interleave them
+    quantized = (quantized | (quantized << 16)) & 0x030000FF
+    quantized = (quantized | (quantized << 8)) & 0x0300F00F
+    quantized = (quantized | (quantized << 4)) & 0x030C30C3
+    quantized = (quantized | (quantized << 2)) & 0x09249249
+    return quantized[:, 0] | (quantized[:, 1] << 1) | (quantized[:, 2] << 2)
+
+def sort_rays(origins, directions):
+    """Orders a wavefront of rays so that rays with similar directions and nearby origins are traced together.
+
+    The rays are binned by direction octant first and by the Morton code of their origin within each octant.
+
+    Args:
+        origins (np.array): An (N, 3) array of ray origins.
+        directions (np.array): An (N, 3) array of ray directions.
+
+    Returns:
+        np.array: The permutation that sorts the rays.
+    """
+    if len(origins) == 0:
+        return np.arange(0)
+    octants = ((directions[:, 0] < 0) | ((directions[:, 1] < 0) << 1) | ((directions[:, 2] < 0) << 2)).astype(np.uint64)
+    keys = (octants << 30) | morton_codes(origins).astype(np.uint64)
+    return np.argsort(keys, kind='stable')
+
+def intersect_rays(scene, origins, directions, coherence_sorting=False, stats=None, t_max=None):
+    """Intersects a wavefront of rays with a scene, optionally reordering them for coherent traversal.
+
+    Args:
+        scene (Scene): The compiled scene.
+        origins (np.array): An (N, 3) array of ray origins.
+        directions (np.array): An (N, 3) array of ray directions.
+        coherence_sorting (bool): Whether to sort the rays before traversal and scatter the hits back afterwards.
+        stats (dict): An optional dictionary accumulating traversal counters, the 'intersect_time' spent in the
+            scene, and the 'sorted_rays' and 'sort_time' of the sorting stage.
+        t_max (np.array): An (N,) array of the farthest accepted hit distance per ray. Defaults to infinity.
+
+    Returns:
+        dict: The hit record of Scene.intersect, in the original ray order.
+    """
+    # Sort the rays
+    start_time = time.perf_counter()
+    order = sort_rays(origins, directions) if coherence_sorting else None
+    sort_time = time.perf_counter() - start_time
+
+    # Trace the rays
+    start_time = time.perf_counter()
+    if order is None:
+        hit = scene.intersect(origins, directions, stats, t_max)
+    else:
+        hit = scene.intersect(origins[order], directions[order], stats, None if t_max is None else t_max[order])
+    intersect_time = time.perf_counter() - start_time
+
+    # Scatter the hits back to the original ray order
+    start_time = time.perf_counter()
+    if order is not None:
+        for name, value in hit.items():
+            hit[name] = np.empty_like(value)
+            hit[name][order] = value
+    sort_time += time.perf_counter() - start_time
+
+    if stats is not None:
+        stats['intersect_time'] = stats.get('intersect_time', 0) + intersect_time
+        if order is not None:
+            stats['sorted_rays'] = stats.get('sorted_rays', 0) + len(order)
+            stats['sort_time'] = stats.get('sort_time', 0) + sort_time
+    return hit
+
+
+# Ray Buffers
+
+class PathBuffers:
+    """Preallocated float32 structure-of-arrays storage for the rays, hits and path state of a tile.
+
+    The ray fields hold the live paths in their first `count` rows and are compacted in place after every bounce,
+    while the path fields hold the per-pixel results and keep their row for the whole path. The buffers are sized
+    once per tile and reused for every sample and bounce.
+    """
+
+    RAY_FIELDS = (('origins', (3,), np.float32), ('directions', (3,), np.float32), ('t_max', (), np.float32),
+                  ('hit_t', (), np.float32), ('primitive', (), np.int32), ('instance', (), np.int32),
+                  ('material', (), np.int32), ('barycentrics', (2,), np.float32), ('points', (3,), np.float32),
+                  ('normals', (3,), np.float32), ('throughput', (3,), np.float32), ('path_ids', (), np.int32),
+                  ('cones', (2,), np.float32))
+    PATH_FIELDS = (('radiance', (3,), np.float32), ('normal', (3,), np.float32), ('albedo', (3,), np.float32),
+                   ('depth', (), np.float32))
+    HIT_FIELDS = (('hit_t', 't'), ('primitive', 'primitive'), ('instance', 'instance'), ('material', 'material'),
+                  ('barycentrics', 'barycentric'), ('points', 'point'), ('normals', 'normal'))
+
+    def __init__(self, capacity):
+        """Allocates the buffers.
+
+        Args:
+            capacity (int): The largest number of paths traced at once, usually the pixel count of a tile.
+        """
+        self.capacity = capacity
+        self.count = 0
+        self.path_count = 0
+        self.rays = {name: np.zeros((capacity,) + shape, dtype) for name, shape, dtype in self.RAY_FIELDS}
+        self.spare_rays = {name: np.zeros((capacity,) + shape, dtype) for name, shape, dtype in self.RAY_FIELDS}
+        self.paths = {name: np.zeros((capacity,) + shape, dtype) for name, shape, dtype in self.PATH_FIELDS}
+        self.identity = np.arange(capacity, dtype=np.int32)
+
+    def __getitem__(self, name):
+        """Returns the view of a field over the live paths, or over all paths for the path fields."""
+        if name in self.rays:
+            return self.rays[name][:self.count]
+        return self.paths[name][:self.path_count]
+
+    @classmethod
+    def footprint(cls, capacity):
+        """Calculates the size of the buffers for a number of paths without allocating them.
+
+        Args:
+            capacity (int): The number of paths.
+
+        Returns:
+            int: The size of the buffers in bytes, equal to the nbytes of buffers with that capacity.
+        """
+        field_bytes = lambda fields: sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, shape, dtype in fields)
+        return capacity * (2 * field_bytes(cls.RAY_FIELDS) + field_bytes(cls.PATH_FIELDS) + np.dtype(np.int32).itemsize)
+
+    @property
+    def nbytes(self):
+        """int: The memory held by the buffers in bytes."""
+        return sum(array.nbytes for fields in (self.rays, self.spare_rays, self.paths) for array in fields.values()) + self.identity.nbytes
+
+    def reset(self, origins, directions, background=(0, 0, 0), cone_spread=0.0):
+        """Starts a new batch of paths.
+
+        Args:
+            origins (np.array): An (N, 3) array of ray origins.
+            directions (np.array): An (N, 3) array of unit ray directions.
+            background (tuple): The albedo reported for paths that miss the scene.
+            cone_spread (float): The spread angle of the ray cones in radians, which start with zero width.
+        """
+        if len(origins) > self.capacity:
+            raise ValueError(f'Cannot trace {len(origins)} paths with buffers for {self.capacity}')
+        self.count = self.path_count = len(origins)
+        self['origins'][:] = origins
+        self['directions'][:] = directions
+        self['t_max'].fill(np.inf)
+        self['throughput'].fill(1)
+        self['path_ids'][:] = self.identity[:self.count]
+        self['cones'][:] = (0, cone_spread)
+        self['radiance'].fill(0)
+        self['normal'].fill(0)
+        self['albedo'][:] = background
+        self['depth'].fill(0)
+
+    def store_hits(self, hit):
+        """Copies a hit record of Scene.intersect into the hit fields of the live paths."""
+        for name, key in self.HIT_FIELDS:
+            np.copyto(self[name], hit[key], casting='unsafe')
+
+    def compact(self, alive):
+        """Moves the live paths to the front of the ray fields, keeping their order.
+
+        Args:
+            alive (np.array): A boolean mask over the current live paths.
+        """
+        count = int(np.count_nonzero(alive))
+        for name, array in self.rays.items():
+            np.compress(alive, array[:self.count], axis=0, out=self.spare_rays[name][:count])
+        self.rays, self.spare_rays = self.spare_rays, self.rays
+        self.count = count
+
+
+# G-Buffer Cache
+
+class GBufferCache:
+    """Keeps the camera ray hits of recently rendered tiles and samples for shading-only edits.
+
+    The cache holds a single view, made of the camera, the sampling settings and the scene geometry hash. Rendering
+    a different view clears it, while renders that only change lights, materials or post-processing reuse the first
+    hits (position, normal, material, primitive and instance ids) and skip primary intersection. Entries are keyed
+    by their pixels, seed and sample, so progressive passes with their own seeds share the view. Entries beyond the
+    memory budget are not stored, which keeps the first passes of a view cached, as a frame is re-rendered in the
+    same order after an edit.
+
+    Args:
+        max_bytes (int): The total size of the cached hit records.
+    """
+
+    FIELD_TYPES = {'t': np.float32, 'point': np.float32, 'normal': np.float32, 'barycentric': np.float32}
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.view = None
+        self.entries = {}
+        self.nbytes = 0
+
+    def use_view(self, view):
+        """Switches to a view, clearing the cache if it differs from the cached one.
+
+        Args:
+            view (tuple): The hashable camera, sampling and geometry settings of a render.
+        """
+        if view != self.view:
+            self.clear()
+            self.view = view
+
+    def clear(self):
+        """Drops every cached hit record."""
+        self.view = None
+        self.entries.clear()
+        self.nbytes = 0
+
+    def get(self, key, stats=None):
+        """Looks up the camera ray hits of a tile sample.
+
+        Args:
+            key (tuple): The tile bounds or pixels, the seed and the sample index.
+            stats (dict): An optional dictionary counting 'gbuffer_hits' and 'gbuffer_misses'.
+
+        Returns:
+            dict: The cached hit record, or None.
+        """
+        hit = self.entries.get(key)
+        if stats is not None:
+            name = 'gbuffer_misses' if hit is None else 'gbuffer_hits'
+            stats[name] = stats.get(name, 0) + 1
+        return hit
+
+    def store(self, key, hit):
+        """Caches the camera ray hits of a tile sample in compact types, unless the cache is full.
+
+        Args:
+            key (tuple): The tile bounds or pixels, the seed and the sample index.
+            hit (dict): The hit record of Scene.intersect.
+
+        Returns:
+            dict: The hit record in the compact types.
+        """
+        hit = {name: value.astype(self.FIELD_TYPES.get(name, value.dtype), copy=False) for name, value in hit.items()}
+        nbytes = sum(value.nbytes for value in hit.values())
+        if self.nbytes + nbytes <= self.max_bytes:
+            self.entries[key] = hit
+            self.nbytes += nbytes
+        return hit
+
+
+# Wavefront Tracing
+
+LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722])
+
+# The spread of a ray cone after a diffuse bounce, a wide cone standing in for the whole cosine lobe
+DIFFUSE_CONE_SPREAD = 0.25
+
+def sample_cosine_hemisphere(normals, u_1, u_2):
+    """Samples directions around normals with a cosine-weighted distribution.
+
+    Args:
+        normals (np.array): An (N, 3) array of unit normals.
+        u_1 (np.array): An (N,) array of uniform samples in [0, 1).
+        u_2 (np.array): An (N,) array of uniform samples in [0, 1).
+
+    Returns:
+        np.array: An (N, 3) array of unit directions in the hemispheres of the normals.
+    """
+    # Build a tangent frame around every normal
+    helper = np.where(np.abs(normals[:, :1]) > 0.9, np.array([0, 1, 0]), np.array([1, 0, 0]))
+    tangent = np.cross(helper, normals)
+    tangent /= np.linalg.norm(tangent, axis=1, keepdims=True)
+    bitangent = np.cross(normals, tangent)
+
+    # Map the samples onto the disk and project them up to the hemisphere
+    radius = np.sqrt(u_1)
+    phi = 2 * np.pi * u_2
+    height = np.sqrt(np.maximum(0, 1 - u_1))
+    return (radius * np.cos(phi))[:, None] * tangent + (radius * np.sin(phi))[:, None] * bitangent + height[:, None] * normals
+
+def direct_lighting(scene, points, normals, coherence_sorting=False, stats=None, samples=None):
+    """Calculates the irradiance from all lights of a scene, tracing shadow rays.
+
+    Every point is paired with every light, the pairs are evaluated in one batch by the scene's LightTable and
+    the shadow rays of all lit pairs are traced together.
+
+    Args:
+        scene (Scene): The compiled scene.
+        points (np.array): An (N, 3) array of surface points.
+        normals (np.array): An (N, 3) array of unit surface normals.
+        coherence_sorting (bool): Whether to sort the shadow rays before traversal.
+        stats (dict): An optional dictionary in which traversal and sorting counters are accumulated.
+        samples (np.array): An (N, 2) array of uniform samples for the area, environment and image lights.
+
+    Returns:
+        np.array: An (N, 3) array of irradiance arriving at the points, with shadowed lights left out.
+    """
+    irradiance = np.zeros((len(points), 3))
+    if not len(scene.lights) or not len(points):
+        return irradiance
+
+    # Evaluate every light at every point
+    point_ids = np.repeat(np.arange(len(points)), len(scene.lights))
+    light_ids = np.tile(np.arange(len(scene.lights)), len(points))
+    lights = scene.lights.evaluate_lights(points[point_ids], normals[point_ids], light_ids,
+                                          None if samples is None else samples[point_ids])
+    cosine = np.maximum(0, np.einsum('ij,ij->i', normals[point_ids], lights['direction']))
+    contribution = lights['radiance'] * (cosine / lights['pdf'])[:, None]
+
+    # Trace shadow rays for the pairs receiving light, stopping just short of the light
+    lit = np.flatnonzero(contribution.any(axis=1))
+    shadow_origins = points[point_ids[lit]] + normals[point_ids[lit]] * 1e-4
+    shadow_hits = intersect_rays(scene, shadow_origins, lights['direction'][lit], coherence_sorting, stats, lights['distance'][lit] * (1 - 1e-5))
+    lit = lit[shadow_hits['primitive'] < 0]
+
+    # Sum the unoccluded contributions per point
+    for channel in range(3):
+        irradiance[:, channel] = np.bincount(point_ids[lit], contribution[lit, channel], minlength=len(points))
+    return irradiance
+
+def trace_paths(scene, origins, directions, depth, sample_fn, background=(0, 0, 0), coherence_sorting=False, stats=None,
+                buffers=None, primary_hit=None, irradiance_cache=None, cone_spread=0.0):
+    """Traces a batch of paths through a scene one bounce at a time.
+
+    Every bounce intersects all live paths together, adds emission and direct lighting, and continues each path
+    either along the mirror direction or along a cosine-weighted diffuse direction.
+
+    Args:
+        scene (Scene): The compiled scene.
+        origins (np.array): An (N, 3) array of ray origins.
+        directions (np.array): An (N, 3) array of unit ray directions.
+        depth (int): The maximum number of bounces.
+        sample_fn (callable): Called with a sample dimension and the indices of the live paths, and returning an
+            (n, 2) array of uniform samples for them.
+        background (tuple): The radiance of rays leaving the scene.
+        coherence_sorting (bool): Whether to sort the secondary and shadow rays of every bounce before traversal.
+            Camera rays are already coherent and are traced in pixel order.
+        stats (dict): An optional dictionary in which traversal and sorting counters are accumulated.
+        buffers (PathBuffers): Buffers with room for N paths to trace in. Defaults to newly allocated buffers.
+        primary_hit (dict): A known hit record of the camera rays, which skips the first intersection.
+        irradiance_cache (IrradianceCache): A cache providing the diffuse indirect lighting. Paths then add the
+            interpolated indirect irradiance and only continue along mirror reflections.
+        cone_spread (float): The spread angle of the ray cones that select texture mipmap levels, usually the
+            angle of one pixel. Mirror bounces keep the spread and diffuse bounces widen it.
+
+    Returns:
+        tuple: An (N, 3) array of path radiance and a dictionary with the first-hit 'normal', 'albedo' and 'depth'.
+        The arrays are views into the buffers and are overwritten when the buffers are reused.
+    """
+    if buffers is None:
+        buffers = PathBuffers(len(origins))
+    buffers.reset(origins, directions, background, cone_spread)
+    radiance = buffers['radiance']
+
+    for bounce in range(depth + 1):
+        # Find the closest hits and retire the paths leaving the scene
+        if bounce == 0 and primary_hit is not None:
+            hit = primary_hit
+        else:
+            hit = intersect_rays(scene, buffers['origins'], buffers['directions'], coherence_sorting and bounce > 0, stats, buffers['t_max'])
+        buffers.store_hits(hit)
+        missed = buffers['primitive'] < 0
+        radiance[buffers['path_ids'][missed]] += buffers['throughput'][missed] * background
+        buffers.compact(~missed)
+        if not buffers.count:
+            break
+        paths, throughput, points, normals = buffers['path_ids'], buffers['throughput'], buffers['points'], buffers['normals']
+
+        # Look up the materials of the hits
+        materials = buffers['material']
+        colors = scene.arrays['material_colors'][materials]
+        reflection = scene.arrays['material_parameters'][materials, 2]
+        cones = buffers['cones']
+        cones[:, 0] += cones[:, 1] * buffers['hit_t']
+        if scene.textures:
+            colors = scene.texture_colors(colors, materials, buffers['primitive'], buffers['instance'], buffers['barycentrics'], points,
+                                          normals, buffers['directions'], cones[:, 0])
+        if bounce == 0:
+            buffers['normal'][paths] = normals
+            buffers['albedo'][paths] = colors
+            buffers['depth'][paths] = buffers['hit_t']
+
+        # Add the emitted light and the diffuse direct lighting
+        radiance[paths] += throughput * scene.arrays['material_emission'][materials]
+        diffuse_weight = (1 - reflection)[:, None] * colors / np.pi
+        light_samples = sample_fn(bounce_dimension(bounce, BOUNCE_LIGHT), paths) if scene.lights.sampled else None
+        radiance[paths] += throughput * diffuse_weight * direct_lighting(scene, points, normals, coherence_sorting, stats, light_samples)
+
+        # Add the cached diffuse indirect lighting while the paths have bounces left
+        if irradiance_cache is not None and depth - bounce > 0:
+            diffuse_hits = np.flatnonzero(reflection < 1)
+            indirect = cached_irradiance(scene, points[diffuse_hits], normals[diffuse_hits], irradiance_cache, depth - bounce, stats)
+            radiance[paths[diffuse_hits]] += throughput[diffuse_hits] * diffuse_weight[diffuse_hits] * indirect
+
+        # Continue along the mirror or a diffuse direction
+        mirror = sample_fn(bounce_dimension(bounce, BOUNCE_LOBE), paths)[:, 0] < reflection
+        samples = sample_fn(bounce_dimension(bounce, BOUNCE_BSDF), paths)
+        directions = buffers['directions']
+        reflected = directions - 2 * np.einsum('ij,ij->i', directions, normals)[:, None] * normals
+        diffuse = scene.backend.sample_cosine_hemisphere(normals, samples[:, 0], samples[:, 1])
+        np.copyto(directions, np.where(mirror[:, None], reflected, diffuse), casting='unsafe')
+        np.multiply(throughput, np.where(mirror[:, None], 1, colors), out=throughput, casting='unsafe')
+        cones[:, 1] = np.where(mirror, cones[:, 1], np.maximum(cones[:, 1], DIFFUSE_CONE_SPREAD))
+        np.add(points, normals * np.float32(1e-4), out=buffers['origins'])
+
+        # The irradiance cache already accounts for the diffuse bounce
+        if irradiance_cache is not None:
+            buffers.compact(mirror)
+
+    return radiance, {'normal': buffers['normal'], 'albedo': buffers['albedo'], 'depth': buffers['depth']}
+
+# Irradiance Caching
+
+def estimate_irradiance(scene, points, normals, ray_count, depth, seed=0, stats=None):
+    """Estimates the indirect irradiance at surface points by tracing stratified cosine-weighted hemisphere rays.
+
+    Args:
+        scene (Scene): The compiled scene.
+        points (np.array): An (N, 3) array of surface points.
+        normals (np.array): An (N, 3) array of unit surface normals.
+        ray_count (int): The number of rays per point, rounded down to a square number of strata.
+        depth (int): The number of further bounces of the hemisphere paths.
+        seed (int): The seed of the jitter and path samples.
+        stats (dict): An optional dictionary in which traversal counters are accumulated.
+
+    Returns:
+        tuple: An (N, 3) array of irradiance and an (N,) array of the harmonic mean distances to the visible
+        surfaces, infinite when every ray leaves the scene.
+    """
+    strata = max(1, int(np.sqrt(ray_count)))
+    ray_count = strata**2
+    rng = np.random.default_rng(seed)
+
+    # Jitter one sample in every stratum of the hemisphere of every point
+    records = np.repeat(np.arange(len(points)), ray_count)
+    cells = np.tile(np.arange(ray_count), len(points))
+    u_1 = (cells // strata + rng.random(len(cells))) / strata
+    u_2 = (cells % strata + rng.random(len(cells))) / strata
+    directions = sample_cosine_hemisphere(normals[records], u_1, u_2)
+    origins = points[records] + normals[records] * 1e-4
+
+    # With cosine-weighted sampling the irradiance is pi times the mean incoming radiance
+    radiance, aux = trace_paths(scene, origins, directions, depth, lambda dimension, paths: rng.random((len(paths), 2)), stats=stats,
+                                cone_spread=DIFFUSE_CONE_SPREAD)
+    irradiance = np.pi * radiance.reshape(len(points), ray_count, 3).mean(axis=1)
+    inverse_distance = np.where(aux['depth'] > 0, 1 / np.maximum(aux['depth'], 1e-6), 0).reshape(len(points), ray_count).sum(axis=1)
+    with np.errstate(divide='ignore'):
+        return irradiance, ray_count / inverse_distance
+
+def cached_irradiance(scene, points, normals, irradiance_cache, depth, stats=None):
+    """Looks up the indirect irradiance at surface points, lazily adding records where the cache has none.
+
+    Every fill pass adds records at a spaced subset of the uncovered points and looks them up again, and the last
+    pass adds a record at every point that is still uncovered.
+
+    Args:
+        scene (Scene): The compiled scene.
+        points (np.array): An (N, 3) array of surface points.
+        normals (np.array): An (N, 3) array of unit surface normals.
+        irradiance_cache (IrradianceCache): The cache of the scene.
+        depth (int): The remaining bounces of the paths arriving at the points, at least 1. The hemisphere paths of
+            new records take depth - 1 further bounces.
+        stats (dict): An optional dictionary counting 'irradiance_lookups' and 'irradiance_records'.
+
+    Returns:
+        np.array: An (N, 3) array of indirect irradiance.
+    """
+    points, normals = np.asarray(points, dtype=np.float64), np.asarray(normals, dtype=np.float64)
+    irradiance, covered = irradiance_cache.lookup(points, normals, depth)
+    created = 0
+    for fill_pass in range(irradiance_cache.max_passes):
+        missing = np.flatnonzero(~covered)
+        if not missing.size:
+            break
+
+        # Add records at the uncovered points and interpolate again
+        if fill_pass < irradiance_cache.max_passes - 1:
+            missing_records = missing[irradiance_cache.spread(points[missing])]
+        else:
+            missing_records = missing
+        record_irradiance, radii = estimate_irradiance(scene, points[missing_records], normals[missing_records], irradiance_cache.ray_count,
+                                                       depth - 1, irradiance_cache.count, stats)
+        irradiance_cache.insert(points[missing_records], normals[missing_records], record_irradiance, radii, depth)
+        irradiance[missing], covered[missing] = irradiance_cache.lookup(points[missing], normals[missing], depth)
+        created += len(missing_records)
+
+    if stats is not None:
+        stats['irradiance_lookups'] = stats.get('irradiance_lookups', 0) + len(points)
+        stats['irradiance_records'] = stats.get('irradiance_records', 0) + created
+    return irradiance
+
+def split_tiles(image_width, image_height, tile_size):
+    """Splits an image into square tiles in row-major order.
+
+    Args:
+        image_width (int): The width of the image in pixels.
+        image_height (int): The height of the image in pixels.
+        tile_size (int): The edge length of the tiles in pixels.
+
+    Returns:
+        list: The (x0, y0, x1, y1) bounds of the tiles.
+    """
+    return [(x, y, min(x + tile_size, image_width), min(y + tile_size, image_height))
+            for y in range(0, image_height, tile_size) for x in range(0, image_width, tile_size)]
+
+def render_tile(camera_position, camera_direction, camera_fov, image_width, image_height, scene, depth, tile=None, samples_per_pixel=1, seed=0,
+                sampler='sobol', aperture_radius=0.0, focus_distance=1.0, coherence_sorting=False, stats=None, gbuffer_cache=None,
+                irradiance_cache=None, pixels=None):
+    """Renders the color and auxiliary feature buffers of an image tile.
+
+    Args:
+        camera_position (np.array): The position of the camera in 3D space.
+        camera_direction (np.array): The direction the camera is pointing in 3D space.
+        camera_fov (float): The horizontal field of view of the camera in radians.
+        image_width (int): The width of the image in pixels.
+        image_height (int): The height of the image in pixels.
+        scene (Scene): The compiled scene.
+        depth (int): The maximum number of bounces.
+        tile (tuple): The (x0, y0, x1, y1) pixel bounds of the tile. Defaults to the whole image.
+        samples_per_pixel (int): The number of jittered samples per pixel.
+        seed (int): The sampler seed.
+        sampler (str): The sampler supplying the pixel and bounce samples: 'random', 'stratified', 'halton' or
+            'sobol'. Samples depend on the global pixel index, so the image does not depend on the tiling.
+        aperture_radius (float): The thin-lens aperture radius. Zero renders with a pinhole camera.
+        focus_distance (float): The distance of the plane of focus along the camera direction.
+        coherence_sorting (bool): Whether to sort the secondary and shadow rays before traversal.
+        stats (dict): An optional dictionary in which traversal and sorting counters are accumulated, along with
+            the largest 'path_buffer_bytes' of the preallocated path buffers of a tile. The peak working memory of a
+            tile, including temporaries, is measured by progress.estimate_render.
+        gbuffer_cache (GBufferCache): A cache of camera ray hits. When the camera, sampling and scene geometry match
+            the cached view, the primary intersection is skipped, so light and material edits render faster.
+        irradiance_cache (IrradianceCache): A cache of diffuse indirect irradiance records. Its records persist
+            between renders of the same scene, including progressive passes and camera moves.
+        pixels (np.array): An (N,) array of row-major pixel indices to render instead of a tile. A pixel receives the
+            same samples as in a tile render.
+
+    Returns:
+        dict: (H, W) tile buffers, or (N,) buffers of the pixels, of the mean 'color', the luminance 'variance' of
+        that mean (zero with one sample per pixel, where it is unknown), and the sample-averaged first-hit 'normal',
+        'albedo' and 'depth'.
+    """
+    x0, y0, x1, y1 = tile or (0, 0, image_width, image_height)
+    if pixels is None:
+        shape = (y1 - y0, x1 - x0)
+        pixel_ids = (np.arange(y0, y1)[:, None] * image_width + np.arange(x0, x1)).ravel()
+        gbuffer_key = (x0, y0, x1, y1)
+    else:
+        pixel_ids = np.asarray(pixels, dtype=np.int64)
+        shape = pixel_ids.shape
+        gbuffer_key = (pixel_ids.tobytes(),)
+    count = len(pixel_ids)
+    pixel_spread = 2 * np.tan(camera_fov / 2) / image_width
+
+    # Accumulate the samples with running means
+    buffers = {'color': np.zeros((count, 3)), 'normal': np.zeros((count, 3)), 'albedo': np.zeros((count, 3)), 'depth': np.zeros(count)}
+    luminance_mean, luminance_m2 = np.zeros(count), np.zeros(count)
+    path_buffers = PathBuffers(count)
+    if irradiance_cache is not None:
+        irradiance_cache.use_scene(scene)
+    if gbuffer_cache is not None:
+        gbuffer_cache.use_view((tuple(np.ravel(camera_position)), tuple(np.ravel(camera_direction)), camera_fov, image_width, image_height,
+                                samples_per_pixel, sampler, aperture_radius, focus_distance, scene.geometry_hash))
+    if stats is not None:
+        stats['path_buffer_bytes'] = max(stats.get('path_buffer_bytes', 0), path_buffers.nbytes)
+    for sample in range(samples_per_pixel):
+        pixel_offsets = generate_samples(sampler, pixel_ids, sample, DIMENSION_PIXEL, samples_per_pixel, seed)
+        lens_samples = generate_samples(sampler, pixel_ids, sample, DIMENSION_LENS, samples_per_pixel, seed) if aperture_radius > 0 else None
+        origins, directions = generate_camera_rays(camera_position, camera_direction, camera_fov, image_width, image_height,
+                                                   (x0, y0, x1, y1), pixel_offsets, lens_samples, aperture_radius, focus_distance, pixels)
+        sample_fn = lambda dimension, paths, sample=sample: generate_samples(sampler, pixel_ids[paths], sample, dimension, samples_per_pixel, seed)
+        primary_hit = None
+        if gbuffer_cache is not None:
+            primary_hit = gbuffer_cache.get(gbuffer_key + (seed, sample), stats)
+            if primary_hit is None:
+                primary_hit = gbuffer_cache.store(gbuffer_key + (seed, sample), intersect_rays(scene, origins, directions, stats=stats))
+        radiance, aux = trace_paths(scene, origins, directions, depth, sample_fn, coherence_sorting=coherence_sorting, stats=stats,
+                                    buffers=path_buffers, primary_hit=primary_hit, irradiance_cache=irradiance_cache,
+                                    cone_spread=pixel_spread)
+        aux['color'] = radiance
+        for name, value in aux.items():
+            buffers[name] += (value - buffers[name]) / (sample + 1)
+
+        # Track the luminance variance with Welford's algorithm
+        luminance = radiance @ LUMINANCE_WEIGHTS
+        delta = luminance - luminance_mean
+        luminance_mean += delta / (sample + 1)
+        luminance_m2 += delta * (luminance - luminance_mean)
+
+    # Report the variance of the pixel estimates, not of the individual samples
+    if samples_per_pixel > 1:
+        buffers['variance'] = luminance_m2 / (samples_per_pixel - 1) / samples_per_pixel
+    else:
+        buffers['variance'] = np.zeros(count)
+    return {name: value.reshape(shape + value.shape[1:]) for name, value in buffers.items()}
+
+# Preview Pyramid
+
+PYRAMID_STRIDES = (4, 2, 1)
+
+def pyramid_pixels(image_width, image_height, stride, coarser_stride=None, tile=None):
+    """Lists the pixels a level of the preview pyramid adds to the levels before it.
+
+    A level with a given stride renders the pixels whose coordinates are both multiples of the stride, so the
+    strides 4, 2 and 1 render 1/16, 1/4 and all pixels. Pixels of the coarser level are skipped, as their samples
+    are already part of the image.
+
+    Args:
+        image_width (int): The width of the image in pixels.
+        image_height (int): The height of the image in pixels.
+        stride (int): The pixel spacing of the level.
+        coarser_stride (int): The pixel spacing of the previous level, a multiple of the stride. Defaults to no
+            previous level.
+        tile (tuple): The (x0, y0, x1, y1) pixel bounds to list the pixels of. Defaults to the whole image.
+
+    Returns:
+        np.array: The row-major indices of the new pixels.
+    """
+    x0, y0, x1, y1 = tile or (0, 0, image_width, image_height)
+    y, x = np.mgrid[-(-y0 // stride) * stride:y1:stride, -(-x0 // stride) * stride:x1:stride]
+    y, x = y.ravel(), x.ravel()
+    if coarser_stride is not None:
+        new = (y % coarser_stride != 0) | (x % coarser_stride != 0)
+        y, x = y[new], x[new]
+    return y * image_width + x
+
+def upsample_edge_aware(color, normal, depth, stride, depth_sigma=0.1, normal_power=8):
+    """Fills an image from the pixels of a pyramid level without blurring across silhouettes and creases.
+
+    Every pixel blends the four surrounding level pixels bilinearly, and each of them is further weighted by how
+    closely its first-hit depth and normal match those of the nearest level pixel. Within a surface this is plain
+    bilinear interpolation, while across an edge the pixel takes the side of its nearest sample.
+
+    Args:
+        color (np.array): An (H, W, 3) image whose pixels at multiples of the stride are rendered.
+        normal (np.array): An (H, W, 3) array of first-hit normals, valid at the same pixels.
+        depth (np.array): An (H, W) array of first-hit distances, valid at the same pixels, zero for misses.
+        stride (int): The pixel spacing of the rendered pixels.
+        depth_sigma (float): The relative depth difference at which a sample's weight drops by 1/e.
+        normal_power (float): The exponent of the normal similarity weight.
+
+    Returns:
+        np.array: The (H, W, 3) filled image.
+    """
+    if stride == 1:
+        return color
+    image_height, image_width = depth.shape
+    level_color, level_normal, level_depth = color[::stride, ::stride], normal[::stride, ::stride], depth[::stride, ::stride]
+    level_height, level_width = level_depth.shape
+
+    # Find the surrounding and the nearest level pixels of every pixel
+    y, x = np.arange(image_height) / stride, np.arange(image_width) / stride
+    y_0, x_0 = np.floor(y).astype(int), np.floor(x).astype(int)
+    y_1, x_1 = np.minimum(y_0 + 1, level_height - 1), np.minimum(x_0 + 1, level_width - 1)
+    y_near, x_near = np.minimum(np.floor(y + 0.5).astype(int), level_height - 1), np.minimum(np.floor(x + 0.5).astype(int), level_width - 1)
+    near_depth = level_depth[y_near[:, None], x_near]
+    near_normal = level_normal[y_near[:, None], x_near]
+
+    # Blend the corners with their bilinear and similarity weights
+    result = np.zeros((image_height, image_width, 3))
+    total = np.zeros((image_height, image_width))
+    for rows, row_weights in ((y_0, 1 - (y - y_0)), (y_1, y - y_0)):
+        for columns, column_weights in ((x_0, 1 - (x - x_0)), (x_1, x - x_0)):
+            corner_depth = level_depth[rows[:, None], columns]
+            difference = np.abs(corner_depth - near_depth) / np.maximum(np.maximum(corner_depth, near_depth), 1e-6)
+            similarity = np.maximum(np.einsum('ijk,ijk->ij', level_normal[rows[:, None], columns], near_normal), 0) ** normal_power
+            weights = row_weights[:, None] * column_weights * np.exp(-(difference / depth_sigma) ** 2) * similarity
+            result += weights[..., None] * level_color[rows[:, None], columns]
+            total += weights
+
+    # Fall back to the nearest sample where no corner is similar enough, as with zero normals of missed rays
+    nearest = total < 1e-8
+    result[nearest] = level_color[y_near[:, None], x_near][nearest]
+    result[~nearest] /= total[~nearest, None]
+    return result
@@ -179,4 +179,308 @@ def cone_intersection(ray, cone_position, cone_direction, cone_angle):
         else:
             return None
     else:
-        return None
\ No newline at end of file
+        return None
+
+# Batched Intersection
+
+INTERSECTION_EPSILON = 1e-4
+
+def intersect_spheres(origins, directions, spheres, t_min=INTERSECTION_EPSILON):
+    """Calculates the intersection distances of a batch of rays with spheres.
+
+    Rays and spheres are paired element-wise, so the leading dimensions of the arrays must broadcast.
+
+    Args:
+        origins (np.array): An (N, 3) array of ray origins.
+        directions (np.array): An (N, 3) array of ray directions.
+        spheres (np.array): An (N, 4) array of sphere centers and radii.
+        t_min (float): The smallest accepted hit distance.
+
+    Returns:
+        np.array: An (N,) array of hit distances, np.inf where the ray misses.
+    """
+    # Solve the quadratic for the ray parameter
+    offset = origins - spheres[..., :3]
+    a = np.einsum('...i,...i->...', directions, directions)
+    b = np.einsum('...i,...i->...', offset, directions)
+    c = np.einsum('...i,...i->...', offset, offset) - spheres[..., 3]**2
+    discriminant = b**2 - a * c
+    root = np.sqrt(np.maximum(discriminant, 0))
+
+    # Take the nearest root in front of the ray
+    t_near = (-b - root) / a
+    t_far = (-b + root) / a
+    t = np.where(t_near > t_min, t_near, t_far)
+    return np.where((discriminant >= 0) & (t > t_min), t, np.inf)
+
+def intersect_triangles(origins, directions, triangles, t_min=INTERSECTION_EPSILON):
+    """Calculates the intersection distances of a batch of rays with triangles.
+
+    Rays and triangles are paired element-wise, so the leading dimensions of the arrays must broadcast.
+
+    Args:
+        origins (np.array): An (N, 3) array of ray origins.
+        directions (np.array): An (N, 3) array of ray directions.
+        triangles (np.array): An (N, 3, 3) array of triangle vertices.
+        t_min (float): The smallest accepted hit distance.
+
+    Returns:
+        np.array: An (N,) array of hit distances, np.inf where the ray misses.
+    """
+    # Calculate the triangle edges
+    edge_1 = triangles[..., 1, :] - triangles[..., 0, :]
+    edge_2 = triangles[..., 2, :] - triangles[..., 0, :]
+
+    # Calculate the determinant and the barycentric coordinates
+    p = np.cross(directions, edge_2)
+    determinant = np.einsum('...i,...i->...', edge_1, p)
+    parallel = np.abs(determinant) < 1e-12
+    inverse_determinant = 1 / np.where(parallel, 1, determinant)
+    s = origins - triangles[..., 0, :]
+    u = np.einsum('...i,...i->...', s, p) * inverse_determinant
+    q = np.cross(s, edge_1)
+    v = np.einsum('...i,...i->...', directions, q) * inverse_determinant
+    t = np.einsum('...i,...i->...', edge_2, q) * inverse_determinant
+
+    # Reject hits outside the triangle or behind the ray
+    valid = ~parallel & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > t_min)
+    return np.where(valid, t, np.inf)
+
+def intersect_planes(origins, directions, planes, t_min=INTERSECTION_EPSILON):
+    """Calculates the intersection distances of a batch of rays with planes.
+
+    Rays and planes are paired element-wise, so the leading dimensions of the arrays must broadcast.
+
+    Args:
+        origins (np.array): An (N, 3) array of ray origins.
+        directions (np.array): An (N, 3) array of ray directions.
+        planes (np.array): An (N, 2, 3) array of plane positions and normals.
+        t_min (float): The smallest accepted hit distance.
+
+    Returns:
+        np.array: An (N,) array of hit distances, np.inf where the ray misses.
+    """
+    # Calculate the intersection distance
+    normals = planes[..., 1, :]
+    denominator = np.einsum('...i,...i->...', directions, normals)
+    parallel = np.abs(denominator) < 1e-12
+    t = np.einsum('...i,...i->...', planes[..., 0, :] - origins, normals) / np.where(parallel, 1, denominator)
+    return np.where(~parallel & (t > t_min), t, np.inf)
+
+def triangle_barycentrics(points, triangles):
+    """Calculates the barycentric coordinates of points lying on triangles.
+
+    Args:
+        points (np.array): An (N, 3) array of points.
+        triangles (np.array): An (N, 3, 3) array of triangle vertices.
+
+    Returns:
+        np.array: An (N, 2) array of the weights (u, v) of the second and third vertex.
+    """
+    # Solve the 2x2 system of the edge dot products
+    edge_1 = triangles[:, 1] - triangles[:, 0]
+    edge_2 = triangles[:, 2] - triangles[:, 0]
+    offset = points - triangles[:, 0]
+    d_11 = np.einsum('ij,ij->i', edge_1, edge_1)
+    d_12 = np.einsum('ij,ij->i', edge_1, edge_2)
+    d_22 = np.einsum('ij,ij->i', edge_2, edge_2)
+    d_o1 = np.einsum('ij,ij->i', offset, edge_1)
+    d_o2 = np.einsum('ij,ij->i', offset, edge_2)
+    determinant = d_11 * d_22 - d_12 * d_12
+    determinant = np.where(np.abs(determinant) < 1e-20, 1, determinant)
+    return np.column_stack(((d_22 * d_o1 - d_12 * d_o2) / determinant, (d_11 * d_o2 - d_12 * d_o1) / determinant))
+
+# Bounding Volume Hierarchy
+
+def primitive_bounds(spheres, triangles):
+    """Calculates the axis-aligned bounding boxes of spheres and triangles.
+
+    Args:
+        spheres (np.array): An (S, 4) array of sphere centers and radii.
+        triangles (np.array): A (T, 3, 3) array of triangle vertices.
+
+    Returns:
+        np.array: An (S + T, 2, 3) array of box minima and maxima, spheres first.
+    """
+    sphere_bounds = np.stack([spheres[:, :3] - spheres[:, 3:], spheres[:, :3] + spheres[:, 3:]], axis=1)
+    triangle_bounds = np.stack([triangles.min(axis=1), triangles.max(axis=1)], axis=1)
+    return np.concatenate([sphere_bounds.reshape(-1, 2, 3), triangle_bounds.reshape(-1, 2, 3)])
+
+def build_bvh(bounds, max_leaf_size=4):
+    """Builds a bounding volume hierarchy over a set of primitive bounds.
+
+    The tree is split at the centroid median of the longest axis and flattened into arrays, so it can be stored
+    in a scene bundle and traversed without Python objects.
+
+    Args:
+        bounds (np.array): An (M, 2, 3) array of primitive box minima and maxima.
+        max_leaf_size (int): The maximum number of primitives in a leaf node.
+
+    Returns:
+        dict: The node boxes ('bounds'), the child node indices with -1 for leaves ('children'), the primitive
+        start and count of each leaf ('ranges') and the primitive order referenced by the leaves ('indices').
+    """
+    indices = np.arange(len(bounds), dtype=np.int32)
+    centroids = bounds.mean(axis=1)
+    node_bounds, node_children, node_ranges = [], [], []
+
+    # Split the primitive ranges until every leaf is small enough
+    stack = [(0, len(bounds), -1, 0)] if len(bounds) else []
+    while stack:
+        start, end, parent, side = stack.pop()
+        node = len(node_bounds)
+        if parent >= 0:
+            node_children[parent][side] = node
+        subset = indices[start:end]
+        node_bounds.append([bounds[subset, 0].min(axis=0), bounds[subset, 1].max(axis=0)])
+        node_children.append([-1, -1])
+        node_ranges.append([start, end - start])
+        if end - start <= max_leaf_size:
+            continue
+
+        # Partition the primitives around the median centroid of the longest axis
+        extent = np.ptp(centroids[subset], axis=0)
+        axis = int(np.argmax(extent))
+        if extent[axis] <= 0:
+            continue
+        middle = (end - start) // 2
+        order = np.argpartition(centroids[subset, axis], middle)
+        indices[start:end] = subset[order]
+        node_ranges[node] = [0, 0]
+        stack.append((start + middle, end, node, 1))
+        stack.append((start, start + middle, node, 0))
+
+    return {
+        'bounds': np.array(node_bounds, dtype=np.float32).reshape(-1, 2, 3),
+        'children': np.array(node_children, dtype=np.int32).reshape(-1, 2),
+        'ranges': np.array(node_ranges, dtype=np.int32).reshape(-1, 2),
+        'indices': indices,
+    }
+
+def intersect_boxes(origins, inverse_directions, boxes, t_max):
+    """Tests a batch of rays against axis-aligned boxes with the slab method.
+
+    Args:
+        origins (np.array): An (N, 3) array of ray origins.
+        inverse_directions (np.array): An (N, 3) array of reciprocal ray directions.
+        boxes (np.array): An (N, 2, 3) array of box minima and maxima.
+        t_max (np.array): An (N,) array of the farthest accepted distance per ray.
+
+    Returns:
+        np.array: An (N,) boolean array that is True where the ray enters the box before t_max.
+    """
+    t_0 = (boxes[:, 0] - origins) * inverse_directions
+    t_1 = (boxes[:, 1] - origins) * inverse_directions
+    t_near = np.nanmax(np.minimum(t_0, t_1), axis=1)
+    t_far = np.nanmin(np.maximum(t_0, t_1), axis=1)
+    return (t_near <= t_far) & (t_far >= 0) & (t_near < t_max)
+
+def traverse_bvh(origins, directions, t_max, bvh, intersect_fn, stats=None, roots=None):
+    """Finds the closest primitive hit for a batch of rays in a bounding volume hierarchy.
+
+    All rays are traversed together one tree level at a time, so every box and primitive test is a single array
+    operation over the active (ray, node) pairs.
+
+    Args:
+        origins (np.array): An (N, 3) array of ray origins.
+        directions (np.array): An (N, 3) array of ray directions.
+        t_max (np.array): An (N,) array of the farthest accepted distance per ray.
+        bvh (dict): The hierarchy returned by build_bvh.
+        intersect_fn (callable): Called with (ray_ids, primitive_ids, t_max) for the pairs reaching a leaf and
+            returning an array of hit distances and an array of sub-primitive ids for those pairs.
+        stats (dict): An optional dictionary in which node and primitive test counts are accumulated.
+        roots (np.array): The node each ray starts at, for hierarchies that hold several trees. Defaults to node 0.
+
+    Returns:
+        tuple: The hit distance, primitive id and sub-primitive id per ray, with np.inf and -1 for misses.
+    """
+    count = len(origins)
+    hit_t = np.array(t_max, dtype=np.float64)
+    hit_primitive = np.full(count, -1, dtype=np.int32)
+    hit_sub = np.full(count, -1, dtype=np.int32)
+    if len(bvh['bounds']) == 0 or count == 0:
+        return hit_t, hit_primitive, hit_sub
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inverse_directions = 1 / directions
+
+    # Start every ray at its root node
+    ray_ids = np.arange(count)
+    node_ids = np.zeros(count, dtype=np.int32) if roots is None else np.asarray(roots, dtype=np.int32)
+    while ray_ids.size:
+        # Cull the pairs whose node box is missed or lies behind the closest hit
+        with np.errstate(invalid='ignore'):
+            keep = intersect_boxes(origins[ray_ids], inverse_directions[ray_ids], bvh['bounds'][node_ids], hit_t[ray_ids])
+        if stats is not None:
+            stats['node_tests'] = stats.get('node_tests', 0) + int(ray_ids.size)
+        ray_ids, node_ids = ray_ids[keep], node_ids[keep]
+        leaf = bvh['children'][node_ids, 0] < 0
+
+        # Expand the leaves into (ray, primitive) pairs and test them
+        leaf_rays, leaf_nodes = ray_ids[leaf], node_ids[leaf]
+        starts, counts = bvh['ranges'][leaf_nodes, 0], bvh['ranges'][leaf_nodes, 1]
+        if counts.sum():
+            pair_rays = np.repeat(leaf_rays, counts)
+            firsts = np.repeat(np.cumsum(counts) - counts, counts)
+            pair_primitives = bvh['indices'][np.repeat(starts, counts) + np.arange(pair_rays.size) - firsts]
+            t, sub = intersect_fn(pair_rays, pair_primitives, hit_t[pair_rays])
+            if stats is not None:
+                stats['primitive_tests'] = stats.get('primitive_tests', 0) + int(pair_rays.size)
+
+            # Keep the closest hit per ray
+            np.minimum.at(hit_t, pair_rays, t)
+            closest = np.isfinite(t) & (t == hit_t[pair_rays])
+            hit_primitive[pair_rays[closest]] = pair_primitives[closest]
+            hit_sub[pair_rays[closest]] = sub[closest]
+
+        # Descend into both children of the interior nodes
+        inner_rays, inner_nodes = ray_ids[~leaf], node_ids[~leaf]
+        ray_ids = np.concatenate([inner_rays, inner_rays])
+        node_ids = np.concatenate([bvh['children'][inner_nodes, 0], bvh['children'][inner_nodes, 1]])
+
+    return hit_t, hit_primitive, hit_sub
+
+
+# Instancing
+
+def transform_points(transforms, points):
+    """Applies 4x4 affine transforms to points.
+
+    Args:
+        transforms (np.array): An (N, 4, 4) array of transforms.
+        points (np.array): An (N, 3) array of points.
+
+    Returns:
+        np.array: An (N, 3) array of transformed points.
+    """
+    return np.einsum('nij,nj->ni', transforms[:, :3, :3], points) + transforms[:, :3, 3]
+
+def transform_directions(transforms, directions):
+    """Applies the linear part of 4x4 affine transforms to directions.
+
+    The directions are not renormalized, so hit distances along a transformed ray match the untransformed ray.
+
+    Args:
+        transforms (np.array): An (N, 4, 4) array of transforms.
+        directions (np.array): An (N, 3) array of directions.
+
+    Returns:
+        np.array: An (N, 3) array of transformed directions.
+    """
+    return np.einsum('nij,nj->ni', transforms[:, :3, :3], directions)
+
+def transform_bounds(transforms, bounds):
+    """Calculates the axis-aligned boxes enclosing transformed boxes.
+
+    Args:
+        transforms (np.array): An (N, 4, 4) array of transforms.
+        bounds (np.array): An (N, 2, 3) array of box minima and maxima.
+
+    Returns:
+        np.array: An (N, 2, 3) array of box minima and maxima after the transforms.
+    """
+    # Transform all eight corners of every box
+    corner_mask = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)])
+    corners = np.where(corner_mask[None], bounds[:, None, 1], bounds[:, None, 0])
+    corners = np.einsum('nij,nkj->nki', transforms[:, :3, :3], corners) + transforms[:, None, :3, 3]
+    return np.stack([corners.min(axis=1), corners.max(axis=1)], axis=1)
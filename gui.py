@@ -1,10 +1,18 @@
 # Render Window
+import threading
+import time
 import numpy as np
-from PyQt5.QtWidgets import QMainWindow
+from PyQt5.QtCore import QThread, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QMainWindow, QLabel
 from core import generate_camera_ray
 from core import generate_shadow_ray
 from core import render_equation
 from core import recursive_tracing
+from core import render_tile, split_tiles, pyramid_pixels, upsample_edge_aware, GBufferCache, PYRAMID_STRIDES
+from irradiance import IrradianceCache
+from progress import RenderProgress
+from texture import configure_tile_cache
 
 
 def render_image(self, camera_position, camera_direction, camera_fov, image_width, image_height, scene, depth):
@@ -100,4 +108,325 @@ def save_render_image(self, image_buffer, file_name):
     """
 
     # Save the image to a file
-    np.save(file_name, image_buffer)
\ No newline at end of file
+    np.save(file_name, image_buffer)
+
+# Interactive Rendering
+
+PREVIEW_SCALES = (1, 2, 4, 8, 16)
+
+def display_pixels(color):
+    """Converts linear radiance into gamma-corrected 8-bit RGB pixels.
+
+    Args:
+        color (np.array): An (H, W, 3) array of linear radiance.
+
+    Returns:
+        np.array: An (H, W, 3) array of uint8 pixels.
+    """
+    return (np.clip(color, 0, 1) ** (1 / 2.2) * 255).astype(np.uint8)
+
+class RenderWorker(QThread):
+    """Renders camera views on a background thread and streams the finished tiles to the UI thread.
+
+    Every submitted view increments a generation counter. The worker checks it between tiles, so an edit cancels
+    the frame in flight within one tile and the newest view is rendered straight away. Views submitted while the
+    user is moving are rendered with one sample at every n-th pixel, for the smallest n that fits the frame budget;
+    resting views walk the preview pyramid and are then refined progressively at full resolution, one sample per
+    pass. The camera ray hits of the current view are kept in a GBufferCache, so light and material edits re-render
+    without primary intersection. Scenes with the 'irradiance_cache' setting share one IrradianceCache across all
+    passes and views.
+    """
+
+    tile_finished = pyqtSignal(int, object, object)
+    frame_finished = pyqtSignal(int, int, float)
+    progress_changed = pyqtSignal(int, object)
+
+    def __init__(self, scene, image_width, image_height, depth=3, tile_size=32, max_samples=64, frame_budget=1 / 15, parent=None):
+        """Creates the worker.
+
+        Args:
+            scene (Scene): The compiled scene.
+            image_width (int): The width of the image in pixels.
+            image_height (int): The height of the image in pixels.
+            depth (int): The maximum number of bounces.
+            tile_size (int): The edge length of the tiles streamed to the window.
+            max_samples (int): The number of progressive passes for a resting view.
+            frame_budget (float): The time in seconds a preview frame may take while the user is moving.
+            parent (QObject): The parent object.
+        """
+        super().__init__(parent)
+        self.scene = scene
+        self.image_width = image_width
+        self.image_height = image_height
+        self.depth = depth
+        self.tile_size = tile_size
+        self.max_samples = max_samples
+        self.frame_budget = frame_budget
+        self.generation = 0
+        self.pixel_cost = None
+        self.pending = None
+        self.last_view = None
+        self.gbuffer_cache = GBufferCache()
+        self.irradiance_cache = IrradianceCache()
+        self.running = True
+        self.condition = threading.Condition()
+
+    def submit(self, view, moving=False):
+        """Cancels the frame in flight and queues a new view.
+
+        Args:
+            view (dict): The camera 'position', 'direction' and 'fov', and optionally the thin-lens
+                'aperture_radius' and 'focus_distance'.
+            moving (bool): Whether the user is still moving, which selects the fast preview.
+
+        Returns:
+            int: The generation of the new view. Tiles of older generations are stale.
+        """
+        with self.condition:
+            self.generation += 1
+            self.last_view = dict(view)
+            self.pending = (self.generation, self.last_view, moving)
+            self.condition.notify()
+            return self.generation
+
+    def set_scene(self, scene, moving=False):
+        """Replaces the scene and restarts the current view.
+
+        Args:
+            scene (Scene): The new compiled scene.
+            moving (bool): Whether more edits are expected soon.
+        """
+        with self.condition:
+            self.scene = scene
+        if self.last_view is not None:
+            self.submit(self.last_view, moving)
+
+    def stop(self):
+        """Cancels the frame in flight and waits for the thread to finish."""
+        with self.condition:
+            self.running = False
+            self.generation += 1
+            self.condition.notify()
+        self.wait()
+
+    def cancelled(self, generation):
+        """Checks whether a newer view or a stop request has superseded a generation."""
+        return generation != self.generation or not self.running
+
+    def preview_scale(self):
+        """Picks the smallest resolution divisor whose single-sample frame fits into the frame budget.
+
+        Returns:
+            int: The divisor of the image width and height.
+        """
+        if self.pixel_cost is None:
+            return PREVIEW_SCALES[-1]
+        for scale in PREVIEW_SCALES:
+            if self.image_width * self.image_height / scale**2 * self.pixel_cost <= self.frame_budget:
+                return scale
+        return PREVIEW_SCALES[-1]
+
+    def measure(self, seconds, pixel_samples):
+        """Updates the running estimate of the time one pixel sample takes."""
+        cost = seconds / max(pixel_samples, 1)
+        self.pixel_cost = cost if self.pixel_cost is None else 0.7 * self.pixel_cost + 0.3 * cost
+
+    def render_view(self, view, tile, width, height, seed, pixels=None):
+        """Renders one sample per pixel of a tile, or of a set of pixels, of a view."""
+        return render_tile(view['position'], view['direction'], view['fov'], width, height, self.scene, self.depth, tile=tile,
+                           seed=seed, aperture_radius=view.get('aperture_radius', 0.0), focus_distance=view.get('focus_distance', 1.0),
+                           gbuffer_cache=self.gbuffer_cache, irradiance_cache=self.irradiance_cache if self.scene.irradiance_caching else None,
+                           pixels=pixels)
+
+    def render_preview(self, generation, view):
+        """Renders every scale-th pixel of a view within the frame budget and sends it upsampled as a single tile."""
+        start_time = time.perf_counter()
+        scale = self.preview_scale()
+        pixels = pyramid_pixels(self.image_width, self.image_height, scale)
+        buffers = self.render_view(view, None, self.image_width, self.image_height, 0, pixels)
+        color, normal, depth = self.preview_buffers()
+        for name, image in (('color', color), ('normal', normal), ('depth', depth)):
+            image.reshape(-1, *image.shape[2:])[pixels] = buffers[name]
+        color = upsample_edge_aware(color, normal, depth, scale)
+        elapsed = time.perf_counter() - start_time
+        self.measure(elapsed, len(pixels))
+        if not self.cancelled(generation):
+            self.tile_finished.emit(generation, (0, 0, self.image_width, self.image_height), color)
+            self.frame_finished.emit(generation, 1, elapsed)
+
+    def preview_buffers(self):
+        """Allocates full-resolution color, normal and depth images for pyramid levels to be scattered into."""
+        return (np.zeros((self.image_height, self.image_width, 3)), np.zeros((self.image_height, self.image_width, 3)),
+                np.zeros((self.image_height, self.image_width)))
+
+    def render_progressive(self, generation, view):
+        """Refines a view at full resolution, sending the image and the progress as it improves until cancelled.
+
+        The first pass walks the preview pyramid of PYRAMID_STRIDES and sends the image upsampled after every level.
+        The levels render disjoint pixels with the samples of the full-resolution pass, so after the last level the
+        first pass is complete without a wasted sample. Later passes are sent tile by tile.
+        """
+        accumulation, normal, depth = self.preview_buffers()
+        tiles = split_tiles(self.image_width, self.image_height, self.tile_size)
+
+        # Split every level into batches of about one tile of pixels, so sparse levels do not pay per-tile overhead
+        levels = []
+        for stride, coarser_stride in zip(PYRAMID_STRIDES, (None,) + PYRAMID_STRIDES[:-1]):
+            pixels = pyramid_pixels(self.image_width, self.image_height, stride, coarser_stride)
+            levels.append((stride, np.array_split(pixels, max(1, -(-len(pixels) // self.tile_size**2)))))
+        units = {(0, stride, batch): len(pixels) for stride, batches in levels for batch, pixels in enumerate(batches)}
+        units.update({(sample, 1, tile): (tile[2] - tile[0]) * (tile[3] - tile[1]) for sample in range(1, self.max_samples) for tile in tiles})
+        progress = RenderProgress(units, {unit: pixel_count * (self.pixel_cost or 1e-6) for unit, pixel_count in units.items()})
+        progress.start()
+
+        # Render the first pass level by level, scattering the new pixels into the image
+        start_time = time.perf_counter()
+        for stride, batches in levels:
+            for batch, pixels in enumerate(batches):
+                if self.cancelled(generation):
+                    return
+                tile_start_time = time.perf_counter()
+                buffers = self.render_view(view, None, self.image_width, self.image_height, 0, pixels)
+                for name, image in (('color', accumulation), ('normal', normal), ('depth', depth)):
+                    image.reshape(-1, *image.shape[2:])[pixels] = buffers[name]
+                tile_time = time.perf_counter() - tile_start_time
+                self.measure(tile_time, len(pixels))
+                progress.update_progress((0, stride, batch), tile_time)
+            self.tile_finished.emit(generation, (0, 0, self.image_width, self.image_height), upsample_edge_aware(accumulation, normal, depth, stride))
+            self.progress_changed.emit(generation, progress.snapshot())
+        self.frame_finished.emit(generation, 1, time.perf_counter() - start_time)
+
+        for sample in range(1, self.max_samples):
+            start_time = time.perf_counter()
+            for x0, y0, x1, y1 in tiles:
+                if self.cancelled(generation):
+                    return
+                tile_start_time = time.perf_counter()
+                color = self.render_view(view, (x0, y0, x1, y1), self.image_width, self.image_height, sample)['color']
+                tile_time = time.perf_counter() - tile_start_time
+                self.measure(tile_time, (x1 - x0) * (y1 - y0))
+                progress.update_progress((sample, 1, (x0, y0, x1, y1)), tile_time)
+
+                # Average the pass into the accumulated image
+                accumulation[y0:y1, x0:x1] += (color - accumulation[y0:y1, x0:x1]) / (sample + 1)
+                self.tile_finished.emit(generation, (x0, y0, x1, y1), accumulation[y0:y1, x0:x1].copy())
+            self.frame_finished.emit(generation, sample + 1, time.perf_counter() - start_time)
+            self.progress_changed.emit(generation, progress.snapshot())
+
+    def run(self):
+        """Waits for views and renders them until stopped."""
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                generation, view, moving = self.pending
+                self.pending = None
+            if moving:
+                self.render_preview(generation, view)
+            else:
+                self.render_progressive(generation, view)
+
+class RenderWindow(QMainWindow):
+    """Shows an interactive render of a scene that stays responsive while the camera moves.
+
+    Camera edits are sent to the worker as fast previews, and the full-quality progressive render starts once the
+    camera has rested for SETTLE_TIME milliseconds. WASD moves the camera and QE moves it up and down.
+    """
+
+    SETTLE_TIME = 200
+    MOVE_STEP = 0.25
+
+    def __init__(self, scene, image_width=640, image_height=480, depth=3, frame_budget=1 / 15, max_samples=64,
+                 texture_cache_bytes=256 * 2**20):
+        """Creates the window and starts rendering the scene camera.
+
+        Args:
+            scene (Scene): The compiled scene.
+            image_width (int): The width of the image in pixels.
+            image_height (int): The height of the image in pixels.
+            depth (int): The maximum number of bounces.
+            frame_budget (float): The time in seconds a preview frame may take while the camera moves.
+            max_samples (int): The number of samples per pixel of the resting render.
+            texture_cache_bytes (int): The memory budget of the decoded texture tiles of this process.
+        """
+        super().__init__()
+        configure_tile_cache(texture_cache_bytes)
+        self.image = np.zeros((image_height, image_width, 3), dtype=np.uint8)
+        self.samples = 0
+        self.remaining = None
+        self.label = QLabel()
+        self.label.setAlignment(Qt.AlignCenter)
+        self.setCentralWidget(self.label)
+        self.camera = {'position': [0, 0, 5], 'direction': [0, 0, -1], 'fov': np.pi / 3}
+        self.camera.update(scene.camera)
+
+        # Start the render thread
+        self.worker = RenderWorker(scene, image_width, image_height, depth, max_samples=max_samples, frame_budget=frame_budget)
+        self.worker.tile_finished.connect(self.show_tile)
+        self.worker.frame_finished.connect(self.show_frame)
+        self.worker.progress_changed.connect(self.show_progress)
+        self.worker.start()
+
+        # Start the full-quality render once the camera rests
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.timeout.connect(lambda: self.worker.submit(self.camera))
+        self.worker.submit(self.camera)
+
+    def set_camera(self, **changes):
+        """Updates the camera, showing previews until it rests.
+
+        Args:
+            **changes: New values for the camera 'position', 'direction', 'fov', 'aperture_radius' or 'focus_distance'.
+        """
+        self.camera.update(changes)
+        self.worker.submit(self.camera, moving=True)
+        self.settle_timer.start(self.SETTLE_TIME)
+
+    def set_scene(self, scene):
+        """Replaces the scene after an edit, showing previews until the edits stop."""
+        self.worker.set_scene(scene, moving=True)
+        self.settle_timer.start(self.SETTLE_TIME)
+
+    def show_tile(self, generation, tile, color):
+        """Copies a finished tile of the current view into the displayed image."""
+        if generation != self.worker.generation:
+            return
+        x0, y0, x1, y1 = tile
+        self.image[y0:y1, x0:x1] = display_pixels(color)
+        height, width = self.image.shape[:2]
+        self.label.setPixmap(QPixmap.fromImage(QImage(self.image.data, width, height, 3 * width, QImage.Format_RGB888)))
+
+    def show_frame(self, generation, samples, seconds):
+        """Shows the sample count and frame time of the current view in the title bar."""
+        if generation == self.worker.generation:
+            self.samples = samples
+            self.setWindowTitle(f'PythTracer - {samples} spp - {seconds * 1000:.0f} ms')
+
+    def show_progress(self, generation, snapshot):
+        """Adds the remaining time of the progressive render of the current view to the title bar."""
+        if generation == self.worker.generation:
+            self.remaining = snapshot['eta']
+            if snapshot['fraction'] < 1:
+                self.setWindowTitle(f"{self.windowTitle()} - {snapshot['fraction'] * 100:.0f}% - {snapshot['eta']:.1f} s left")
+
+    def keyPressEvent(self, event):
+        """Moves the camera along its own axes with the WASD and QE keys."""
+        forward = np.asarray(self.camera['direction'], dtype=np.float64)
+        forward = forward / np.linalg.norm(forward)
+        right = np.cross(forward, [0, 1, 0])
+        right = right / np.linalg.norm(right)
+        moves = {Qt.Key_W: forward, Qt.Key_S: -forward, Qt.Key_D: right, Qt.Key_A: -right,
+                 Qt.Key_E: np.array([0, 1, 0]), Qt.Key_Q: np.array([0, -1, 0])}
+        if event.key() in moves:
+            self.set_camera(position=(np.asarray(self.camera['position'], dtype=np.float64) + moves[event.key()] * self.MOVE_STEP).tolist())
+        else:
+            super().keyPressEvent(event)
+
+    def closeEvent(self, event):
+        """Stops the render thread before the window closes."""
+        self.settle_timer.stop()
+        self.worker.stop()
+        super().closeEvent(event)
@@ -1,6 +1,8 @@
 # Gamma Correction
+import time
 import cv2
 import numpy as np
+from multiprocessing.pool import ThreadPool
 
 def gamma_correction(image, gamma):
     """Applies gamma correction to the image.
@@ -62,4 +64,131 @@ def film_grain(image, amount):
         np.array: The grainy image.
     """
     grain = np.random.randint(0, 255, size=image.shape).astype("uint8")
-    return cv2.addWeighted(image, 1.0, grain, amount, 0.0)
\ No newline at end of file
+    return cv2.addWeighted(image, 1.0, grain, amount, 0.0)
+
+# Denoising
+
+ATROUS_KERNEL = np.array([1 / 16, 1 / 4, 3 / 8, 1 / 4, 1 / 16])
+
+def atrous_filter_tile(irradiance, variance, normal, depth, depth_gradient, step, tile, sigma_color, sigma_normal, sigma_depth):
+    """Applies one edge-avoiding a-trous wavelet iteration to a tile.
+
+    The inputs are padded by twice the step, so the tile is read from padded coordinates and all 25 kernel taps
+    are evaluated as whole-tile array operations.
+
+    Args:
+        irradiance (np.array): The padded (H, W, 3) albedo-demodulated color.
+        variance (np.array): The padded (H, W) luminance variance.
+        normal (np.array): The padded (H, W, 3) first-hit normals.
+        depth (np.array): The padded (H, W) first-hit depths.
+        depth_gradient (np.array): The padded (H, W) depth gradient magnitudes.
+        step (int): The spacing between the kernel taps.
+        tile (tuple): The (x0, y0, x1, y1) bounds of the tile in unpadded pixel coordinates.
+        sigma_color (float): The luminance edge-stopping strength in standard deviations.
+        sigma_normal (float): The exponent of the normal edge-stopping weight.
+        sigma_depth (float): The depth edge-stopping strength.
+
+    Returns:
+        tuple: The filtered (h, w, 3) irradiance and (h, w) variance of the tile.
+    """
+    x0, y0, x1, y1 = tile
+    pad = 2 * step
+    center = (slice(y0 + pad, y1 + pad), slice(x0 + pad, x1 + pad))
+    luminance = irradiance @ np.array([0.2126, 0.7152, 0.0722])
+    center_luminance = luminance[center]
+    center_deviation = np.sqrt(np.maximum(variance[center], 0)) * sigma_color + 1e-6
+
+    total_weight = np.zeros(center_luminance.shape)
+    filtered = np.zeros(center_luminance.shape + (3,))
+    filtered_variance = np.zeros(center_luminance.shape)
+    for i, kernel_y in enumerate(ATROUS_KERNEL):
+        for j, kernel_x in enumerate(ATROUS_KERNEL):
+            # Read the tap shifted by the step
+            dy, dx = (i - 2) * step, (j - 2) * step
+            tap = (slice(y0 + pad + dy, y1 + pad + dy), slice(x0 + pad + dx, x1 + pad + dx))
+
+            # Combine the kernel weight with the luminance, normal and depth edge-stopping weights
+            weight_color = np.exp(-np.abs(center_luminance - luminance[tap]) / center_deviation)
+            normal_cosine = np.einsum('ijk,ijk->ij', normal[center], normal[tap])
+            background = ~normal[center].any(axis=2) & ~normal[tap].any(axis=2)
+            weight_normal = np.where(background, 1, np.maximum(0, normal_cosine)**sigma_normal)
+            distance = np.hypot(dx, dy)
+            weight_depth = np.exp(-np.abs(depth[center] - depth[tap]) / (sigma_depth * depth_gradient[center] * distance + 1e-6))
+            weight = kernel_y * kernel_x * weight_color * weight_normal * weight_depth
+
+            total_weight += weight
+            filtered += weight[..., None] * irradiance[tap]
+            filtered_variance += weight**2 * variance[tap]
+
+    return filtered / total_weight[..., None], filtered_variance / total_weight**2
+
+def denoise_image(color, normal, albedo, depth, variance=None, iterations=5, sigma_color=4.0, sigma_normal=128.0, sigma_depth=1.0, tile_size=64, processes=None, stats=None):
+    """Denoises a rendered image with an edge-avoiding a-trous wavelet filter guided by feature buffers.
+
+    The color is divided by the albedo so texture detail is preserved, filtered with a kernel that doubles its
+    spacing every iteration and stops at luminance, normal and depth edges, and multiplied by the albedo again.
+    Each iteration is split into tiles that are filtered in parallel.
+
+    Args:
+        color (np.array): The (H, W, 3) noisy linear color.
+        normal (np.array): The (H, W, 3) first-hit normals.
+        albedo (np.array): The (H, W, 3) first-hit albedo.
+        depth (np.array): The (H, W) first-hit depths.
+        variance (np.array): The (H, W) luminance variance of the color, such as the 'variance' buffer of
+            core.render_tile. Estimated from the 3x3 neighborhood of each pixel if not given or all zero, as it is
+            for renders with one sample per pixel.
+        iterations (int): The number of wavelet iterations.
+        sigma_color (float): The luminance edge-stopping strength in standard deviations.
+        sigma_normal (float): The exponent of the normal edge-stopping weight.
+        sigma_depth (float): The depth edge-stopping strength.
+        tile_size (int): The edge length of the tiles filtered in parallel.
+        processes (int): The number of worker threads. Defaults to the number of CPUs.
+        stats (dict): An optional dictionary that receives the time spent denoising as 'denoise_time'.
+
+    Returns:
+        np.array: The (H, W, 3) denoised color.
+    """
+    start_time = time.perf_counter()
+    height, width = color.shape[:2]
+
+    # Renormalize the sample-averaged normals, so every pixel fully accepts itself
+    length = np.linalg.norm(normal, axis=2, keepdims=True)
+    normal = np.where(length > 0, normal / np.where(length > 0, length, 1), 0)
+
+    # Demodulate the albedo
+    albedo = np.maximum(albedo, 1e-3)
+    irradiance = color / albedo
+
+    # Scale the variance of the color to the demodulated color, or estimate it spatially when the renderer did not
+    # provide it
+    if variance is not None and np.any(variance > 0):
+        variance = variance / np.maximum(albedo @ np.array([0.2126, 0.7152, 0.0722]), 1e-3)**2
+    else:
+        luminance = np.pad(irradiance @ np.array([0.2126, 0.7152, 0.0722]), 1, mode='edge')
+        window = np.lib.stride_tricks.sliding_window_view(luminance, (3, 3))
+        variance = window.var(axis=(-2, -1))
+
+    depth_gradient = np.hypot(*np.gradient(depth))
+    tiles = [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+             for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+    with ThreadPool(processes) as pool:
+        for iteration in range(iterations):
+            # Pad the buffers by the kernel radius of this iteration
+            step = 2**iteration
+            pad = 2 * step
+            padded = [np.pad(buffer, ((pad, pad), (pad, pad)) + ((0, 0),) * (buffer.ndim - 2), mode='edge')
+                      for buffer in (irradiance, variance, normal, depth, depth_gradient)]
+
+            # Filter the tiles in parallel into fresh buffers
+            results = pool.starmap(atrous_filter_tile, [(*padded, step, tile, sigma_color, sigma_normal, sigma_depth) for tile in tiles])
+            irradiance, variance = np.empty_like(irradiance), np.empty_like(variance)
+            for (x0, y0, x1, y1), (tile_irradiance, tile_variance) in zip(tiles, results):
+                irradiance[y0:y1, x0:x1] = tile_irradiance
+                variance[y0:y1, x0:x1] = tile_variance
+
+    # Remodulate the albedo
+    denoised = irradiance * albedo
+    if stats is not None:
+        stats['denoise_time'] = time.perf_counter() - start_time
+    return denoised
@@ -0,0 +1,188 @@
+# Irradiance Cache
+
+import numpy as np
+
+GRID_BITS = 21
+GRID_OFFSET = 2**(GRID_BITS - 1)
+
+def grid_keys(cells):
+    """Packs integer grid cell coordinates into single int64 keys.
+
+    Args:
+        cells (np.array): An (N, 3) array of integer cell coordinates within +-2**20.
+
+    Returns:
+        np.array: An (N,) array of int64 keys.
+    """
+    cells = (np.asarray(cells, dtype=np.int64) + GRID_OFFSET) & (2**GRID_BITS - 1)
+    return (cells[:, 0] << (2 * GRID_BITS)) | (cells[:, 1] << GRID_BITS) | cells[:, 2]
+
+class IrradianceCache:
+    """Sparse world-space irradiance records that are interpolated across smooth diffuse lighting.
+
+    Every record stores the indirect irradiance at a surface point together with the harmonic mean distance R to
+    the surfaces it sees. Following Ward, a record contributes to a point x with normal n with the weight
+    1 / (|x - x_i| / R_i + sqrt(1 - n . n_i)), and only when that error estimate stays below `error` and the record
+    does not lie in front of x. A record only serves lookups for paths with the same number of remaining bounces
+    as the paths it was estimated for, so cached renders keep the depth of uncached ones. Records are indexed in a hash grid whose cells are as large as the largest record
+    influence, so a lookup only visits the cell of the query point. The cache keeps its records across progressive
+    passes and camera moves and is cleared when the scene content changes.
+
+    Args:
+        error (float): The largest accepted interpolation error, between about 0.1 (accurate) and 0.4 (fast).
+        min_spacing (float): The smallest record radius R. Defaults to 1% of the scene bounds diagonal.
+        max_spacing (float): The largest record radius R. Defaults to 10% of the scene bounds diagonal.
+        ray_count (int): The number of hemisphere rays traced for a new record, rounded down to a square.
+        max_passes (int): The number of lazy fill passes per lookup. The last pass adds a record at every point
+            that is still uncovered.
+    """
+
+    def __init__(self, error=0.25, min_spacing=None, max_spacing=None, ray_count=64, max_passes=3):
+        self.error = error
+        self.requested_spacing = (min_spacing, max_spacing)
+        self.min_spacing = min_spacing
+        self.max_spacing = max_spacing
+        self.ray_count = ray_count
+        self.max_passes = max_passes
+        self.scene_hash = None
+        self.clear()
+
+    @property
+    def count(self):
+        """int: The number of records."""
+        return len(self.radii)
+
+    @property
+    def cell_size(self):
+        """float: The edge length of the grid cells, the largest distance at which a record is used."""
+        return self.error * self.max_spacing
+
+    def clear(self):
+        """Drops every record."""
+        self.positions = np.zeros((0, 3))
+        self.normals = np.zeros((0, 3))
+        self.irradiance = np.zeros((0, 3))
+        self.radii = np.zeros(0)
+        self.depths = np.zeros(0, dtype=np.int64)
+        self.cell_keys = np.zeros(0, dtype=np.int64)
+        self.cell_records = np.zeros(0, dtype=np.int64)
+
+    def use_scene(self, scene):
+        """Prepares the cache for a scene, clearing the records and picking the record spacing if the scene content
+        changed.
+
+        Args:
+            scene (Scene): The compiled scene.
+        """
+        if scene.content_hash == self.scene_hash:
+            return
+        self.clear()
+        self.scene_hash = scene.content_hash
+
+        # Scale the record spacing that was not given explicitly with the scene bounds
+        bounds = scene.bounds
+        diagonal = np.linalg.norm(bounds[1] - bounds[0]) or 1.0
+        min_spacing, max_spacing = self.requested_spacing
+        self.min_spacing = min_spacing or 0.01 * diagonal
+        self.max_spacing = max_spacing or 0.1 * diagonal
+
+    def insert(self, positions, normals, irradiance, radii, depths):
+        """Adds records and indexes them in every grid cell their influence reaches.
+
+        Args:
+            positions (np.array): An (N, 3) array of record positions.
+            normals (np.array): An (N, 3) array of unit record normals.
+            irradiance (np.array): An (N, 3) array of indirect irradiance.
+            radii (np.array): An (N,) array of harmonic mean distances, clamped to the record spacing.
+            depths (int or np.array): The remaining bounces the irradiance was estimated with, per record or for all.
+        """
+        first = self.count
+        radii = np.clip(radii, self.min_spacing, self.max_spacing)
+        self.positions = np.concatenate((self.positions, positions))
+        self.normals = np.concatenate((self.normals, normals))
+        self.irradiance = np.concatenate((self.irradiance, irradiance))
+        self.radii = np.concatenate((self.radii, radii))
+        self.depths = np.concatenate((self.depths, np.broadcast_to(depths, len(radii)).astype(np.int64)))
+
+        # The influence of a record is never larger than a cell, so it overlaps at most two cells per axis
+        influence = (self.error * radii)[:, None]
+        low = np.floor((positions - influence) / self.cell_size).astype(np.int64)
+        high = np.floor((positions + influence) / self.cell_size).astype(np.int64)
+        keys, records = [self.cell_keys], [self.cell_records]
+        for offset in np.array(np.meshgrid([0, 1], [0, 1], [0, 1])).reshape(3, -1).T:
+            cells = low + offset
+            inside = np.all(cells <= high, axis=1)
+            keys.append(grid_keys(cells[inside]))
+            records.append(first + np.flatnonzero(inside))
+
+        # Keep the cell entries sorted by key for binary search
+        keys, records = np.concatenate(keys), np.concatenate(records)
+        order = np.argsort(keys, kind='stable')
+        self.cell_keys, self.cell_records = keys[order], records[order]
+
+    def lookup(self, points, normals, depth):
+        """Interpolates the irradiance at surface points from the records that are valid there.
+
+        Args:
+            points (np.array): An (N, 3) array of surface points.
+            normals (np.array): An (N, 3) array of unit surface normals.
+            depth (int): The remaining bounces of the paths arriving at the points. Only records estimated with
+                the same depth are used.
+
+        Returns:
+            tuple: An (N, 3) array of interpolated irradiance and an (N,) boolean array of the points that were
+            covered by at least one record.
+        """
+        count = len(points)
+        if not self.count or not count:
+            return np.zeros((count, 3)), np.zeros(count, dtype=bool)
+
+        # Gather the records of the cell of every point
+        keys = grid_keys(np.floor(points / self.cell_size))
+        start = np.searchsorted(self.cell_keys, keys, 'left')
+        candidates = np.searchsorted(self.cell_keys, keys, 'right') - start
+        queries = np.repeat(np.arange(count), candidates)
+        entries = start[queries] + np.arange(len(queries)) - np.repeat(np.cumsum(candidates) - candidates, candidates)
+        records = self.cell_records[entries]
+
+        # Calculate Ward's error estimate and reject records in front of the points
+        offsets = points[queries] - self.positions[records]
+        cosine = np.einsum('ij,ij->i', normals[queries], self.normals[records])
+        error = np.linalg.norm(offsets, axis=1) / self.radii[records] + np.sqrt(np.maximum(0, 1 - cosine))
+        in_front = np.einsum('ij,ij->i', offsets, normals[queries] + self.normals[records]) < -0.1 * self.radii[records]
+        valid = (error < self.error) & ~in_front & (self.depths[records] == depth)
+        weights = 1 / np.maximum(error[valid], 1e-6)
+
+        # Blend the valid records
+        queries, records = queries[valid], records[valid]
+        # bincount returns integers for empty weights, so cast in case no record is valid
+        total = np.bincount(queries, weights, count).astype(np.float64)
+        irradiance = np.column_stack([np.bincount(queries, weights * self.irradiance[records, channel], count) for channel in range(3)]).astype(np.float64)
+        covered = total > 0
+        irradiance[covered] /= total[covered, None]
+        return irradiance, covered
+
+    def spread(self, points):
+        """Picks a subset of points spaced about one smallest record influence apart to place new records at.
+
+        Args:
+            points (np.array): An (N, 3) array of uncovered points.
+
+        Returns:
+            np.array: The indices of the chosen points.
+        """
+        keys = grid_keys(np.floor(points / (self.error * self.min_spacing * 4)))
+        return np.sort(np.unique(keys, return_index=True)[1])
+
+    def save(self, path):
+        """Writes the records to an .npz file."""
+        np.savez(path, positions=self.positions, normals=self.normals, irradiance=self.irradiance, radii=self.radii, depths=self.depths,
+                 settings=np.array([self.error, self.min_spacing, self.max_spacing]), scene_hash=np.array(self.scene_hash or ''))
+
+    def load(self, path):
+        """Replaces the records with the ones of an .npz file written by save."""
+        with np.load(path) as data:
+            self.clear()
+            self.error, self.min_spacing, self.max_spacing = data['settings'].tolist()
+            self.scene_hash = str(data['scene_hash']) or None
+            self.insert(data['positions'], data['normals'], data['irradiance'], data['radii'], data['depths'])
@@ -0,0 +1,309 @@
+# Render Jobs
+
+import functools
+import heapq
+import itertools
+import multiprocessing
+import threading
+import time
+import numpy as np
+from core import render_tile, split_tiles
+from irradiance import IrradianceCache
+from progress import RenderProgress
+from scene import SceneCache
+from texture import configure_tile_cache
+
+JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_CANCELLED, JOB_FAILED = 'queued', 'running', 'done', 'cancelled', 'failed'
+
+# Worker Processes
+
+_scene_cache = None
+_irradiance_cache = None
+
+def initialize_worker(cache_bytes, texture_cache_bytes):
+    """Creates the scene cache and the irradiance cache of a long-lived worker process and sets its texture budget.
+
+    Args:
+        cache_bytes (int): The memory budget of the worker's scene cache.
+        texture_cache_bytes (int): The memory budget of the worker's decoded texture tiles.
+    """
+    global _scene_cache, _irradiance_cache
+    _scene_cache = SceneCache(cache_bytes)
+    _irradiance_cache = IrradianceCache()
+    configure_tile_cache(texture_cache_bytes)
+
+def render_job_tile(scene_path, settings, tile):
+    """Renders one tile of a job inside a worker process, reusing the worker's cached scene.
+
+    Args:
+        scene_path (str): The path of the scene description or bundle.
+        settings (dict): The render settings of the job, see RenderJob.
+        tile (tuple): The (x0, y0, x1, y1) pixel bounds of the tile.
+
+    Returns:
+        tuple: The (H, W, 3) float32 colors of the tile and the seconds it took to render.
+    """
+    start_time = time.perf_counter()
+    scene = _scene_cache.get(scene_path)
+    camera = dict(scene.camera, **settings['camera'])
+    depth = scene.max_depth if settings['depth'] is None else settings['depth']
+    buffers = render_tile(camera['position'], camera['direction'], camera['fov'], settings['image_width'], settings['image_height'],
+                          scene, depth, tile=tile, samples_per_pixel=settings['samples_per_pixel'],
+                          seed=settings['seed'], sampler=settings['sampler'], aperture_radius=camera.get('aperture_radius', 0.0),
+                          focus_distance=camera.get('focus_distance', 1.0),
+                          irradiance_cache=_irradiance_cache if scene.irradiance_caching else None)
+    return buffers['color'].astype(np.float32), time.perf_counter() - start_time
+
+# Job Manager
+
+class RenderJob:
+    """A render request tracked by the JobManager.
+
+    Args:
+        job_id (int): The id of the job.
+        priority (int): Jobs with a higher priority are started and fed tiles first.
+        scene_path (str): The path of the scene description or bundle.
+        settings (dict): The 'camera' overrides, 'image_width', 'image_height', 'samples_per_pixel', 'depth', 'seed'
+            and 'sampler' of the render.
+        tiles (list): The (x0, y0, x1, y1) bounds of the tiles to render.
+        predicted_seconds (dict): The predicted time per tile from progress.estimate_render, which weights the
+            progress and the first time estimate.
+        processes (int): The number of worker processes rendering the tiles, which divides the first time estimate.
+    """
+
+    def __init__(self, job_id, priority, scene_path, settings, tiles, predicted_seconds=None, processes=1):
+        self.job_id = job_id
+        self.priority = priority
+        self.scene_path = scene_path
+        self.settings = settings
+        self.tiles = tiles
+        self.progress = RenderProgress(tiles, predicted_seconds, processes)
+        self.in_flight = 0
+        self.state = JOB_QUEUED
+        self.error = None
+        self.image = np.zeros((settings['image_height'], settings['image_width'], 3), dtype=np.float32)
+        self.finished = threading.Event()
+        self.tile_listeners = []
+        self.end_listeners = []
+
+    def add_tile_listener(self, listener):
+        """Registers a callable that receives the bounds and (H, W, 3) float32 colors of every finished tile."""
+        self.tile_listeners.append(listener)
+
+    def add_end_listener(self, listener):
+        """Registers a callable that receives the final state of the job. It is called with the manager's lock held
+        and must not block."""
+        self.end_listeners.append(listener)
+
+    def wait(self, timeout=None):
+        """Waits for the job to end.
+
+        Args:
+            timeout (float): The longest time to wait in seconds. Defaults to waiting forever.
+
+        Returns:
+            np.array: The (H, W, 3) rendered image.
+
+        Raises:
+            TimeoutError: If the job is still running after the timeout.
+            RuntimeError: If the job was cancelled or failed.
+        """
+        if not self.finished.wait(timeout):
+            raise TimeoutError(f'Render job {self.job_id} is still {self.state}')
+        if self.state != JOB_DONE:
+            raise RuntimeError(f'Render job {self.job_id} {self.state}') from self.error
+        return self.image
+
+class JobManager:
+    """Runs render jobs on a pool of long-lived worker processes.
+
+    Jobs wait in a priority queue and at most `max_running_jobs` of them are rendered at a time. Running jobs are
+    split into tiles, and the dispatcher keeps the pool busy with the tiles of the highest priority jobs. The
+    workers outlive the jobs and keep their loaded scenes in a SceneCache, so consecutive jobs on the same scene
+    skip process startup, scene transfer and the BVH build. Only scene paths and tile bounds cross the process
+    boundary. Workers are spawned rather than forked, since a fork of a process whose Numba thread pool has already
+    run deadlocks in the child.
+
+    Args:
+        processes (int): The number of worker processes. Defaults to the CPU count.
+        max_running_jobs (int): The number of jobs rendered concurrently.
+        cache_bytes (int): The memory budget of every worker's scene cache.
+        tile_size (int): The edge length of the tiles in pixels.
+        texture_cache_bytes (int): The memory budget of every worker's decoded texture tiles.
+    """
+
+    def __init__(self, processes=None, max_running_jobs=2, cache_bytes=512 * 2**20, tile_size=64, texture_cache_bytes=256 * 2**20):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_running_jobs = max_running_jobs
+        self.tile_size = tile_size
+        self.pool = multiprocessing.get_context('spawn').Pool(self.processes, initializer=initialize_worker,
+                                                              initargs=(cache_bytes, texture_cache_bytes))
+        self.queue = []
+        self.running_jobs = []
+        self.jobs = {}
+        self.job_ids = itertools.count()
+        self.in_flight = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, scene_path, image_width, image_height, camera=None, samples_per_pixel=1, depth=None, seed=0, sampler='sobol',
+               priority=0, estimate=None):
+        """Queues a render job.
+
+        Args:
+            scene_path (str): The path of the scene description or bundle.
+            image_width (int): The width of the image in pixels.
+            image_height (int): The height of the image in pixels.
+            camera (dict): Overrides of the scene camera 'position', 'direction', 'fov', 'aperture_radius' and
+                'focus_distance'.
+            samples_per_pixel (int): The number of samples per pixel.
+            depth (int): The maximum number of bounces. Defaults to the scene setting.
+            seed (int): The sampler seed.
+            sampler (str): 'random', 'stratified', 'halton' or 'sobol'.
+            priority (int): Jobs with a higher priority run first.
+            estimate (dict): A progress.estimate_render result made with the manager's tile size, whose tile times
+                weight the job progress.
+
+        Returns:
+            RenderJob: The queued job.
+        """
+        settings = {'camera': dict(camera or {}), 'image_width': image_width, 'image_height': image_height,
+                    'samples_per_pixel': samples_per_pixel, 'depth': depth, 'seed': seed, 'sampler': sampler}
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Cannot submit jobs to a closed JobManager')
+            job = RenderJob(next(self.job_ids), priority, scene_path, settings, split_tiles(image_width, image_height, self.tile_size),
+                            estimate and estimate['tile_seconds'], self.processes)
+            self.jobs[job.job_id] = job
+            heapq.heappush(self.queue, (-priority, job.job_id, job))
+            self.condition.notify_all()
+        return job
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job. Tiles already in flight finish in the workers and are discarded.
+
+        Args:
+            job_id (int): The id of the job.
+
+        Returns:
+            bool: Whether the job was still queued or running.
+        """
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.state not in (JOB_QUEUED, JOB_RUNNING):
+                return False
+            self.end_job(job, JOB_CANCELLED)
+            return True
+
+    def end_job(self, job, state, error=None):
+        """Marks a job as ended and frees its slot. Must be called with the condition held."""
+        job.state = state
+        job.error = error
+        job.tiles = []
+        if job in self.running_jobs:
+            self.running_jobs.remove(job)
+        self.jobs.pop(job.job_id, None)
+        job.finished.set()
+        for listener in list(job.end_listeners):
+            listener(state)
+        self.condition.notify_all()
+
+    def next_tile(self):
+        """Starts queued jobs while slots are free and picks the next tile of the highest priority running job.
+
+        Returns:
+            tuple: The job and the tile bounds, or None if no tile is waiting. Must be called with the condition held.
+        """
+        while len(self.running_jobs) < self.max_running_jobs and self.queue:
+            job = heapq.heappop(self.queue)[2]
+            if job.state == JOB_QUEUED:
+                job.state = JOB_RUNNING
+                job.progress.start()
+                self.running_jobs.append(job)
+                if not job.tiles:
+                    self.end_job(job, JOB_DONE)
+        for job in sorted(self.running_jobs, key=lambda job: (-job.priority, job.job_id)):
+            if job.tiles:
+                return job, job.tiles.pop(0)
+        return None
+
+    def dispatch(self):
+        """Feeds tiles to the pool, keeping two tiles per worker in flight so no worker idles between tiles."""
+        while True:
+            with self.condition:
+                while not self.closed and (self.in_flight >= 2 * self.processes or not self.has_waiting_tiles()):
+                    self.condition.wait()
+                if self.closed:
+                    return
+
+                # Wait again when the waiting tiles vanished, such as for a started job without tiles
+                picked = self.next_tile()
+                if picked is None:
+                    continue
+                job, tile = picked
+                job.in_flight += 1
+                self.in_flight += 1
+            self.pool.apply_async(render_job_tile, (job.scene_path, job.settings, tile),
+                                  callback=functools.partial(self.finish_tile, job, tile),
+                                  error_callback=functools.partial(self.fail_tile, job))
+
+    def has_waiting_tiles(self):
+        """Checks whether a running or startable job has tiles left. Must be called with the condition held."""
+        startable = len(self.running_jobs) < self.max_running_jobs and any(entry[2].state == JOB_QUEUED for entry in self.queue)
+        return startable or any(job.tiles for job in self.running_jobs)
+
+    def finish_tile(self, job, tile, result):
+        """Copies a rendered tile into its job, reports its progress and completes the job after its last tile."""
+        color, seconds = result
+        with self.condition:
+            job.in_flight -= 1
+            self.in_flight -= 1
+            running = job.state == JOB_RUNNING
+            if running:
+                # Record the tile and pick its listeners in one step, so a stream subscribing under the same lock
+                # either replays the tile or is called for it, never both or neither
+                x0, y0, x1, y1 = tile
+                job.image[y0:y1, x0:x1] = color
+                snapshot = job.progress.record_progress(tile, seconds)
+                tile_listeners = list(job.tile_listeners)
+
+        # Report the tile outside the lock, so listeners may call back into the manager
+        if running:
+            job.progress.notify(snapshot)
+            for listener in tile_listeners:
+                listener(tile, color)
+        with self.condition:
+            if running and job.state == JOB_RUNNING and not job.tiles and not job.in_flight:
+                self.end_job(job, JOB_DONE)
+            self.condition.notify_all()
+
+    def fail_tile(self, job, error):
+        """Fails the job of a tile that raised in a worker."""
+        with self.condition:
+            job.in_flight -= 1
+            self.in_flight -= 1
+            if job.state == JOB_RUNNING:
+                self.end_job(job, JOB_FAILED, error)
+            self.condition.notify_all()
+
+    def close(self):
+        """Cancels the remaining jobs and shuts the worker processes down."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            for job in list(self.jobs.values()):
+                self.end_job(job, JOB_CANCELLED)
+            self.queue = []
+            self.condition.notify_all()
+        self.dispatcher.join()
+        self.pool.terminate()
+        self.pool.join()
@@ -1,6 +1,7 @@
 # Point Light
 
 import numpy as np
+from core import sample_cosine_hemisphere
 from geometry import sphere_intersection, plane_intersection
 
 def generate_point_light_ray(light_position, intersection_point):
@@ -137,4 +138,158 @@ def generate_image_based_light_ray(light_image, intersection_point):
     pixel = light_image[x_coord, y_coord]
     # Construct the light ray
     light_ray = np.array([pixel[2], pixel[1], pixel[0]])
-    return light_ray
\ No newline at end of file
+    return light_ray
+
+
+# Light Table
+
+LIGHT_POINT, LIGHT_AREA, LIGHT_DIRECTIONAL, LIGHT_SPOT, LIGHT_ENVIRONMENT, LIGHT_IMAGE = range(6)
+LIGHT_TYPES = {'point': LIGHT_POINT, 'area': LIGHT_AREA, 'directional': LIGHT_DIRECTIONAL, 'spot': LIGHT_SPOT,
+               'environment': LIGHT_ENVIRONMENT, 'image': LIGHT_IMAGE}
+
+def light_parameters(light, textures=()):
+    """Packs the type-specific settings of a light into four parameters.
+
+    Spot lights store the cosines of their 'inner_angle' and 'outer_angle' in radians, area lights the width and
+    height of their rectangle 'size', and image lights the texture id of their latitude-longitude 'image' and
+    its 'rotation' around the vertical axis in radians. An explicit 'parameters' list is taken as it is.
+
+    Args:
+        light (dict): The light entry of the scene description.
+        textures (list): The texture paths of the scene, see scene.texture_files.
+
+    Returns:
+        list: The four parameters of the light.
+    """
+    if 'parameters' in light:
+        return list(light['parameters'])
+    if light['type'] == 'spot':
+        return [np.cos(light.get('inner_angle', 0.4)), np.cos(light.get('outer_angle', 0.5)), 0, 0]
+    if light['type'] == 'area':
+        return list(light.get('size', [1, 1])) + [0, 0]
+    if light['type'] == 'image':
+        return [textures.index(light['image']), light.get('rotation', 0.0), 0, 0]
+    return [0, 0, 0, 0]
+
+def compile_light_table(lights, textures=()):
+    """Packs the lights of a scene into a light table.
+
+    Args:
+        lights (list): The light entries of the scene description.
+        textures (list): The texture paths of the scene, which image lights refer to.
+
+    Returns:
+        dict: The light types, positions, unit directions, colors and the type-specific parameters of
+        light_parameters as packed arrays.
+    """
+    directions = np.array([light.get('direction', [0, 0, -1]) for light in lights], dtype=np.float64).reshape(-1, 3)
+    return {
+        'light_types': np.array([LIGHT_TYPES[light['type']] for light in lights], dtype=np.int32),
+        'light_positions': np.array([light.get('position', [0, 0, 0]) for light in lights], dtype=np.float32).reshape(-1, 3),
+        'light_directions': (directions / np.linalg.norm(directions, axis=1, keepdims=True)).astype(np.float32),
+        'light_colors': np.array([light.get('color', [1, 1, 1]) for light in lights], dtype=np.float32).reshape(-1, 3),
+        'light_parameters': np.array([light_parameters(light, textures) for light in lights], dtype=np.float32).reshape(-1, 4),
+    }
+
+class LightTable:
+    """The compiled lights of a scene, evaluated for whole batches of surface points at once.
+
+    Args:
+        arrays (dict): The scene arrays holding the light table of compile_light_table.
+        textures (list): The Texture objects of the scene, which image lights look up.
+    """
+
+    def __init__(self, arrays, textures=()):
+        self.types = np.asarray(arrays['light_types'])
+        self.positions = np.asarray(arrays['light_positions'], dtype=np.float64)
+        self.directions = np.asarray(arrays['light_directions'], dtype=np.float64)
+        self.colors = np.asarray(arrays['light_colors'], dtype=np.float64)
+        self.parameters = np.asarray(arrays['light_parameters'], dtype=np.float64)
+        self.textures = textures
+
+        # Span the rectangles of area lights with a frame around their directions
+        helper = np.where(np.abs(self.directions[:, :1]) > 0.9, np.array([0, 1, 0]), np.array([1, 0, 0]))
+        self.tangents = np.cross(helper, self.directions)
+        self.tangents /= np.maximum(np.linalg.norm(self.tangents, axis=1, keepdims=True), 1e-12)
+        self.bitangents = np.cross(self.directions, self.tangents)
+
+    def __len__(self):
+        return len(self.types)
+
+    @property
+    def sampled(self):
+        """bool: Whether any light needs random samples, as area, environment and image lights do."""
+        return bool(np.isin(self.types, (LIGHT_AREA, LIGHT_ENVIRONMENT, LIGHT_IMAGE)).any())
+
+    def evaluate_lights(self, hit_positions, normals, light_ids, samples=None):
+        """Samples the incident light of one light at each of a batch of surface points.
+
+        The irradiance a point receives from its light, if nothing occludes it, is
+        radiance * max(0, normal . direction) / pdf. Point, spot and directional lights are delta lights with a pdf
+        of one whose radiance already includes the inverse square falloff. Area lights are sampled uniformly
+        over their rectangle, and environment and image lights by cosine-weighted directions, with the pdf in solid
+        angle.
+
+        Args:
+            hit_positions (np.array): An (N, 3) array of surface points.
+            normals (np.array): An (N, 3) array of unit surface normals.
+            light_ids (np.array): An (N,) array of the light evaluated at each point.
+            samples (np.array): An (N, 2) array of uniform samples in [0, 1) for the sampled lights. Defaults to the
+                centers of the sample domains.
+
+        Returns:
+            dict: The unit 'direction' towards the light, the 'distance' to it (infinite for distant lights), the
+            incident 'radiance' and the 'pdf' of every point.
+        """
+        hit_positions, normals = np.asarray(hit_positions, dtype=np.float64), np.asarray(normals, dtype=np.float64)
+        light_ids = np.asarray(light_ids)
+        count = len(light_ids)
+        samples = np.full((count, 2), 0.5) if samples is None else np.asarray(samples, dtype=np.float64)
+        types = self.types[light_ids]
+        direction = np.zeros((count, 3))
+        distance = np.full(count, np.inf)
+        radiance = self.colors[light_ids].copy()
+        pdf = np.ones(count)
+
+        # Point and spot lights fall off with the squared distance, spot lights also towards the cone edge
+        local = np.flatnonzero((types == LIGHT_POINT) | (types == LIGHT_SPOT))
+        offsets = self.positions[light_ids[local]] - hit_positions[local]
+        distance[local] = np.linalg.norm(offsets, axis=1)
+        direction[local] = offsets / np.maximum(distance[local], 1e-12)[:, None]
+        radiance[local] /= (4 * np.pi * np.maximum(distance[local], 1e-12)**2)[:, None]
+        spot = local[types[local] == LIGHT_SPOT]
+        cosine = -np.einsum('ij,ij->i', direction[spot], self.directions[light_ids[spot]])
+        inner, outer = self.parameters[light_ids[spot], 0], self.parameters[light_ids[spot], 1]
+        cone = np.clip((cosine - outer) / np.maximum(inner - outer, 1e-6), 0, 1)
+        radiance[spot] *= (cone * cone * (3 - 2 * cone))[:, None]
+
+        # Directional lights arrive from a single direction without falloff
+        distant = np.flatnonzero(types == LIGHT_DIRECTIONAL)
+        direction[distant] = -self.directions[light_ids[distant]]
+
+        # Area lights are one-sided rectangles facing their direction, sampled uniformly by area
+        area = np.flatnonzero(types == LIGHT_AREA)
+        ids = light_ids[area]
+        width, height = self.parameters[ids, 0], self.parameters[ids, 1]
+        points = (self.positions[ids] + ((samples[area, 0] - 0.5) * width)[:, None] * self.tangents[ids] +
+                  ((samples[area, 1] - 0.5) * height)[:, None] * self.bitangents[ids])
+        offsets = points - hit_positions[area]
+        distance[area] = np.linalg.norm(offsets, axis=1)
+        direction[area] = offsets / np.maximum(distance[area], 1e-12)[:, None]
+        light_cosine = -np.einsum('ij,ij->i', direction[area], self.directions[ids])
+        facing = light_cosine > 0
+        pdf[area] = np.where(facing, distance[area]**2 / np.maximum(width * height * light_cosine, 1e-12), 1)
+        radiance[area] *= facing[:, None]
+
+        # Environment and image lights surround the scene and are sampled around the normals
+        surrounding = np.flatnonzero((types == LIGHT_ENVIRONMENT) | (types == LIGHT_IMAGE))
+        direction[surrounding] = sample_cosine_hemisphere(normals[surrounding], samples[surrounding, 0], samples[surrounding, 1])
+        pdf[surrounding] = np.maximum(np.einsum('ij,ij->i', direction[surrounding], normals[surrounding]), 1e-12) / np.pi
+        image = surrounding[types[surrounding] == LIGHT_IMAGE]
+        for texture_id in np.unique(self.parameters[light_ids[image], 0]).astype(int):
+            rows = image[self.parameters[light_ids[image], 0] == texture_id]
+            longitude = np.arctan2(direction[rows, 2], direction[rows, 0]) + self.parameters[light_ids[rows], 1]
+            uv = np.column_stack((0.5 + longitude / (2 * np.pi), 1 - np.arccos(np.clip(direction[rows, 1], -1, 1)) / np.pi))
+            radiance[rows] *= self.textures[texture_id].sample(uv, np.zeros(len(rows)))
+
+        return {'direction': direction, 'distance': distance, 'radiance': radiance, 'pdf': pdf}
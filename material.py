@@ -18,8 +18,8 @@ def diffuse_lambert(light_ray, shadow_ray, intersection_point, material):
         np.array: The color of the pixel.
     """
 
-    # Get the material color
-    material_color = material['color']
+    # Get the material color, from the texture if the material has one
+    material_color = surface_color(material)
 
     # Get the light color
     light_color = material['light_color']
@@ -53,8 +53,8 @@ def mirror(light_ray, shadow_ray, intersection_point, material):
         np.array: The color of the pixel.
     """
 
-    # Get the material color
-    material_color = material['color']
+    # Get the material color, from the texture if the material has one
+    material_color = surface_color(material)
 
     # Get the light color
     light_color = material['light_color']
@@ -94,8 +94,8 @@ def glossy(light_ray, shadow_ray, intersection_point, material):
         np.array: The color of the pixel.
     """
 
-    # Get the material color
-    material_color = material['color']
+    # Get the material color, from the texture if the material has one
+    material_color = surface_color(material)
 
     # Get the light color
     light_color = material['light_color']
@@ -135,8 +135,8 @@ def metal(light_ray, shadow_ray, intersection_point, material):
         np.array: The color of the pixel.
     """
 
-    # Get the material color
-    material_color = material['color']
+    # Get the material color, from the texture if the material has one
+    material_color = surface_color(material)
 
     # Get the light color
     light_color = material['light_color']
@@ -159,4 +159,20 @@ def metal(light_ray, shadow_ray, intersection_point, material):
         metal_reflection = np.zeros(3)
 
     # Return the metal reflection
-    return metal_reflection
\ No newline at end of file
+    return metal_reflection
+
+# Surface Color
+
+def surface_color(material):
+    """Looks up the color of a material at a hit, filtering its texture if it has one.
+
+    Args:
+        material (dict): The material properties, with the 'texture' of Scene.material and, for textured materials,
+            the texture coordinates 'uv' of the hit and the texture 'footprint' from its ray differentials.
+
+    Returns:
+        np.array: The filtered texture color, or the constant material color.
+    """
+    if material.get('texture') is None or 'uv' not in material:
+        return material['color']
+    return material['texture'].sample(np.reshape(material['uv'], (1, 2)), material.get('footprint', 0.0))[0]
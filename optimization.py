@@ -2,7 +2,7 @@
 import multiprocessing
 import numpy as np
 import threading
-from core import recursive_tracing, generate_camera_ray
+from core import recursive_tracing, generate_camera_ray, render_tile
 
 def multiprocessing_raytracer(rays, scene, depth):
     """Uses multiprocessing to speed up ray tracing.
@@ -21,23 +21,29 @@ def multiprocessing_raytracer(rays, scene, depth):
     
 # Anti Aliasing
 
-def anti_aliasing(rays, scene, depth):
+def anti_aliasing(camera_position, camera_direction, camera_fov, image_width, image_height, scene, depth, samples_per_pixel=16, sampler='sobol'):
     """Uses anti-aliasing to reduce aliasing artifacts.
 
+    Every pixel is sampled at positions inside the pixel taken from a low-discrepancy sampler, which converges
+    faster per sample than random or fixed offsets.
+
     Args:
-        rays (np.array): An array of rays.
-        scene (list): A list of objects in the scene.
+        camera_position (np.array): The position of the camera in 3D space.
+        camera_direction (np.array): The direction the camera is pointing in 3D space.
+        camera_fov (float): The field of view of the camera.
+        image_width (int): The width of the image in pixels.
+        image_height (int): The height of the image in pixels.
+        scene (Scene): The compiled scene.
         depth (int): The maximum depth of recursion.
+        samples_per_pixel (int): The number of samples per pixel.
+        sampler (str): 'random', 'stratified', 'halton' or 'sobol'.
 
     Returns:
-        np.array: An array of colors for each ray.
+        np.array: An (H, W, 3) array of colors for each pixel.
     """
-    num_samples = 4
-    sample_rays = np.array([
-        rays + np.array([[-0.5, -0.5, 0], [0.5, -0.5, 0], [-0.5, 0.5, 0], [0.5, 0.5, 0]])
-    ])
-    results = np.array([recursive_tracing(sample_rays[i], scene, depth) for i in range(num_samples)])
-    return np.mean(results, axis=0)
+    buffers = render_tile(camera_position, camera_direction, camera_fov, image_width, image_height, scene, depth,
+                          samples_per_pixel=samples_per_pixel, sampler=sampler)
+    return buffers['color']
     
 # Threading
 
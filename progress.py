@@ -0,0 +1,252 @@
+# Render Time Calculation
+
+import threading
+import time
+import tracemalloc
+import numpy as np
+from core import render_tile, split_tiles, PathBuffers
+
+def pilot_tile(tile, scale, pilot_width, pilot_height):
+    """Maps a tile of the full image onto the pilot image.
+
+    Args:
+        tile (tuple): The (x0, y0, x1, y1) bounds of the tile in the full image.
+        scale (int): The resolution divisor of the pilot image.
+        pilot_width (int): The width of the pilot image.
+        pilot_height (int): The height of the pilot image.
+
+    Returns:
+        tuple: The (x0, y0, x1, y1) bounds of the tile in the pilot image, at least one pixel large.
+    """
+    x0, y0, x1, y1 = tile
+    x0, y0 = min(x0 // scale, pilot_width - 1), min(y0 // scale, pilot_height - 1)
+    return x0, y0, max(x0 + 1, min(-(-x1 // scale), pilot_width)), max(y0 + 1, min(-(-y1 // scale), pilot_height))
+
+def estimate_render(camera_position, camera_direction, camera_fov, image_width, image_height, scene, depth, samples_per_pixel=1,
+                    tile_size=64, pilot_scale=8, processes=1, **options):
+    """Predicts the time and memory of a render from a subsampled pilot pass.
+
+    Every tile is rendered once at 1/pilot_scale resolution with one sample to build a per-tile cost map. The tile
+    with the median pilot time is then rendered at full resolution with one sample. Together with its pilot time
+    this separates the fixed cost of a tile sample from the cost per pixel, and the remaining tiles are predicted
+    from their pilot times. The working memory of a tile is measured during a pilot render and scaled to full
+    tiles.
+
+    Args:
+        camera_position (np.array): The position of the camera in 3D space.
+        camera_direction (np.array): The direction the camera is pointing in 3D space.
+        camera_fov (float): The horizontal field of view of the camera in radians.
+        image_width (int): The width of the image in pixels.
+        image_height (int): The height of the image in pixels.
+        scene (Scene): The compiled scene.
+        depth (int): The maximum number of bounces.
+        samples_per_pixel (int): The number of samples per pixel of the predicted render.
+        tile_size (int): The edge length of the render tiles.
+        pilot_scale (int): The resolution divisor of the pilot pass.
+        processes (int): The number of tiles rendered in parallel.
+        **options: Further render_tile arguments of the predicted render, such as the sampler or the lens.
+
+    Returns:
+        dict: The predicted 'tile_seconds' per tile, the total 'cpu_seconds' and wall-clock 'seconds', the
+        'memory_bytes' of the render, the 'cost_map' of predicted tile times as a (rows, columns) array and the
+        'pilot_seconds' spent on the estimate.
+    """
+    start_time = time.perf_counter()
+    tiles = split_tiles(image_width, image_height, tile_size)
+    pilot_width, pilot_height = -(-image_width // pilot_scale), -(-image_height // pilot_scale)
+    render = lambda tile, width, height: render_tile(camera_position, camera_direction, camera_fov, width, height, scene, depth, tile=tile, **options)
+
+    # Time every tile in the pilot image, after a first untimed render absorbs one-off setup costs
+    pilot_tiles = [pilot_tile(tile, pilot_scale, pilot_width, pilot_height) for tile in tiles]
+    render(pilot_tiles[0], pilot_width, pilot_height)
+    pilot_times = []
+    for tile in pilot_tiles:
+        tile_start_time = time.perf_counter()
+        render(tile, pilot_width, pilot_height)
+        pilot_times.append(time.perf_counter() - tile_start_time)
+    pilot_times = np.array(pilot_times)
+    pilot_pixels = np.array([(x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in pilot_tiles])
+    full_pixels = np.array([(x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in tiles])
+
+    # Calibrate the fixed and per-pixel cost on the median tile at full resolution
+    median = int(np.argsort(pilot_times)[len(tiles) // 2])
+    tile_start_time = time.perf_counter()
+    render(tiles[median], image_width, image_height)
+    full_time = time.perf_counter() - tile_start_time
+    if full_pixels[median] > pilot_pixels[median]:
+        fixed_time = (pilot_times[median] * full_pixels[median] - full_time * pilot_pixels[median]) / (full_pixels[median] - pilot_pixels[median])
+        fixed_time = float(np.clip(fixed_time, 0, pilot_times.min()))
+    else:
+        fixed_time = 0.0
+    pixel_times = np.maximum(pilot_times - fixed_time, 0) / pilot_pixels
+    tile_seconds = (fixed_time + pixel_times * full_pixels) * samples_per_pixel
+
+    # Measure the working memory of the median pilot tile and scale it to the largest full tile
+    tracemalloc.start()
+    render(pilot_tiles[median], pilot_width, pilot_height)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    tile_bytes = peak_bytes * full_pixels.max() / pilot_pixels[median] + PathBuffers.footprint(int(full_pixels.max()))
+    memory_bytes = scene.nbytes + image_width * image_height * 3 * 8 + processes * tile_bytes
+
+    columns = -(-image_width // tile_size)
+    return {
+        'tile_seconds': dict(zip(tiles, tile_seconds.tolist())),
+        'cpu_seconds': float(tile_seconds.sum()),
+        'seconds': float(tile_seconds.sum() / processes),
+        'memory_bytes': int(memory_bytes),
+        'cost_map': tile_seconds.reshape(-1, columns),
+        'pilot_seconds': time.perf_counter() - start_time,
+    }
+
+# Render Progress
+
+class RenderProgress:
+    """Thread-safe progress of a render made of work units, usually tiles, with a refined time estimate.
+
+    With predicted unit costs from estimate_render, progress is weighted by the predicted cost and the remaining
+    time is the remaining predicted cost scaled by the measured wall-clock throughput so far. Without predictions
+    every unit weighs the same. Listeners receive a snapshot after every finished unit, so the GUI, the command
+    line and the job manager can all follow the same render.
+
+    Args:
+        units (list): The hashable work units of the render.
+        predicted_seconds (dict): The predicted time of every unit. Defaults to equal weights.
+        processes (int): The number of units worked on in parallel, used before the first unit finishes.
+    """
+
+    def __init__(self, units, predicted_seconds=None, processes=1):
+        self.units = list(units)
+        self.predicted_seconds = predicted_seconds
+        self.weights = {unit: predicted_seconds[unit] if predicted_seconds else 1.0 for unit in self.units}
+        self.total_weight = sum(self.weights.values())
+        self.processes = processes
+        self.finished = {}
+        self.finished_weight = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Starts the clock, unless it is already running."""
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = time.perf_counter()
+
+    def add_listener(self, listener):
+        """Registers a callable that receives a snapshot after every finished unit."""
+        self.listeners.append(listener)
+
+    def update_progress(self, unit, seconds):
+        """Records a finished unit and reports it to the listeners.
+
+        Args:
+            unit: The finished work unit.
+            seconds (float): The time the unit took.
+        """
+        self.notify(self.record_progress(unit, seconds))
+
+    def record_progress(self, unit, seconds):
+        """Records a finished unit without reporting it, so callers can record under their own lock and notify later.
+
+        Args:
+            unit: The finished work unit.
+            seconds (float): The time the unit took.
+
+        Returns:
+            dict: The progress snapshot after the unit, see snapshot.
+        """
+        self.start()
+        with self.lock:
+            if unit not in self.finished:
+                self.finished[unit] = seconds
+                self.finished_weight += self.weights.get(unit, 0.0)
+            if len(self.finished) == len(self.units):
+                self.end_time = time.perf_counter()
+            return self.snapshot_locked()
+
+    def notify(self, snapshot):
+        """Passes a snapshot to the listeners."""
+        for listener in self.listeners:
+            listener(snapshot)
+
+    def snapshot(self):
+        """Returns the current progress.
+
+        Returns:
+            dict: The 'finished_units', 'total_units', weighted 'fraction', 'elapsed' seconds, the estimated
+            remaining seconds 'eta' (None while unknown) and the measured 'units_per_second'.
+        """
+        with self.lock:
+            return self.snapshot_locked()
+
+    def snapshot_locked(self):
+        """Returns the current progress. Must be called with the lock held."""
+        now = self.end_time or time.perf_counter()
+        elapsed = now - self.start_time if self.start_time is not None else 0.0
+        remaining_weight = self.total_weight - self.finished_weight
+        if self.finished_weight > 0 and elapsed > 0:
+            eta = elapsed * remaining_weight / self.finished_weight
+        elif self.predicted_seconds:
+            eta = remaining_weight / self.processes
+        else:
+            eta = None
+        return {
+            'finished_units': len(self.finished),
+            'total_units': len(self.units),
+            'fraction': self.finished_weight / self.total_weight if self.total_weight else 1.0,
+            'elapsed': elapsed,
+            'eta': eta,
+            'units_per_second': len(self.finished) / elapsed if elapsed > 0 else 0.0,
+        }
+
+def format_progress(snapshot, width=30):
+    """Formats a progress snapshot as a text progress bar for the command line.
+
+    Args:
+        snapshot (dict): A snapshot returned by RenderProgress.snapshot.
+        width (int): The number of characters of the bar.
+
+    Returns:
+        str: The progress bar, for example '[=========           ]  45.0% 9/20 ETA 0:00:12'.
+    """
+    filled = int(round(snapshot['fraction'] * width))
+    if snapshot['eta'] is None:
+        eta = '-:--:--'
+    else:
+        minutes, seconds = divmod(int(round(snapshot['eta'])), 60)
+        eta = f'{minutes // 60}:{minutes % 60:02d}:{seconds:02d}'
+    return (f"[{'=' * filled}{' ' * (width - filled)}] {snapshot['fraction'] * 100:5.1f}% "
+            f"{snapshot['finished_units']}/{snapshot['total_units']} ETA {eta}")
+
+def render_tiles(camera_position, camera_direction, camera_fov, image_width, image_height, scene, depth, tile_size=64, progress=None,
+                 **options):
+    """Renders an image tile by tile, reporting every finished tile to a progress tracker.
+
+    Args:
+        camera_position (np.array): The position of the camera in 3D space.
+        camera_direction (np.array): The direction the camera is pointing in 3D space.
+        camera_fov (float): The horizontal field of view of the camera in radians.
+        image_width (int): The width of the image in pixels.
+        image_height (int): The height of the image in pixels.
+        scene (Scene): The compiled scene.
+        depth (int): The maximum number of bounces.
+        tile_size (int): The edge length of the tiles.
+        progress (RenderProgress): The tracker to report to, with the tiles of split_tiles as units.
+        **options: Further render_tile arguments, such as samples_per_pixel or sampler.
+
+    Returns:
+        np.array: The (H, W, 3) rendered image.
+    """
+    image = np.zeros((image_height, image_width, 3))
+    if progress is not None:
+        progress.start()
+    for tile in split_tiles(image_width, image_height, tile_size):
+        tile_start_time = time.perf_counter()
+        x0, y0, x1, y1 = tile
+        image[y0:y1, x0:x1] = render_tile(camera_position, camera_direction, camera_fov, image_width, image_height, scene, depth,
+                                          tile=tile, **options)['color']
+        if progress is not None:
+            progress.update_progress(tile, time.perf_counter() - tile_start_time)
+    return image
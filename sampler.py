@@ -0,0 +1,358 @@
+# Sample Dimensions
+
+import numpy as np
+
+# Every dimension is a pair of sample components, so 1D consumers use the first component
+DIMENSION_PIXEL = 0
+DIMENSION_LENS = 1
+DIMENSION_TIME = 2
+DIMENSION_BOUNCE = 3
+DIMENSIONS_PER_BOUNCE = 3
+BOUNCE_LIGHT, BOUNCE_BSDF, BOUNCE_LOBE = 0, 1, 2
+
+SAMPLERS = ('random', 'stratified', 'halton', 'sobol')
+
+def bounce_dimension(bounce, offset):
+    """Calculates the sample dimension used at a path bounce.
+
+    Args:
+        bounce (int): The bounce index, 0 for the camera ray hit.
+        offset (int): BOUNCE_LIGHT, BOUNCE_BSDF or BOUNCE_LOBE.
+
+    Returns:
+        int: The sample dimension.
+    """
+    return DIMENSION_BOUNCE + DIMENSIONS_PER_BOUNCE * bounce + offset
+
+# Hashing
+
+def mix_bits(values):
+    """Scrambles 64-bit integers with the MurmurHash3 finalizer.
+
+    Args:
+        values (np.array): An array of integers.
+
+    Returns:
+        np.array: The hashed values as uint64.
+    """
+    values = np.asarray(values).astype(np.uint64)
+    values ^= values >> np.uint64(33)
+    values *= np.uint64(0xff51afd7ed558ccd)
+    values ^= values >> np.uint64(33)
+    values *= np.uint64(0xc4ceb9fe1a85ec53)
+    values ^= values >> np.uint64(33)
+    return values
+
+def hash_pixels(pixel_ids, dimension, seed, component=0):
+    """Derives an independent 64-bit hash for every pixel, dimension, seed and pair component.
+
+    Args:
+        pixel_ids (np.array): An (N,) array of pixel indices.
+        dimension (int): The sample dimension.
+        seed (int): The sampler seed.
+        component (int): The component of the dimension pair.
+
+    Returns:
+        np.array: An (N,) array of uint64 hashes.
+    """
+    key = mix_bits((seed * 0x9e3779b97f4a7c15 + dimension * 2 + component) & 0xFFFFFFFFFFFFFFFF)
+    return mix_bits(np.asarray(pixel_ids).astype(np.uint64) ^ key)
+
+def to_unit_interval(bits):
+    """Maps 32-bit integers to floats in [0, 1).
+
+    Args:
+        bits (np.array): An array of integers below 2**32.
+
+    Returns:
+        np.array: The floats.
+    """
+    return np.minimum(bits.astype(np.float64) * 2.0**-32, 1 - 2.0**-53)
+
+# Random Sampler
+
+def random_samples(pixel_ids, sample_index, dimension, seed):
+    """Generates independent uniform samples from a hash of pixel, sample index and dimension.
+
+    Args:
+        pixel_ids (np.array): An (N,) array of pixel indices.
+        sample_index (int): The index of the sample within each pixel.
+        dimension (int): The sample dimension.
+        seed (int): The sampler seed.
+
+    Returns:
+        np.array: An (N, 2) array of samples in [0, 1).
+    """
+    return np.column_stack([to_unit_interval(mix_bits(hash_pixels(pixel_ids, dimension, seed, component) + np.uint64(sample_index)) >> np.uint64(32))
+                            for component in (0, 1)])
+
+# Stratified Sampler
+
+def stratified_samples(pixel_ids, sample_index, dimension, samples_per_pixel, seed):
+    """Generates jittered stratified samples with a separate stratum order per pixel and dimension.
+
+    A square sample count is stratified on a 2D grid; other counts are stratified along each axis independently,
+    like a Latin hypercube.
+
+    Args:
+        pixel_ids (np.array): An (N,) array of pixel indices.
+        sample_index (int): The index of the sample within each pixel.
+        dimension (int): The sample dimension.
+        samples_per_pixel (int): The total number of samples per pixel, which sets the number of strata.
+        seed (int): The sampler seed.
+
+    Returns:
+        np.array: An (N, 2) array of samples in [0, 1).
+    """
+    jitter = random_samples(pixel_ids, sample_index, dimension, seed + 1)
+
+    # Visit the strata in a different rotated order in every pixel and dimension
+    rotation = hash_pixels(pixel_ids, dimension, seed)
+    grid_size = int(round(np.sqrt(samples_per_pixel)))
+    if grid_size**2 == samples_per_pixel:
+        stratum = ((rotation % np.uint64(samples_per_pixel) + np.uint64(sample_index)) % np.uint64(samples_per_pixel)).astype(np.int64)
+        return np.column_stack([stratum % grid_size, stratum // grid_size]) / grid_size + jitter / grid_size
+    strata = [((hash_pixels(pixel_ids, dimension, seed, component) % np.uint64(samples_per_pixel) + np.uint64(sample_index))
+               % np.uint64(samples_per_pixel)).astype(np.int64) for component in (0, 1)]
+    return (np.column_stack(strata) + jitter) / samples_per_pixel
+
+# Halton Sampler
+
+def first_primes(count):
+    """Lists the first prime numbers.
+
+    Args:
+        count (int): The number of primes.
+
+    Returns:
+        list: The primes in increasing order.
+    """
+    primes, candidate = [], 2
+    while len(primes) < count:
+        if all(candidate % prime for prime in primes if prime * prime <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+HALTON_PRIMES = first_primes(256)
+
+def scrambled_radical_inverse(base, indices, seeds):
+    """Mirrors the base-b digits of integers around the radix point after scrambling every digit.
+
+    Each digit level is permuted by a random affine map digit * a + c modulo the base, so the few samples of a
+    pixel spread over the whole interval even in large bases instead of clustering near zero.
+
+    Args:
+        base (int): The prime base.
+        indices (np.array): An array of non-negative integers.
+        seeds (np.array): A uint64 array of scramble seeds, one per index.
+
+    Returns:
+        np.array: The scrambled radical inverses in [0, 1).
+    """
+    indices = np.array(indices, dtype=np.uint64)
+    result = np.zeros(indices.shape)
+    scale = 1.0 / base
+    for level in range(int(np.ceil(32 / np.log2(base)))):
+        # Permute the digit of this level
+        digest = mix_bits(seeds + np.uint64(level))
+        multiplier = np.uint64(1) + digest % np.uint64(base - 1) if base > 2 else np.uint64(1)
+        offset = (digest >> np.uint64(32)) % np.uint64(base)
+        digits = (indices % np.uint64(base) * multiplier + offset) % np.uint64(base)
+        result += digits * scale
+        indices //= np.uint64(base)
+        scale /= base
+    return np.minimum(result, 1 - 2.0**-53)
+
+def halton_samples(pixel_ids, sample_index, dimension, seed):
+    """Generates Halton samples with digits scrambled separately for every pixel.
+
+    Args:
+        pixel_ids (np.array): An (N,) array of pixel indices.
+        sample_index (int): The index of the sample within each pixel.
+        dimension (int): The sample dimension, which selects two prime bases.
+        seed (int): The sampler seed.
+
+    Returns:
+        np.array: An (N, 2) array of samples in [0, 1).
+    """
+    samples = []
+    for component in (0, 1):
+        base = HALTON_PRIMES[(2 * dimension + component) % len(HALTON_PRIMES)]
+        samples.append(scrambled_radical_inverse(base, np.full(len(pixel_ids), sample_index), hash_pixels(pixel_ids, dimension, seed, component)))
+    return np.column_stack(samples)
+
+# Sobol Sampler
+
+def sobol_matrices():
+    """Builds the generator matrices of the first two Sobol dimensions as 32 direction numbers each.
+
+    Returns:
+        np.array: A (2, 32) array of uint64 direction numbers.
+    """
+    # The first dimension is the van der Corput sequence and the second uses the primitive polynomial x + 1
+    first = [1 << (31 - bit) for bit in range(32)]
+    second = [1 << 31]
+    for bit in range(1, 32):
+        second.append(second[-1] ^ (second[-1] >> 1))
+    return np.array([first, second], dtype=np.uint64)
+
+SOBOL_MATRICES = sobol_matrices()
+
+def reverse_bits(values):
+    """Reverses the bit order of 32-bit integers.
+
+    Args:
+        values (np.array): A uint64 array of values below 2**32.
+
+    Returns:
+        np.array: The reversed values.
+    """
+    values = ((values >> np.uint64(1)) & np.uint64(0x55555555)) | ((values & np.uint64(0x55555555)) << np.uint64(1))
+    values = ((values >> np.uint64(2)) & np.uint64(0x33333333)) | ((values & np.uint64(0x33333333)) << np.uint64(2))
+    values = ((values >> np.uint64(4)) & np.uint64(0x0F0F0F0F)) | ((values & np.uint64(0x0F0F0F0F)) << np.uint64(4))
+    values = ((values >> np.uint64(8)) & np.uint64(0x00FF00FF)) | ((values & np.uint64(0x00FF00FF)) << np.uint64(8))
+    return ((values >> np.uint64(16)) | (values << np.uint64(16))) & np.uint64(0xFFFFFFFF)
+
+def owen_scramble(values, seeds):
+    """Applies a hash-based nested uniform (Owen) scramble to 32-bit fixed point samples.
+
+    Args:
+        values (np.array): A uint64 array of samples scaled to 32 bits.
+        seeds (np.array): A uint64 array of scramble seeds.
+
+    Returns:
+        np.array: The scrambled samples, still scaled to 32 bits.
+    """
+    mask = np.uint64(0xFFFFFFFF)
+    values = reverse_bits(values)
+    values = (values + (seeds & mask)) & mask
+    for multiplier in (0x6c50b47c, 0xb82f1e52, 0xc7afe638, 0x8d22f6e6):
+        values ^= (values * np.uint64(multiplier)) & mask
+    return reverse_bits(values)
+
+def sobol_samples(pixel_ids, sample_index, dimension, samples_per_pixel, seed):
+    """Generates Owen-scrambled Sobol samples, padding every dimension with its own scrambled 2D Sobol pair.
+
+    When the sample count is a power of two, the sample index is also shuffled per pixel and dimension, so the
+    dimensions stay decorrelated while every pixel still receives a complete stratified point set.
+
+    Args:
+        pixel_ids (np.array): An (N,) array of pixel indices.
+        sample_index (int): The index of the sample within each pixel.
+        dimension (int): The sample dimension.
+        samples_per_pixel (int): The total number of samples per pixel.
+        seed (int): The sampler seed.
+
+    Returns:
+        np.array: An (N, 2) array of samples in [0, 1).
+    """
+    indices = np.full(len(pixel_ids), sample_index, dtype=np.uint64)
+    if samples_per_pixel & (samples_per_pixel - 1) == 0:
+        indices ^= hash_pixels(pixel_ids, dimension, seed + 1) & np.uint64(samples_per_pixel - 1)
+
+    samples = []
+    for component in (0, 1):
+        # Multiply the index bits with the generator matrix
+        bits = np.zeros(len(pixel_ids), dtype=np.uint64)
+        for bit in range(32):
+            bits ^= np.where((indices >> np.uint64(bit)) & np.uint64(1), SOBOL_MATRICES[component, bit], np.uint64(0))
+        samples.append(to_unit_interval(owen_scramble(bits, hash_pixels(pixel_ids, dimension, seed, component))))
+    return np.column_stack(samples)
+
+# Sample Generation
+
+def generate_samples(sampler, pixel_ids, sample_index, dimension, samples_per_pixel, seed=0):
+    """Generates one 2D sample of a dimension for a block of pixels.
+
+    Args:
+        sampler (str): 'random', 'stratified', 'halton' or 'sobol'.
+        pixel_ids (np.array): An (N,) array of pixel indices.
+        sample_index (int): The index of the sample within each pixel.
+        dimension (int): The sample dimension, such as DIMENSION_PIXEL or bounce_dimension(bounce, BOUNCE_BSDF).
+        samples_per_pixel (int): The total number of samples per pixel.
+        seed (int): The sampler seed.
+
+    Returns:
+        np.array: An (N, 2) array of samples in [0, 1).
+    """
+    pixel_ids = np.asarray(pixel_ids)
+    if sampler == 'random':
+        return random_samples(pixel_ids, sample_index, dimension, seed)
+    if sampler == 'stratified':
+        return stratified_samples(pixel_ids, sample_index, dimension, samples_per_pixel, seed)
+    if sampler == 'halton':
+        return halton_samples(pixel_ids, sample_index, dimension, seed)
+    if sampler == 'sobol':
+        return sobol_samples(pixel_ids, sample_index, dimension, samples_per_pixel, seed)
+    raise ValueError(f"Unknown sampler: {sampler}")
+
+def generate_sample_block(sampler, pixel_ids, dimension, samples_per_pixel, seed=0):
+    """Generates all samples of a dimension for a block of pixels.
+
+    Args:
+        sampler (str): 'random', 'stratified', 'halton' or 'sobol'.
+        pixel_ids (np.array): An (N,) array of pixel indices.
+        dimension (int): The sample dimension.
+        samples_per_pixel (int): The number of samples per pixel.
+        seed (int): The sampler seed.
+
+    Returns:
+        np.array: An (N, samples_per_pixel, 2) array of samples in [0, 1).
+    """
+    return np.stack([generate_samples(sampler, pixel_ids, index, dimension, samples_per_pixel, seed)
+                     for index in range(samples_per_pixel)], axis=1)
+
+# Convergence Benchmark
+
+def edge_coverage(normals, offsets):
+    """Calculates the exact area of the unit square on the inner side of straight edges.
+
+    Args:
+        normals (np.array): An (N, 2) array of edge normals with a non-zero second component.
+        offsets (np.array): An (N,) array of edge offsets, so the covered region is normal . (x, y) < offset.
+
+    Returns:
+        np.array: An (N,) array of covered areas.
+    """
+    def ramp_integral(start, slope):
+        # Integrate max(start + slope * x, 0) over x in [0, 1]
+        return (np.maximum(start + slope, 0)**2 - np.maximum(start, 0)**2) / (2 * slope)
+
+    # Integrate the clamped height of the covered region over x
+    a, b = normals[:, 0], normals[:, 1]
+    start, slope = offsets / b, -a / b
+    slope = np.where(np.abs(slope) < 1e-9, 1e-9, slope)
+    height = ramp_integral(start, slope) - ramp_integral(start - 1, slope)
+    return np.where(b > 0, height, 1 - height)
+
+def convergence_benchmark(sample_counts=(4, 16, 64, 256), pixel_count=4096, seed=0):
+    """Measures how fast each sampler converges on pixels covered by random straight edges.
+
+    Each pixel's coverage is estimated from its pixel samples and compared with the exact area, which is the
+    anti-aliasing problem the pixel dimension has to solve.
+
+    Args:
+        sample_counts (tuple): The samples per pixel to measure.
+        pixel_count (int): The number of random edge pixels.
+        seed (int): The seed of the edges and the samplers.
+
+    Returns:
+        dict: The RMS coverage error per sample count, keyed by sampler name.
+    """
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, 2 * np.pi, pixel_count)
+    normals = np.column_stack([np.cos(angles), np.sin(angles)])
+    normals[np.abs(normals[:, 1]) < 1e-3, 1] = 1e-3
+    offsets = normals @ np.array([0.5, 0.5]) + rng.uniform(-0.5, 0.5, pixel_count)
+    exact = edge_coverage(normals, offsets)
+
+    errors = {}
+    pixel_ids = np.arange(pixel_count)
+    for sampler in SAMPLERS:
+        errors[sampler] = []
+        for samples_per_pixel in sample_counts:
+            samples = generate_sample_block(sampler, pixel_ids, DIMENSION_PIXEL, samples_per_pixel, seed)
+            estimate = np.mean(np.einsum('nsk,nk->ns', samples, normals) < offsets[:, None], axis=1)
+            errors[sampler].append(float(np.sqrt(np.mean((estimate - exact)**2))))
+    return errors
@@ -0,0 +1,1016 @@
+# Scene Description
+
+import hashlib
+import json
+import os
+import tomllib
+from collections import OrderedDict
+import numpy as np
+from backend import get_backend
+from geometry import intersect_planes, intersect_boxes, triangle_barycentrics, primitive_bounds, build_bvh, traverse_bvh
+from geometry import transform_points, transform_directions, transform_bounds
+from light import LightTable, compile_light_table
+from texture import Texture, convert_texture, TEXTURE_HALF
+
+BUNDLE_MAGIC = b'PYTHTRCR'
+BUNDLE_VERSION = 6
+BUNDLE_ALIGNMENT = 64
+
+MATERIAL_PARAMETERS = ('roughness', 'metalness', 'reflection_coefficient', 'refraction_coefficient', 'refractive_index', 'texture_scale')
+MATERIAL_DEFAULTS = {'color': [0.8, 0.8, 0.8], 'emission': [0, 0, 0], 'roughness': 1.0, 'metalness': 0.0,
+                     'reflection_coefficient': 0.0, 'refraction_coefficient': 0.0, 'refractive_index': 1.0, 'texture_scale': 1.0}
+
+def load_scene_description(path):
+    """Loads a declarative scene description from a JSON or TOML file.
+
+    Args:
+        path (str): The path of the .json or .toml scene file.
+
+    Returns:
+        dict: The scene description with 'camera', 'settings', 'materials', 'lights', 'meshes' and 'objects'
+        entries.
+    """
+    with open(path, 'rb') as scene_file:
+        if path.endswith('.toml'):
+            description = tomllib.load(scene_file)
+        else:
+            description = json.load(scene_file)
+
+    # Resolve external mesh, texture and light image files relative to the scene file
+    base_directory = os.path.dirname(os.path.abspath(path))
+    for entry in file_entries(description):
+        entry['file'] = os.path.join(base_directory, entry['file'])
+    for material in description.get('materials', {}).values():
+        if 'texture' in material:
+            material['texture'] = os.path.join(base_directory, material['texture'])
+    for light in description.get('lights', []):
+        if 'image' in light:
+            light['image'] = os.path.join(base_directory, light['image'])
+    return description
+
+def file_entries(description):
+    """Lists the objects and shared meshes of a scene description that reference external mesh files.
+
+    Args:
+        description (dict): The scene description.
+
+    Returns:
+        list: The description entries with a 'file' key.
+    """
+    entries = description.get('objects', []) + list(description.get('meshes', {}).values())
+    return [entry for entry in entries if 'file' in entry]
+
+def texture_files(description):
+    """Lists the texture images of a scene description in the order of their texture ids.
+
+    Args:
+        description (dict): The scene description.
+
+    Returns:
+        list: The distinct 'texture' paths of the materials and 'image' paths of the lights, in order of first use.
+    """
+    textures = [material['texture'] for material in description.get('materials', {}).values() if 'texture' in material]
+    textures += [light['image'] for light in description.get('lights', []) if 'image' in light]
+    return list(dict.fromkeys(textures))
+
+def hash_scene_description(description):
+    """Calculates the content hash that keys the compiled bundle of a scene.
+
+    Args:
+        description (dict): The scene description.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the description, the referenced mesh and texture files and the
+        bundle version.
+    """
+    digest = hashlib.sha256(b'%d' % BUNDLE_VERSION)
+    digest.update(json.dumps(description, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+    # Include the contents of external mesh and texture files, so edits to them invalidate the bundle
+    for file_path in [entry['file'] for entry in file_entries(description)] + texture_files(description):
+        with open(file_path, 'rb') as external_file:
+            digest.update(hashlib.sha256(external_file.read()).digest())
+    return digest.hexdigest()
+
+def hash_scene_geometry(arrays):
+    """Calculates a hash of the compiled geometry of a scene, leaving out the material and light tables.
+
+    Scenes that only differ in lights or material parameters share the hash, so their primary hits are the same.
+
+    Args:
+        arrays (dict): The compiled scene arrays keyed by name.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the geometry arrays.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        if not name.startswith(('material_', 'light_')):
+            digest.update(name.encode('utf-8'))
+            digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()
+
+# Scene Compilation
+
+def load_obj_mesh(path):
+    """Loads the vertices, triangulated faces and texture coordinates of a Wavefront OBJ file.
+
+    Args:
+        path (str): The path of the .obj file.
+
+    Returns:
+        tuple: A (V, 3) array of vertices, an (F, 3) array of vertex indices and an (F, 3, 2) array of the texture
+        coordinates of the face corners, NaN for faces without them.
+    """
+    vertices, texture_coordinates, faces, face_uvs = [], [[np.nan, np.nan]], [], []
+    with open(path) as mesh_file:
+        for line in mesh_file:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 'v':
+                vertices.append([float(value) for value in fields[1:4]])
+            elif fields[0] == 'vt':
+                texture_coordinates.append([float(value) for value in (fields[1:3] + ['0'])[:2]])
+            elif fields[0] == 'f':
+                # Fan-triangulate polygons and drop normal indices
+                corners = [field.split('/') for field in fields[1:]]
+                polygon = [int(corner[0]) - 1 for corner in corners]
+                uv_polygon = [int(corner[1]) if len(corner) > 1 and corner[1] else 0 for corner in corners]
+                faces.extend([polygon[0], polygon[i], polygon[i + 1]] for i in range(1, len(polygon) - 1))
+                face_uvs.extend([uv_polygon[0], uv_polygon[i], uv_polygon[i + 1]] for i in range(1, len(polygon) - 1))
+    texture_coordinates = np.array(texture_coordinates, dtype=np.float64)
+    return (np.array(vertices, dtype=np.float64).reshape(-1, 3), np.array(faces, dtype=np.int64).reshape(-1, 3),
+            texture_coordinates[np.array(face_uvs, dtype=np.int64).reshape(-1, 3)])
+
+def cube_triangles(position, size):
+    """Generates the twelve triangles of an axis-aligned cube.
+
+    Args:
+        position (np.array): The center of the cube in 3D space.
+        size (float): The edge length of the cube.
+
+    Returns:
+        np.array: A (12, 3, 3) array of triangle vertices.
+    """
+    corners = np.array(position, dtype=np.float64) + size / 2 * np.array(
+        [[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)])
+    faces = [[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+             [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]]
+    return corners[faces]
+
+def object_triangles(scene_object):
+    """Converts a polygonal scene object into triangles.
+
+    Args:
+        scene_object (dict): A 'triangle', 'quad', 'cube' or 'mesh' entry of the scene description. Triangles and
+            quads may list the texture coordinates of their corners as 'uvs', inline meshes per vertex as 'uvs'.
+
+    Returns:
+        tuple: A (T, 3, 3) array of triangle vertices and a (T, 3, 2) array of the texture coordinates of their
+        corners, NaN where the object has none.
+    """
+    object_type = scene_object['type']
+    if object_type == 'triangle':
+        triangles = np.array(scene_object['vertices'], dtype=np.float64).reshape(1, 3, 3)
+        uvs = np.array(scene_object.get('uvs', np.full((3, 2), np.nan)), dtype=np.float64).reshape(1, 3, 2)
+    elif object_type == 'quad':
+        corners = [[0, 1, 2], [0, 2, 3]]
+        triangles = np.array(scene_object['vertices'], dtype=np.float64)[corners]
+        uvs = np.array(scene_object.get('uvs', np.full((4, 2), np.nan)), dtype=np.float64)[corners]
+    elif object_type == 'cube':
+        triangles = cube_triangles(scene_object['position'], scene_object['size'])
+        uvs = np.full((len(triangles), 3, 2), np.nan)
+    elif object_type == 'mesh':
+        if 'file' in scene_object:
+            vertices, faces, uvs = load_obj_mesh(scene_object['file'])
+        else:
+            vertices = np.array(scene_object['vertices'], dtype=np.float64)
+            faces = np.array(scene_object['faces'], dtype=np.int64)
+            uvs = np.array(scene_object.get('uvs', np.full((len(vertices), 2), np.nan)), dtype=np.float64)[faces]
+        triangles = vertices[faces]
+    else:
+        raise ValueError(f"Unsupported object type: {object_type}")
+    return triangles, uvs
+
+def compile_materials(materials, textures=()):
+    """Packs the named materials of a scene into a material table.
+
+    Args:
+        materials (dict): The material properties keyed by material name.
+        textures (list): The texture paths of the scene, see texture_files.
+
+    Returns:
+        tuple: The material names in table order and a dictionary of the packed material arrays. The
+        'material_textures' ids index the texture list, -1 for untextured materials.
+    """
+    names = list(materials)
+    table = [dict(MATERIAL_DEFAULTS, **materials[name]) for name in names] or [dict(MATERIAL_DEFAULTS)]
+    textures = list(textures)
+    arrays = {
+        'material_textures': np.array([textures.index(material['texture']) if 'texture' in material else -1 for material in table], dtype=np.int32),
+        'material_colors': np.array([material['color'] for material in table], dtype=np.float32),
+        'material_emission': np.array([material['emission'] for material in table], dtype=np.float32),
+        'material_parameters': np.array([[material[key] for key in MATERIAL_PARAMETERS] for material in table], dtype=np.float32),
+    }
+    return names, arrays
+
+def compile_scene(description):
+    """Compiles a scene description into packed primitive, material and light arrays with a prebuilt BVH.
+
+    Args:
+        description (dict): The scene description.
+
+    Returns:
+        dict: The packed scene arrays keyed by name. Triangles of objects marked 'streamed' are returned separately
+        as 'streamed_triangles' and 'streamed_triangle_materials' and are left out of the BVH. Streamed triangles
+        keep no texture coordinates and are textured by projection.
+    """
+    textures = texture_files(description)
+    material_names, arrays = compile_materials(description.get('materials', {}), textures)
+    material_ids = {name: index for index, name in enumerate(material_names)}
+
+    # Sort the objects into the packed primitive arrays
+    spheres, sphere_materials = [], []
+    planes, plane_materials = [], []
+    triangles, triangle_uvs, triangle_materials = [], [], []
+    streamed_triangles, streamed_materials = [], []
+    instances, instance_materials = [], []
+    for scene_object in description.get('objects', []):
+        material = material_ids.get(scene_object.get('material'), 0)
+        if scene_object['type'] == 'instance':
+            instances.append(scene_object)
+            instance_materials.append(material)
+        elif scene_object['type'] == 'sphere':
+            spheres.append(list(scene_object['position']) + [scene_object['radius']])
+            sphere_materials.append(material)
+        elif scene_object['type'] == 'plane':
+            planes.append([scene_object['position'], scene_object['normal']])
+            plane_materials.append(material)
+        elif scene_object.get('streamed'):
+            object_triangles_array = object_triangles(scene_object)[0]
+            streamed_triangles.append(object_triangles_array)
+            streamed_materials.append(np.full(len(object_triangles_array), material))
+        else:
+            object_triangles_array, object_uvs = object_triangles(scene_object)
+            triangles.append(object_triangles_array)
+            triangle_uvs.append(object_uvs)
+            triangle_materials.append(np.full(len(object_triangles_array), material))
+
+    arrays['spheres'] = np.array(spheres, dtype=np.float32).reshape(-1, 4)
+    arrays['sphere_materials'] = np.array(sphere_materials, dtype=np.int32)
+    arrays['planes'] = np.array(planes, dtype=np.float32).reshape(-1, 2, 3)
+    arrays['plane_materials'] = np.array(plane_materials, dtype=np.int32)
+    arrays['triangles'] = np.concatenate(triangles).astype(np.float32) if triangles else np.zeros((0, 3, 3), dtype=np.float32)
+    arrays['triangle_materials'] = np.concatenate(triangle_materials).astype(np.int32) if triangles else np.zeros(0, dtype=np.int32)
+    arrays['triangle_uvs'] = np.concatenate(triangle_uvs).astype(np.float32) if triangles else np.zeros((0, 3, 2), dtype=np.float32)
+    arrays['streamed_triangles'] = np.concatenate(streamed_triangles).astype(np.float32) if streamed_triangles else np.zeros((0, 3, 3), dtype=np.float32)
+    arrays['streamed_triangle_materials'] = np.concatenate(streamed_materials).astype(np.int32) if streamed_triangles else np.zeros(0, dtype=np.int32)
+
+    # Normalize the plane normals
+    arrays['planes'][:, 1] /= np.linalg.norm(arrays['planes'][:, 1], axis=1, keepdims=True)
+
+    # Prebuild the acceleration structure over the bounded primitives
+    bvh = build_bvh(primitive_bounds(arrays['spheres'], arrays['triangles']))
+    arrays.update({'bvh_' + key: value for key, value in bvh.items()})
+
+    arrays.update(compile_instances(description.get('meshes', {}), instances, instance_materials))
+    arrays.update(compile_light_table(description.get('lights', []), textures))
+    return arrays
+
+def compile_instances(meshes, instances, instance_materials):
+    """Compiles shared meshes and their instances into a two-level acceleration structure.
+
+    Every mesh is stored once in object space with its own BVH. The mesh trees are concatenated into one set of
+    'mesh_bvh' arrays, and a top-level 'instance_bvh' is built over the world-space boxes of the instances.
+
+    Args:
+        meshes (dict): The shared mesh entries keyed by mesh name.
+        instances (list): The 'instance' objects of the scene description, each with a 'mesh' name and an optional
+            4x4 'transform' from object to world space.
+        instance_materials (list): The material id of each instance.
+
+    Returns:
+        dict: The packed mesh and instance arrays.
+    """
+    # Pack the mesh triangles and build one tree per mesh
+    mesh_names = list(meshes)
+    mesh_triangles, mesh_uvs, mesh_roots, mesh_bounds = [], [], [], []
+    mesh_bvh = {'bounds': [], 'children': [], 'ranges': [], 'indices': []}
+    node_offset, triangle_offset = 0, 0
+    for name in mesh_names:
+        triangles, uvs = object_triangles(dict(meshes[name], type='mesh'))
+        triangles = triangles.astype(np.float32)
+        bvh = build_bvh(primitive_bounds(np.zeros((0, 4)), triangles))
+        mesh_bvh['bounds'].append(bvh['bounds'])
+        mesh_bvh['children'].append(np.where(bvh['children'] >= 0, bvh['children'] + node_offset, -1))
+        mesh_bvh['ranges'].append(bvh['ranges'] + [triangle_offset, 0])
+        mesh_bvh['indices'].append(bvh['indices'] + triangle_offset)
+        mesh_triangles.append(triangles)
+        mesh_uvs.append(uvs.astype(np.float32))
+        mesh_roots.append(node_offset)
+        mesh_bounds.append(bvh['bounds'][0])
+        node_offset += len(bvh['bounds'])
+        triangle_offset += len(triangles)
+
+    empty_bvh = build_bvh(np.zeros((0, 2, 3)))
+    arrays = {
+        'mesh_triangles': np.concatenate(mesh_triangles or [np.zeros((0, 3, 3), dtype=np.float32)]),
+        'mesh_triangle_uvs': np.concatenate(mesh_uvs or [np.zeros((0, 3, 2), dtype=np.float32)]),
+        'mesh_roots': np.array(mesh_roots, dtype=np.int32),
+    }
+    for key, value in mesh_bvh.items():
+        arrays['mesh_bvh_' + key] = np.concatenate(value or [empty_bvh[key]]).astype(empty_bvh[key].dtype)
+
+    # Pack the instance transforms and build the top-level tree over their world-space boxes
+    transforms = np.array([instance.get('transform', np.eye(4)) for instance in instances], dtype=np.float64).reshape(-1, 4, 4)
+    instance_meshes = np.array([mesh_names.index(instance['mesh']) for instance in instances], dtype=np.int32)
+    arrays['instance_meshes'] = instance_meshes
+    arrays['instance_materials'] = np.array(instance_materials, dtype=np.int32)
+    arrays['instance_transforms'] = transforms.astype(np.float32)
+    arrays['instance_inverse_transforms'] = np.linalg.inv(transforms).astype(np.float32) if instances else transforms.astype(np.float32)
+    world_bounds = transform_bounds(transforms, np.array(mesh_bounds, dtype=np.float64).reshape(-1, 2, 3)[instance_meshes])
+    arrays.update({'instance_bvh_' + key: value for key, value in build_bvh(world_bounds, max_leaf_size=1).items()})
+    return arrays
+
+# Scene Bundle
+
+def write_scene_bundle(path, arrays, metadata):
+    """Writes compiled scene arrays into a versioned binary bundle.
+
+    The bundle is a magic number, the format version, a JSON header describing every array and the raw array data
+    aligned to 64 bytes, so it can be memory-mapped without parsing.
+
+    Args:
+        path (str): The path of the bundle file.
+        arrays (dict): The compiled scene arrays keyed by name.
+        metadata (dict): JSON-serializable data stored alongside the arrays, such as the camera and render settings.
+    """
+    # Lay out the arrays behind the header
+    entries, offset = {}, 0
+    for name, array in arrays.items():
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+    header = json.dumps({'metadata': metadata, 'arrays': entries}).encode('utf-8')
+    data_start = -(-(len(BUNDLE_MAGIC) + 8 + len(header)) // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+    # Write to a temporary file first, so concurrent readers never see a partial bundle
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as bundle_file:
+        bundle_file.write(BUNDLE_MAGIC)
+        bundle_file.write(np.array([BUNDLE_VERSION, len(header)], dtype='<u4').tobytes())
+        bundle_file.write(header)
+        for name, array in arrays.items():
+            bundle_file.seek(data_start + entries[name]['offset'])
+            bundle_file.write(np.ascontiguousarray(array).tobytes())
+        bundle_file.truncate(data_start + offset)
+    os.replace(temporary_path, path)
+
+def read_scene_bundle(path):
+    """Memory-maps the arrays of a scene bundle.
+
+    Args:
+        path (str): The path of the bundle file.
+
+    Returns:
+        tuple: A dictionary of read-only arrays backed by the mapped file and the bundle metadata.
+    """
+    with open(path, 'rb') as bundle_file:
+        magic = bundle_file.read(len(BUNDLE_MAGIC))
+        version, header_length = np.frombuffer(bundle_file.read(8), dtype='<u4')
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported scene bundle: {path}")
+        header = json.loads(bundle_file.read(int(header_length)))
+    data_start = -(-(len(BUNDLE_MAGIC) + 8 + int(header_length)) // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+    # Map the file once and view every array into it
+    mapping = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape']))
+        arrays[name] = np.frombuffer(mapping, dtype=dtype, count=count, offset=data_start + entry['offset']).reshape(entry['shape'])
+    return arrays, header['metadata']
+
+def load_scene(path, cache_directory=None, backend=None):
+    """Loads a scene, compiling it into a bundle only if no bundle with the same content hash exists.
+
+    Args:
+        path (str): The path of a .json or .toml scene description, or of a compiled .ptb bundle.
+        cache_directory (str): The directory holding compiled bundles, named by content hash. Defaults to a
+            '.pythtracer_cache' directory next to the scene file.
+        backend (NumpyBackend): The compute backend used to trace the scene. Defaults to backend.get_backend().
+
+    Returns:
+        Scene: The loaded scene.
+    """
+    if path.endswith('.ptb'):
+        return open_scene_bundle(path, backend)
+
+    description = load_scene_description(path)
+    content_hash = hash_scene_description(description)
+    if cache_directory is None:
+        cache_directory = os.path.join(os.path.dirname(os.path.abspath(path)), '.pythtracer_cache')
+    bundle_path = os.path.join(cache_directory, content_hash + '.ptb')
+
+    # Reuse the cached bundle when it is still readable
+    if os.path.exists(bundle_path):
+        try:
+            return open_scene_bundle(bundle_path, backend)
+        except ValueError:
+            pass
+
+    # Compile the scene and cache the bundle
+    os.makedirs(cache_directory, exist_ok=True)
+    arrays = compile_scene(description)
+    tile_size = description.get('settings', {}).get('texture_tile_size', 64)
+    light_images = {light['image'] for light in description.get('lights', []) if 'image' in light}
+    metadata = {
+        'content_hash': content_hash,
+        'geometry_hash': hash_scene_geometry(arrays),
+        'camera': description.get('camera', {}),
+        'settings': description.get('settings', {}),
+        'materials': list(description.get('materials', {})),
+        'textures': [convert_texture(path, cache_directory, tile_size, TEXTURE_HALF if path in light_images else None)
+                     for path in texture_files(description)],
+    }
+
+    # Write streamed geometry into chunk bundles next to the scene bundle, before the scene bundle marks it complete
+    streamed_triangles, streamed_materials = arrays.pop('streamed_triangles'), arrays.pop('streamed_triangle_materials')
+    if len(streamed_triangles):
+        metadata['streamed_geometry'] = content_hash + '.chunks'
+        write_geometry_chunks(os.path.join(cache_directory, metadata['streamed_geometry']), streamed_triangles, streamed_materials,
+                              description.get('settings', {}).get('chunk_triangles', 65536))
+    write_scene_bundle(bundle_path, arrays, metadata)
+    return open_scene_bundle(bundle_path, backend)
+
+def open_scene_bundle(path, backend=None):
+    """Opens a compiled scene bundle, resolving its streamed geometry directory and textures next to the bundle.
+
+    Args:
+        path (str): The path of the .ptb bundle.
+        backend (NumpyBackend): The compute backend used to trace the scene.
+
+    Returns:
+        Scene: The loaded scene.
+    """
+    arrays, metadata = read_scene_bundle(path)
+    if metadata.get('streamed_geometry'):
+        metadata['streamed_geometry'] = os.path.join(os.path.dirname(os.path.abspath(path)), metadata['streamed_geometry'])
+    metadata['textures'] = [os.path.join(os.path.dirname(os.path.abspath(path)), name) for name in metadata.get('textures', [])]
+    return Scene(arrays, metadata, backend)
+
+# Scene
+
+class Scene:
+    """A compiled scene backed by packed, possibly memory-mapped, arrays.
+
+    Args:
+        arrays (dict): The compiled scene arrays keyed by name.
+        metadata (dict): The bundle metadata with the content hash, camera and render settings.
+        backend (NumpyBackend): The compute backend used to trace the scene. Defaults to backend.get_backend().
+    """
+
+    def __init__(self, arrays, metadata, backend=None):
+        self.arrays = arrays
+        self.backend = backend or get_backend()
+        self.metadata = metadata
+        self.content_hash = metadata.get('content_hash')
+        self.geometry_hash = metadata.get('geometry_hash') or hash_scene_geometry(arrays)
+        self.camera = metadata.get('camera', {})
+        self.max_depth = metadata.get('settings', {}).get('max_depth', 4)
+        self.irradiance_caching = metadata.get('settings', {}).get('irradiance_cache', False)
+        self.bvh = {key[4:]: value for key, value in arrays.items() if key.startswith('bvh_')}
+        self.mesh_bvh = {key[9:]: value for key, value in arrays.items() if key.startswith('mesh_bvh_')}
+        self.instance_bvh = {key[13:]: value for key, value in arrays.items() if key.startswith('instance_bvh_')}
+        self.streamed_geometry = None
+        if metadata.get('streamed_geometry'):
+            memory_budget = metadata.get('settings', {}).get('geometry_memory_budget', 256 * 2**20)
+            self.streamed_geometry = StreamedGeometry(metadata['streamed_geometry'], memory_budget, self.backend)
+
+        # Open the textures through the process-wide tile cache
+        self.textures = [Texture(path) for path in metadata.get('textures', [])]
+        self.lights = LightTable(arrays, self.textures)
+
+    @property
+    def nbytes(self):
+        """int: The size of the compiled scene arrays and the resident geometry chunks in bytes."""
+        streamed_bytes = self.streamed_geometry.nbytes if self.streamed_geometry is not None else 0
+        return sum(array.nbytes for array in self.arrays.values()) + streamed_bytes
+
+    @property
+    def bounds(self):
+        """np.array: The (2, 3) bounds of the spheres, triangles, instances and streamed chunks. The unbounded
+        planes only add their anchor points, so they are clamped to the extent of the other geometry. Zero for an
+        empty scene."""
+        corners = [bvh['bounds'][:1].reshape(-1, 3) for bvh in (self.bvh, self.instance_bvh) if len(bvh.get('bounds', []))]
+        if self.streamed_geometry is not None:
+            corners.append(self.streamed_geometry.index['chunk_bounds'].reshape(-1, 3))
+        corners.append(self.arrays['planes'][:, 0])
+        corners = np.concatenate(corners).astype(np.float64)
+        if not len(corners):
+            return np.zeros((2, 3))
+        return np.array([corners.min(axis=0), corners.max(axis=0)])
+
+    def intersect_instances(self, origins, directions, ray_ids, instance_ids, t_max, stats=None):
+        """Intersects (ray, instance) pairs by tracing the rays through the instanced mesh in object space.
+
+        Args:
+            origins (np.array): An (N, 3) array of world-space ray origins.
+            directions (np.array): An (N, 3) array of world-space ray directions.
+            ray_ids (np.array): The ray index of each pair.
+            instance_ids (np.array): The instance index of each pair.
+            t_max (np.array): The farthest accepted distance of each pair.
+            stats (dict): An optional dictionary in which traversal counters are accumulated.
+
+        Returns:
+            tuple: The hit distances of the pairs and the mesh triangle ids that were hit.
+        """
+        # Move the rays into the object space of their instance
+        inverse_transforms = self.arrays['instance_inverse_transforms'][instance_ids]
+        object_origins = transform_points(inverse_transforms, origins[ray_ids])
+        object_directions = transform_directions(inverse_transforms, directions[ray_ids])
+
+        # Traverse the shared mesh trees, starting every pair at the root of its mesh
+        roots = self.arrays['mesh_roots'][self.arrays['instance_meshes'][instance_ids]]
+        t, triangle = self.backend.traverse_bvh(object_origins, object_directions, t_max, self.mesh_bvh,
+                                                self.arrays['spheres'][:0], self.arrays['mesh_triangles'], roots, stats)
+        return np.where(triangle >= 0, t, np.inf), triangle
+
+    def intersect(self, origins, directions, stats=None, t_max=None):
+        """Finds the closest hit of a batch of rays with the scene.
+
+        Args:
+            origins (np.array): An (N, 3) array of ray origins.
+            directions (np.array): An (N, 3) array of ray directions.
+            stats (dict): An optional dictionary in which traversal counters are accumulated.
+            t_max (np.array): An (N,) array of the farthest accepted hit distance per ray. Defaults to infinity.
+
+        Returns:
+            dict: The hit distance 't', the 'primitive' id (spheres, then triangles, then planes, then mesh
+            triangles, then streamed triangles, -1 for a miss), the 'instance' id (-1 unless a mesh triangle was hit), the 'material' id,
+            the hit 'point', the unit surface 'normal' facing against the ray and the triangle 'barycentric'
+            coordinates (zero for spheres and planes).
+        """
+        sphere_count, triangle_count = len(self.arrays['spheres']), len(self.arrays['triangles'])
+        t_max = np.full(len(origins), np.inf) if t_max is None else np.asarray(t_max, dtype=np.float64)
+
+        # Traverse the BVH for the bounded primitives
+        t, primitive = self.backend.traverse_bvh(origins, directions, t_max, self.bvh,
+                                                 self.arrays['spheres'], self.arrays['triangles'], stats=stats)
+
+        # Test the unbounded planes against every ray
+        if len(self.arrays['planes']):
+            plane_t = intersect_planes(origins[:, None], directions[:, None], self.arrays['planes'][None])
+            nearest_plane = np.argmin(plane_t, axis=1)
+            plane_t = plane_t[np.arange(len(origins)), nearest_plane]
+            closer = plane_t < t
+            t = np.where(closer, plane_t, t)
+            primitive = np.where(closer, sphere_count + triangle_count + nearest_plane, primitive)
+
+        # Traverse the top-level tree over the instances, only accepting hits closer than the ones found so far
+        instance = np.full(len(origins), -1, dtype=np.int32)
+        if len(self.arrays['instance_meshes']):
+            instance_t, hit_instance, mesh_triangle = traverse_bvh(
+                origins, directions, t, self.instance_bvh,
+                lambda ray_ids, instance_ids, t_max: self.intersect_instances(origins, directions, ray_ids, instance_ids, t_max, stats),
+                stats)
+            closer = hit_instance >= 0
+            t = np.where(closer, instance_t, t)
+            instance = np.where(closer, hit_instance, -1)
+            primitive = np.where(closer, sphere_count + triangle_count + len(self.arrays['planes']) + mesh_triangle, primitive)
+
+        # Stream in the geometry chunks the rays reach, only accepting hits closer than the ones found so far
+        streamed = None
+        if self.streamed_geometry is not None:
+            streamed = self.streamed_geometry.intersect(origins, directions, t, stats)
+            closer = streamed['triangle'] >= 0
+            t = np.where(closer, streamed['t'], t)
+            instance = np.where(closer, -1, instance)
+            primitive = np.where(closer, self.streamed_base + streamed['triangle'], primitive)
+
+        return self.shade_hits(origins, directions, t, primitive, instance, streamed)
+
+    @property
+    def streamed_base(self):
+        """int: The primitive id of the first streamed triangle."""
+        return len(self.arrays['spheres']) + len(self.arrays['triangles']) + len(self.arrays['planes']) + len(self.arrays['mesh_triangles'])
+
+    def shade_hits(self, origins, directions, t, primitive, instance, streamed=None):
+        """Calculates the hit points, normals and material ids of closest hits.
+
+        Args:
+            origins (np.array): An (N, 3) array of ray origins.
+            directions (np.array): An (N, 3) array of ray directions.
+            t (np.array): The hit distance per ray.
+            primitive (np.array): The primitive id per ray, -1 for a miss.
+            instance (np.array): The instance id per ray, -1 unless a mesh triangle was hit.
+            streamed (dict): The hits of StreamedGeometry.intersect, which carry the normals and materials of the
+                streamed triangles.
+
+        Returns:
+            dict: The hit record described in intersect.
+        """
+        sphere_count, triangle_count = len(self.arrays['spheres']), len(self.arrays['triangles'])
+        hit = primitive >= 0
+        point = origins + directions * np.where(hit, t, 0)[:, None]
+        normal = np.zeros_like(point)
+        material = np.full(len(origins), -1, dtype=np.int32)
+        barycentric = np.zeros((len(origins), 2))
+
+        # Calculate the normals of each primitive type
+        is_sphere = hit & (primitive < sphere_count)
+        spheres = self.arrays['spheres'][primitive[is_sphere]]
+        normal[is_sphere] = (point[is_sphere] - spheres[:, :3]) / spheres[:, 3:]
+        material[is_sphere] = self.arrays['sphere_materials'][primitive[is_sphere]]
+
+        is_triangle = hit & (primitive >= sphere_count) & (primitive < sphere_count + triangle_count)
+        triangles = self.arrays['triangles'][primitive[is_triangle] - sphere_count]
+        normal[is_triangle] = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        material[is_triangle] = self.arrays['triangle_materials'][primitive[is_triangle] - sphere_count]
+        barycentric[is_triangle] = triangle_barycentrics(point[is_triangle], triangles)
+
+        is_plane = hit & (primitive >= sphere_count + triangle_count) & (primitive < sphere_count + triangle_count + len(self.arrays['planes']))
+        is_plane &= instance < 0
+        normal[is_plane] = self.arrays['planes'][primitive[is_plane] - sphere_count - triangle_count, 1]
+        material[is_plane] = self.arrays['plane_materials'][primitive[is_plane] - sphere_count - triangle_count]
+
+        # Bring the object-space normals of instanced triangles into world space with the inverse transpose
+        is_instance = hit & (instance >= 0)
+        triangles = self.arrays['mesh_triangles'][primitive[is_instance] - sphere_count - triangle_count - len(self.arrays['planes'])]
+        object_normal = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        normal[is_instance] = np.einsum('nji,nj->ni', self.arrays['instance_inverse_transforms'][instance[is_instance], :3, :3], object_normal)
+        material[is_instance] = self.arrays['instance_materials'][instance[is_instance]]
+        object_point = transform_points(self.arrays['instance_inverse_transforms'][instance[is_instance]], point[is_instance])
+        barycentric[is_instance] = triangle_barycentrics(object_point, triangles)
+
+        # Take the streamed triangles from the chunks that were resident while they were hit
+        if streamed is not None:
+            is_streamed = hit & (primitive >= self.streamed_base) & (instance < 0)
+            normal[is_streamed] = streamed['normal'][is_streamed]
+            material[is_streamed] = streamed['material'][is_streamed]
+            barycentric[is_streamed] = streamed['barycentric'][is_streamed]
+
+        # Normalize the normals and turn them against the incoming rays
+        normal[hit] /= np.linalg.norm(normal[hit], axis=1, keepdims=True)
+        normal *= np.where(np.einsum('ij,ij->i', normal, directions) > 0, -1, 1)[:, None]
+        return {'t': t, 'primitive': primitive, 'instance': instance, 'material': material, 'point': point, 'normal': normal,
+                'barycentric': barycentric}
+
+    def surface_uvs(self, primitive, instance, barycentric, point, normal, texture_scale):
+        """Calculates the texture coordinates of hits and how fast they change across the surface.
+
+        Triangles with texture coordinates interpolate them, spheres are mapped by latitude and longitude and every
+        other surface is projected onto the axis plane it faces most, repeating every texture_scale units.
+
+        Args:
+            primitive (np.array): The (N,) primitive ids of the hits, see intersect.
+            instance (np.array): The (N,) instance ids of the hits.
+            barycentric (np.array): The (N, 2) triangle barycentric coordinates of the hits.
+            point (np.array): The (N, 3) hit points.
+            normal (np.array): The (N, 3) unit normals at the hits.
+            texture_scale (np.array): The (N,) world size of one texture repeat on projected surfaces.
+
+        Returns:
+            tuple: An (N, 2) array of texture coordinates and an (N,) array of the texture coordinate change per
+            world unit along the surface.
+        """
+        sphere_count, triangle_count, plane_count = len(self.arrays['spheres']), len(self.arrays['triangles']), len(self.arrays['planes'])
+        texture_scale = np.asarray(texture_scale, dtype=np.float64)
+
+        # Project onto the axis plane facing the normal most
+        axis = np.argmax(np.abs(normal), axis=1)
+        rows = np.arange(len(point))
+        uv = np.column_stack((point[rows, np.where(axis == 0, 2, 0)], point[rows, np.where(axis == 1, 2, 1)])) / texture_scale[:, None]
+        density = 1 / texture_scale
+
+        # Map spheres by longitude and latitude
+        is_sphere = (primitive >= 0) & (primitive < sphere_count)
+        spheres = self.arrays['spheres'][primitive[is_sphere]]
+        outward = (point[is_sphere] - spheres[:, :3]) / spheres[:, 3:]
+        uv[is_sphere] = np.column_stack((0.5 + np.arctan2(outward[:, 2], outward[:, 0]) / (2 * np.pi),
+                                         1 - np.arccos(np.clip(outward[:, 1], -1, 1)) / np.pi))
+        density[is_sphere] = 1 / (np.pi * np.sqrt(2) * spheres[:, 3])
+
+        # Interpolate the corner texture coordinates of triangles that have them
+        is_triangle = (primitive >= sphere_count) & (primitive < sphere_count + triangle_count) & (instance < 0)
+        is_instance = instance >= 0
+        instance_scale = np.abs(np.linalg.det(self.arrays['instance_transforms'][instance[is_instance], :3, :3].astype(np.float64))) ** (1 / 3)
+        for selected, triangle_ids, triangles, corner_uvs, scale in (
+                (is_triangle, primitive[is_triangle] - sphere_count, self.arrays['triangles'], self.arrays['triangle_uvs'],
+                 np.ones(np.count_nonzero(is_triangle))),
+                (is_instance, primitive[is_instance] - sphere_count - triangle_count - plane_count, self.arrays['mesh_triangles'],
+                 self.arrays['mesh_triangle_uvs'], instance_scale)):
+            corners = corner_uvs[triangle_ids].astype(np.float64)
+            has_uvs = ~np.isnan(corners).any(axis=(1, 2))
+            hits = np.flatnonzero(selected)[has_uvs]
+            corners, weights = corners[has_uvs], barycentric[hits]
+            uv[hits] = corners[:, 0] + weights[:, :1] * (corners[:, 1] - corners[:, 0]) + weights[:, 1:] * (corners[:, 2] - corners[:, 0])
+
+            # Compare the texture and world areas of the triangles
+            vertices = triangles[triangle_ids[has_uvs]].astype(np.float64)
+            world_area = np.linalg.norm(np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0]), axis=1)
+            world_area *= scale[has_uvs]**2
+            uv_edges = corners[:, 1:] - corners[:, :1]
+            uv_area = np.abs(uv_edges[:, 0, 0] * uv_edges[:, 1, 1] - uv_edges[:, 0, 1] * uv_edges[:, 1, 0])
+            density[hits] = np.sqrt(uv_area / np.maximum(world_area, 1e-12))
+        return uv, density
+
+    def texture_colors(self, colors, materials, primitive, instance, barycentric, point, normal, directions, cone_width):
+        """Replaces the colors of textured materials with filtered texture lookups.
+
+        The mipmap level of every lookup follows from the width of the ray cone at the hit, stretched by the
+        incidence angle and converted into texture coordinates with the texture density of the surface.
+
+        Args:
+            colors (np.array): The (N, 3) material colors of the hits.
+            materials (np.array): The (N,) material ids of the hits.
+            primitive (np.array): The (N,) primitive ids of the hits.
+            instance (np.array): The (N,) instance ids of the hits.
+            barycentric (np.array): The (N, 2) triangle barycentric coordinates of the hits.
+            point (np.array): The (N, 3) hit points.
+            normal (np.array): The (N, 3) unit normals at the hits.
+            directions (np.array): The (N, 3) unit directions of the rays.
+            cone_width (np.array): The (N,) width of the ray footprints at the hits.
+
+        Returns:
+            np.array: The (N, 3) colors, a new array if any hit is textured.
+        """
+        texture_ids = self.arrays['material_textures'][materials]
+        textured = np.flatnonzero(texture_ids >= 0)
+        if not len(textured):
+            return colors
+        uv, density = self.surface_uvs(primitive[textured], instance[textured], barycentric[textured], point[textured], normal[textured],
+                                       self.arrays['material_parameters'][materials[textured], 5])
+        cosine = np.maximum(np.abs(np.einsum('ij,ij->i', normal[textured], directions[textured])), 0.05)
+        footprint = cone_width[textured] / cosine * density
+
+        # Look up each texture once for all of its hits
+        colors = np.array(colors, dtype=np.float64)
+        for texture_id in np.unique(texture_ids[textured]):
+            rows = texture_ids[textured] == texture_id
+            colors[textured[rows]] = self.textures[texture_id].sample(uv[rows], footprint[rows])
+        return colors
+
+    def material(self, material_id):
+        """Unpacks one entry of the material table.
+
+        Args:
+            material_id (int): The index of the material.
+
+        Returns:
+            dict: The material properties in the format used by the material functions.
+        """
+        material = dict(zip(MATERIAL_PARAMETERS, self.arrays['material_parameters'][material_id].tolist()))
+        material['color'] = np.array(self.arrays['material_colors'][material_id])
+        material['emission'] = np.array(self.arrays['material_emission'][material_id])
+        texture_id = self.arrays['material_textures'][material_id]
+        material['texture'] = self.textures[texture_id] if texture_id >= 0 else None
+        return material
+
+    def find_closest_intersection(self, ray):
+        """Finds the closest intersection of a single ray with the scene.
+
+        Args:
+            ray (np.array): The ray as an array of its origin and direction.
+
+        Returns:
+            tuple: A tuple containing the intersection point, the material of the intersected object, and the normal of the surface at the intersection point. If no intersection is found, returns None.
+        """
+        hit = self.intersect(np.asarray(ray[0], dtype=np.float64)[None], np.asarray(ray[1], dtype=np.float64)[None])
+        if hit['primitive'][0] < 0:
+            return None
+        return (hit['point'][0], self.material(hit['material'][0]), hit['normal'][0])
+
+# Geometry Streaming
+
+def write_geometry_chunks(directory, triangles, triangle_materials, chunk_triangles=65536):
+    """Splits triangles into spatially coherent chunks and writes every chunk as a bundle with its own BVH.
+
+    The chunks are the leaves of a median-split hierarchy over the triangles, so each covers a compact region. An
+    index bundle stores the chunk bounds and a top-level BVH over them.
+
+    Args:
+        directory (str): The directory to write the chunk bundles and the index into.
+        triangles (np.array): A (T, 3, 3) array of triangle vertices.
+        triangle_materials (np.array): A (T,) array of material ids.
+        chunk_triangles (int): The largest number of triangles in a chunk.
+    """
+    os.makedirs(directory, exist_ok=True)
+    no_spheres = np.zeros((0, 4), dtype=np.float32)
+    chunks = build_bvh(primitive_bounds(no_spheres, triangles), max_leaf_size=chunk_triangles)
+    leaves = np.flatnonzero(chunks['children'][:, 0] < 0)
+
+    # Write every leaf as a chunk with a local BVH and the global ids of its triangles
+    for chunk, leaf in enumerate(leaves):
+        start, count = chunks['ranges'][leaf]
+        triangle_ids = chunks['indices'][start:start + count]
+        chunk_arrays = {'triangles': triangles[triangle_ids].astype(np.float32),
+                        'triangle_materials': triangle_materials[triangle_ids].astype(np.int32),
+                        'triangle_ids': triangle_ids.astype(np.int32)}
+        bvh = build_bvh(primitive_bounds(no_spheres, chunk_arrays['triangles']))
+        chunk_arrays.update({'bvh_' + key: value for key, value in bvh.items()})
+        write_scene_bundle(os.path.join(directory, f'chunk_{chunk:06d}.ptb'), chunk_arrays, {'chunk': chunk})
+
+    # Write the index with a top-level BVH over the chunk bounds
+    index = {'chunk_bounds': chunks['bounds'][leaves]}
+    index.update({'bvh_' + key: value for key, value in build_bvh(index['chunk_bounds'], max_leaf_size=1).items()})
+    write_scene_bundle(os.path.join(directory, 'index.ptb'), index, {'chunk_count': len(leaves), 'triangle_count': len(triangles)})
+
+class StreamedGeometry:
+    """Triangle geometry kept on disk in chunks and mapped into memory on demand under a memory budget.
+
+    Rays are first tested against the chunk bounds. The rays reaching each chunk are queued and traced as one batch,
+    resident chunks first, so every chunk is loaded at most once per batch of rays. Chunks whose rays all found
+    closer hits before it was their turn are not loaded at all. Loaded chunks are memory-mapped and kept in an LRU
+    cache that evicts the least recently used chunks beyond the memory budget.
+
+    Args:
+        directory (str): The directory written by write_geometry_chunks.
+        memory_budget (int): The total size of the chunks to keep resident in bytes.
+        backend (NumpyBackend): The compute backend used to traverse the chunk BVHs.
+    """
+
+    def __init__(self, directory, memory_budget=256 * 2**20, backend=None):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.backend = backend or get_backend()
+        self.index, self.metadata = read_scene_bundle(os.path.join(directory, 'index.ptb'))
+        self.chunk_bvh = {key[4:]: value for key, value in self.index.items() if key.startswith('bvh_')}
+        self.chunks = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def nbytes(self):
+        """int: The size of the resident chunks in bytes."""
+        return sum(array.nbytes for chunk in self.chunks.values() for array in chunk.values())
+
+    def chunk(self, chunk_id):
+        """Returns the arrays of a chunk, mapping it in and evicting the least recently used chunks if needed.
+
+        Args:
+            chunk_id (int): The index of the chunk.
+
+        Returns:
+            dict: The chunk arrays.
+        """
+        if chunk_id in self.chunks:
+            self.chunks.move_to_end(chunk_id)
+            return self.chunks[chunk_id]
+        self.loads += 1
+        self.chunks[chunk_id] = read_scene_bundle(os.path.join(self.directory, f'chunk_{chunk_id:06d}.ptb'))[0]
+        while len(self.chunks) > 1 and self.nbytes > self.memory_budget:
+            self.chunks.popitem(last=False)
+            self.evictions += 1
+        return self.chunks[chunk_id]
+
+    def intersect(self, origins, directions, t_max, stats=None):
+        """Finds the closest streamed triangle hit of a batch of rays.
+
+        Args:
+            origins (np.array): An (N, 3) array of ray origins.
+            directions (np.array): An (N, 3) array of ray directions.
+            t_max (np.array): An (N,) array of the farthest accepted hit distance per ray.
+            stats (dict): An optional dictionary counting the 'chunk_loads', the 'chunk_evictions', the
+                'chunk_batches' and the 'queued_rays' traced against chunks.
+
+        Returns:
+            dict: The hit distance 't' (t_max for misses), the global 'triangle' id (-1 for a miss), the
+            'material' id, the unit 'normal' facing against the ray and the 'barycentric' coordinates.
+        """
+        count = len(origins)
+        t = np.array(t_max, dtype=np.float64)
+        hit = {'t': t, 'triangle': np.full(count, -1, dtype=np.int32), 'material': np.full(count, -1, dtype=np.int32),
+               'normal': np.zeros((count, 3)), 'barycentric': np.zeros((count, 2))}
+
+        # Collect the chunks every ray passes through
+        pairs = []
+        def collect_chunks(ray_ids, chunk_ids, pair_t_max):
+            pairs.append((ray_ids, chunk_ids))
+            return np.full(len(ray_ids), np.inf), np.full(len(ray_ids), -1, dtype=np.int32)
+        traverse_bvh(origins, directions, t, self.chunk_bvh, collect_chunks)
+        if not pairs:
+            return hit
+        ray_ids = np.concatenate([pair[0] for pair in pairs])
+        chunk_ids = np.concatenate([pair[1] for pair in pairs])
+
+        # Queue the rays per chunk and serve the resident chunks first
+        order = np.argsort(chunk_ids, kind='stable')
+        ray_ids, chunk_ids = ray_ids[order], chunk_ids[order]
+        queued_chunks, starts = np.unique(chunk_ids, return_index=True)
+        queues = np.split(ray_ids, starts[1:])
+        schedule = sorted(range(len(queued_chunks)), key=lambda entry: queued_chunks[entry] not in self.chunks)
+        with np.errstate(divide='ignore'):
+            inverse_directions = 1 / directions
+        loads_before, evictions_before = self.loads, self.evictions
+        batches = queued_rays = 0
+
+        for entry in schedule:
+            chunk_id = int(queued_chunks[entry])
+
+            # Drop the rays that found a closer hit in an earlier chunk
+            queue = queues[entry]
+            bounds = np.broadcast_to(self.index['chunk_bounds'][chunk_id], (len(queue), 2, 3))
+            queue = queue[intersect_boxes(origins[queue], inverse_directions[queue], bounds, t[queue])]
+            if not queue.size:
+                continue
+
+            # Trace the batch through the chunk BVH
+            chunk = self.chunk(chunk_id)
+            chunk_bvh = {key[4:]: value for key, value in chunk.items() if key.startswith('bvh_')}
+            chunk_t, local = self.backend.traverse_bvh(origins[queue], directions[queue], t[queue], chunk_bvh,
+                                                       np.zeros((0, 4), dtype=np.float32), chunk['triangles'], stats=stats)
+            closer = local >= 0
+            rays, local = queue[closer], local[closer]
+            triangles = chunk['triangles'][local]
+            t[rays] = chunk_t[closer]
+            hit['triangle'][rays] = chunk['triangle_ids'][local]
+            hit['material'][rays] = chunk['triangle_materials'][local]
+            normal = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]).astype(np.float64)
+            normal /= np.linalg.norm(normal, axis=1, keepdims=True)
+            hit['normal'][rays] = normal * np.where(np.einsum('ij,ij->i', normal, directions[rays]) > 0, -1, 1)[:, None]
+            hit['barycentric'][rays] = triangle_barycentrics(origins[rays] + directions[rays] * t[rays, None], triangles)
+            batches += 1
+            queued_rays += len(queue)
+
+        if stats is not None:
+            stats['chunk_loads'] = stats.get('chunk_loads', 0) + self.loads - loads_before
+            stats['chunk_evictions'] = stats.get('chunk_evictions', 0) + self.evictions - evictions_before
+            stats['chunk_batches'] = stats.get('chunk_batches', 0) + batches
+            stats['queued_rays'] = stats.get('queued_rays', 0) + queued_rays
+        return hit
+
+# Scene Cache
+
+class SceneCache:
+    """Keeps recently used scenes loaded, evicting the least recently used ones beyond a memory budget.
+
+    Scenes are keyed by their path together with the modification times and sizes of the scene file and its mesh
+    files, so an edited scene is loaded again while an unchanged one is returned with its BVH ready.
+
+    Args:
+        max_bytes (int): The total size of the scene arrays to keep loaded.
+        cache_directory (str): The directory holding compiled bundles, see load_scene.
+        backend (NumpyBackend): The compute backend of the loaded scenes.
+    """
+
+    def __init__(self, max_bytes=512 * 2**20, cache_directory=None, backend=None):
+        self.max_bytes = max_bytes
+        self.cache_directory = cache_directory
+        self.backend = backend
+        self.scenes = OrderedDict()
+        self.dependencies = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        """int: The total size of the cached scenes in bytes."""
+        return sum(scene.nbytes for _, scene in self.scenes.values())
+
+    def signature(self, path):
+        """Lists the modification times and sizes of a scene file and the mesh and texture files it references.
+
+        Args:
+            path (str): The path of the scene description or bundle.
+
+        Returns:
+            tuple: The (path, mtime, size) entries of all files the scene is loaded from.
+        """
+        status = os.stat(path)
+        entry = (path, status.st_mtime_ns, status.st_size)
+        if path.endswith('.ptb'):
+            return (entry,)
+
+        # Parse the description only when it changed, since this runs for every tile a worker renders
+        if self.dependencies.get(path, (None,))[0] != entry:
+            description = load_scene_description(path)
+            self.dependencies[path] = (entry, [entry['file'] for entry in file_entries(description)] + texture_files(description))
+        statuses = [(file_path, os.stat(file_path)) for file_path in self.dependencies[path][1]]
+        return (entry,) + tuple((file_path, status.st_mtime_ns, status.st_size) for file_path, status in statuses)
+
+    def get(self, path):
+        """Returns a loaded scene, loading it if it is missing or out of date.
+
+        Args:
+            path (str): The path of a scene description or a compiled bundle.
+
+        Returns:
+            Scene: The loaded scene.
+        """
+        key = os.path.abspath(path)
+        signature = self.signature(key)
+        if key in self.scenes and self.scenes[key][0] == signature:
+            self.scenes.move_to_end(key)
+            self.hits += 1
+            return self.scenes[key][1]
+
+        # Load the scene and evict the least recently used scenes beyond the budget, always keeping the newest
+        self.misses += 1
+        scene = load_scene(key, self.cache_directory, self.backend)
+        self.scenes[key] = (signature, scene)
+        self.scenes.move_to_end(key)
+        while len(self.scenes) > 1 and self.nbytes > self.max_bytes:
+            self.scenes.popitem(last=False)
+        return scene
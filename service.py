@@ -0,0 +1,289 @@
+# Render Service
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from aiohttp import web
+from jobs import JobManager, JOB_QUEUED, JOB_RUNNING
+from sampler import SAMPLERS
+from scene import BUNDLE_MAGIC, file_entries, texture_files, read_scene_bundle
+
+MAX_IMAGE_PIXELS = 2**25
+
+# Scene Uploads
+
+def store_scene(directory, data):
+    """Validates an uploaded scene and stores it under its content hash.
+
+    Args:
+        directory (str): The directory of the uploaded scenes.
+        data (bytes): A compiled .ptb scene bundle or a self-contained JSON scene description.
+
+    Returns:
+        str: The scene id, the SHA-256 hash of the upload.
+
+    Raises:
+        ValueError: If the upload is neither a readable bundle nor a JSON description, or if it references files
+            outside the upload.
+    """
+    scene_id = hashlib.sha256(data).hexdigest()
+    extension = '.ptb' if data.startswith(BUNDLE_MAGIC) else '.json'
+    path = os.path.join(directory, scene_id + extension)
+    if os.path.exists(path):
+        return scene_id
+
+    # Check a description before it is written, since only its content is trusted
+    if extension == '.json':
+        description = json.loads(data)
+        if not isinstance(description, dict):
+            raise ValueError('A scene description must be a JSON object')
+        if file_entries(description) or texture_files(description):
+            raise ValueError('Uploaded scene descriptions cannot reference mesh or texture files')
+
+    # Write under a temporary name and check a bundle before it becomes visible to the workers
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as scene_file:
+        scene_file.write(data)
+    try:
+        if extension == '.ptb':
+            metadata = read_scene_bundle(temporary_path)[1]
+            if metadata.get('streamed_geometry') or metadata.get('textures'):
+                raise ValueError('Uploaded scene bundles cannot reference streamed geometry or textures')
+        os.replace(temporary_path, path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+    return scene_id
+
+def find_scene(directory, scene_id):
+    """Returns the path of an uploaded scene, or None if no scene with that id was uploaded."""
+    if len(scene_id) != 64 or not all(character in '0123456789abcdef' for character in scene_id):
+        return None
+    for extension in ('.ptb', '.json'):
+        path = os.path.join(directory, scene_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+def parse_settings(body):
+    """Checks the render settings of a job request.
+
+    Args:
+        body (dict): The decoded JSON request with a 'scene' id, 'image_width' and 'image_height', and optional
+            'camera', 'samples_per_pixel', 'depth', 'seed', 'sampler' and 'priority' entries.
+
+    Returns:
+        dict: The JobManager.submit arguments except the scene path.
+
+    Raises:
+        ValueError: If a setting is missing or out of range, or if the image has more than MAX_IMAGE_PIXELS
+            pixels, since the job allocates its image when it is submitted.
+    """
+    settings = {
+        'image_width': body.get('image_width'),
+        'image_height': body.get('image_height'),
+        'camera': body.get('camera') or {},
+        'samples_per_pixel': body.get('samples_per_pixel', 1),
+        'depth': body.get('depth'),
+        'seed': body.get('seed', 0),
+        'sampler': body.get('sampler', 'sobol'),
+        'priority': body.get('priority', 0),
+    }
+    for name in ('image_width', 'image_height', 'samples_per_pixel'):
+        if not isinstance(settings[name], int) or not 0 < settings[name] <= 16384:
+            raise ValueError(f"'{name}' must be a positive integer")
+    if settings['image_width'] * settings['image_height'] > MAX_IMAGE_PIXELS:
+        raise ValueError(f"The image must not have more than {MAX_IMAGE_PIXELS} pixels")
+    for name in ('seed', 'priority'):
+        if not isinstance(settings[name], int):
+            raise ValueError(f"'{name}' must be an integer")
+    if settings['depth'] is not None and (not isinstance(settings['depth'], int) or settings['depth'] < 0):
+        raise ValueError("'depth' must be a non-negative integer")
+    if settings['sampler'] not in SAMPLERS:
+        raise ValueError(f"'sampler' must be one of {', '.join(SAMPLERS)}")
+    if not isinstance(settings['camera'], dict):
+        raise ValueError("'camera' must be an object")
+    return settings
+
+# Render Service
+
+class RenderService:
+    """An asyncio HTTP and WebSocket front end of a shared JobManager.
+
+    Clients upload scenes, submit render jobs and follow them over a WebSocket that streams every finished tile
+    and the progress. Tracing runs in the manager's worker processes and uploads are hashed and written on the
+    default thread pool, so the event loop only moves messages and stays responsive with many clients. Manager
+    callbacks arrive on its threads and are handed to the event loop with call_soon_threadsafe.
+
+    Routes:
+        POST /scenes: Uploads a .ptb bundle or a JSON description and returns its 'scene' id.
+        POST /jobs: Submits a job with the settings of parse_settings and returns its 'job_id'.
+        GET /jobs/{job_id}: Returns the state and progress of a job.
+        DELETE /jobs/{job_id}: Cancels a job.
+        GET /jobs/{job_id}/image: Returns the (H, W, 3) float32 image of an ended job as raw bytes.
+        GET /jobs/{job_id}/stream: A WebSocket that sends a JSON 'tile' message with the tile bounds followed by
+            the binary (H, W, 3) little-endian float32 colors of the tile, a JSON 'progress' message after every
+            tile, and a final JSON 'end' message with the job state.
+
+    Args:
+        directory (str): The directory the uploaded scenes are stored in.
+        manager (JobManager): The manager running the jobs. create_app sets it while the application runs.
+        max_jobs (int): The number of jobs whose results are kept. The oldest ended jobs are dropped first.
+    """
+
+    def __init__(self, directory, manager=None, max_jobs=64):
+        self.directory = directory
+        self.manager = manager
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def routes(self):
+        """Returns the route table of the service."""
+        return [
+            web.post('/scenes', self.upload_scene),
+            web.post('/jobs', self.submit_job),
+            web.get('/jobs/{job_id}', self.job_status),
+            web.delete('/jobs/{job_id}', self.cancel_job),
+            web.get('/jobs/{job_id}/image', self.job_image),
+            web.get('/jobs/{job_id}/stream', self.stream_job),
+        ]
+
+    def job(self, request):
+        """Returns the job of a request's 'job_id', raising a 404 error if it is unknown."""
+        try:
+            return self.jobs[int(request.match_info['job_id'])]
+        except (KeyError, ValueError):
+            raise web.HTTPNotFound(text='Unknown render job')
+
+    def status(self, job):
+        """Returns the JSON state and progress of a job."""
+        return dict(job.progress.snapshot(), job_id=job.job_id, state=job.state, error=str(job.error) if job.error else None)
+
+    async def upload_scene(self, request):
+        data = await request.read()
+        try:
+            scene_id = await asyncio.get_running_loop().run_in_executor(None, store_scene, self.directory, data)
+        except ValueError as error:
+            raise web.HTTPBadRequest(text=str(error))
+        return web.json_response({'scene': scene_id}, status=201)
+
+    async def submit_job(self, request):
+        try:
+            body = await request.json()
+            if not isinstance(body, dict):
+                raise ValueError('The request must be a JSON object')
+            settings = parse_settings(body)
+        except ValueError as error:
+            raise web.HTTPBadRequest(text=str(error))
+        scene_path = find_scene(self.directory, str(body.get('scene', '')))
+        if scene_path is None:
+            raise web.HTTPNotFound(text='Unknown scene')
+
+        # Forget the oldest ended jobs beyond the limit
+        job = self.manager.submit(scene_path, **settings)
+        self.jobs[job.job_id] = job
+        for job_id in [job_id for job_id, old_job in self.jobs.items() if old_job.finished.is_set()][:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+        return web.json_response(self.status(job), status=201)
+
+    async def job_status(self, request):
+        return web.json_response(self.status(self.job(request)))
+
+    async def cancel_job(self, request):
+        job = self.job(request)
+        self.manager.cancel(job.job_id)
+        return web.json_response(self.status(job))
+
+    async def job_image(self, request):
+        job = self.job(request)
+        if job.state in (JOB_QUEUED, JOB_RUNNING):
+            raise web.HTTPConflict(text=f'Render job {job.job_id} is still {job.state}')
+        height, width = job.image.shape[:2]
+        return web.Response(body=job.image.astype('<f4').tobytes(), content_type='application/octet-stream',
+                            headers={'X-Image-Width': str(width), 'X-Image-Height': str(height)})
+
+    async def stream_job(self, request):
+        job = self.job(request)
+        socket = web.WebSocketResponse(heartbeat=30)
+        await socket.prepare(request)
+
+        # Hand the manager's callbacks to the event loop
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        on_tile = lambda tile, color: loop.call_soon_threadsafe(events.put_nowait, ('tile', tile, color))
+        on_end = lambda state: loop.call_soon_threadsafe(events.put_nowait, ('end', state, None))
+
+        # Replay the tiles finished so far and subscribe in one step. JobManager.finish_tile records a tile and picks
+        # its listeners under the same lock, so every tile arrives exactly once
+        with self.manager.condition:
+            with job.progress.lock:
+                finished_tiles = list(job.progress.finished)
+            for x0, y0, x1, y1 in finished_tiles:
+                events.put_nowait(('tile', (x0, y0, x1, y1), job.image[y0:y1, x0:x1].copy()))
+            if job.finished.is_set():
+                events.put_nowait(('end', job.state, None))
+            else:
+                job.add_tile_listener(on_tile)
+                job.add_end_listener(on_end)
+
+        try:
+            while True:
+                event, value, color = await events.get()
+                if event == 'end':
+                    await socket.send_json(dict(self.status(job), type='end', state=value))
+                    break
+                await socket.send_json({'type': 'tile', 'tile': list(value), 'shape': list(color.shape)})
+                await socket.send_bytes(color.astype('<f4').tobytes())
+                await socket.send_json(dict(self.status(job), type='progress'))
+        except ConnectionResetError:
+            pass
+        finally:
+            with self.manager.condition:
+                if on_tile in job.tile_listeners:
+                    job.tile_listeners.remove(on_tile)
+                if on_end in job.end_listeners:
+                    job.end_listeners.remove(on_end)
+            await socket.close()
+        return socket
+
+def create_app(directory, processes=None, max_running_jobs=2, tile_size=64, max_upload_bytes=1024 * 2**20,
+               texture_cache_bytes=256 * 2**20):
+    """Creates the web application of a render service whose JobManager lives as long as the application.
+
+    Args:
+        directory (str): The directory the uploaded scenes are stored in.
+        processes (int): The number of worker processes. Defaults to the CPU count.
+        max_running_jobs (int): The number of jobs rendered concurrently.
+        tile_size (int): The edge length of the streamed tiles in pixels.
+        max_upload_bytes (int): The largest accepted request body.
+        texture_cache_bytes (int): The memory budget of every worker's decoded texture tiles.
+
+    Returns:
+        web.Application: The application, ready for web.run_app or aiohttp's test client.
+    """
+    service = RenderService(directory)
+    app = web.Application(client_max_size=max_upload_bytes)
+    app.router.add_routes(service.routes())
+
+    async def job_manager(app):
+        service.manager = JobManager(processes, max_running_jobs, tile_size=tile_size,
+                                     texture_cache_bytes=texture_cache_bytes)
+        yield
+        await asyncio.get_running_loop().run_in_executor(None, service.manager.close)
+
+    app.cleanup_ctx.append(job_manager)
+    return app
+
+def run_service(directory, host='127.0.0.1', port=8765, **options):
+    """Serves renders until interrupted. Binds to localhost by default, since the service has no authentication.
+
+    Args:
+        directory (str): The directory the uploaded scenes are stored in.
+        host (str): The interface to listen on.
+        port (int): The port to listen on.
+        **options: Further create_app arguments.
+    """
+    web.run_app(create_app(directory, **options), host=host, port=port)
@@ -0,0 +1,31 @@
+import json
+import os
+import sys
+import pytest
+
+# The modules live at the repository root and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENE = {
+    'camera': {'position': [0, 1, 5], 'direction': [0, 0, -1], 'fov': 1.0, 'width': 32, 'height': 24},
+    'settings': {'max_depth': 2},
+    'materials': {'red': {'color': [0.9, 0.1, 0.1]}, 'floor': {'color': [0.8, 0.8, 0.8], 'reflection_coefficient': 0.2}},
+    'lights': [{'type': 'point', 'position': [2, 5, 3], 'color': [50, 50, 50]}],
+    'objects': [
+        {'type': 'sphere', 'position': [0, 1, 0], 'radius': 1, 'material': 'red'},
+        {'type': 'plane', 'position': [0, 0, 0], 'normal': [0, 1, 0], 'material': 'floor'},
+        {'type': 'cube', 'position': [2.5, 0.5, -1], 'size': 1, 'material': 'red'},
+    ],
+}
+
+@pytest.fixture
+def scene_description():
+    """A small self-contained scene description."""
+    return json.loads(json.dumps(SCENE))
+
+@pytest.fixture
+def scene_path(tmp_path, scene_description):
+    """The path of the small scene written as a JSON file."""
+    path = tmp_path / 'scene.json'
+    path.write_text(json.dumps(scene_description))
+    return str(path)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from backend import NumpyBackend, cross_check_backend, get_backend
+from core import render_tile
+from scene import load_scene
+
+pytest.importorskip('numba')
+
+def test_kernels_match_the_reference():
+    for kernel, difference in cross_check_backend(get_backend('numba')).items():
+        assert difference < 1e-6, kernel
+
+def test_renders_match_between_backends(scene_path):
+    images = []
+    for name in ('numpy', 'numba'):
+        scene = load_scene(scene_path, backend=get_backend(name))
+        camera = scene.camera
+        images.append(render_tile(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, 2, samples_per_pixel=2)['color'])
+    np.testing.assert_allclose(images[0], images[1], atol=1e-4)
+
+def test_deep_bvh_traversal():
+    # A chain of 200 levels, each with a leaf holding one triangle and the rest of the chain
+    count = 200
+    triangles = np.array([[[i, -1, -1], [i, 1, -1], [i, 0, 1]] for i in range(count)], dtype=np.float32)
+    bounds, children, ranges = [], [], []
+    for i in range(count):
+        internal, leaf = len(bounds), len(bounds) + 1
+        bounds += [[[i, -1, -1], [count, 1, 1]], [[i, -1, -1], [i, 1, 1]]]
+        children += [[leaf, leaf + 1 if i < count - 1 else -1], [-1, -1]]
+        ranges += [[0, 0], [i, 1]]
+    children[-2] = [-1, -1]
+    ranges[-2] = [count - 1, 1]
+    bvh = {'bounds': np.array(bounds, dtype=np.float32), 'children': np.array(children, dtype=np.int32),
+           'ranges': np.array(ranges, dtype=np.int32), 'indices': np.arange(count, dtype=np.int32)}
+
+    # Rays entering from the far end hit the last triangle after descending the whole chain
+    rng = np.random.default_rng(0)
+    origins = np.column_stack((np.full(64, count + 5.0), rng.uniform(-0.2, 0.2, (64, 2))))
+    directions = np.tile([-1.0, 0, 0], (64, 1))
+    spheres = np.zeros((0, 4), dtype=np.float32)
+    numba_backend = get_backend('numba')
+    t, primitive = numba_backend.traverse_bvh(origins, directions, np.full(64, np.inf), bvh, spheres, triangles)
+    reference_t, reference_primitive = NumpyBackend().traverse_bvh(origins, directions, np.full(64, np.inf), bvh, spheres, triangles)
+    np.testing.assert_array_equal(primitive, reference_primitive)
+    np.testing.assert_allclose(t, reference_t)
+    assert (primitive == count - 1).all() and numba_backend.stack_size(bvh['children']) == count + 1
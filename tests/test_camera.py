@@ -0,0 +1,25 @@
+import numpy as np
+from camera import apply_thin_lens, sample_concentric_disk
+
+def test_concentric_disk_stays_on_the_unit_disk():
+    points = sample_concentric_disk(np.random.default_rng(0).random((4096, 2)))
+    assert np.all(np.linalg.norm(points, axis=1) <= 1 + 1e-12)
+    np.testing.assert_allclose(sample_concentric_disk(np.array([[0.5, 0.5]])), [[0, 0]])
+
+def test_thin_lens_rays_converge_on_the_plane_of_focus():
+    forward, right, up = np.array([0.0, 0, -1]), np.array([1.0, 0, 0]), np.array([0.0, 1, 0])
+    pinhole = np.array([[0.1, -0.2, -1.0]]) / np.linalg.norm([0.1, -0.2, -1.0])
+    origins, directions = np.zeros((256, 3)), np.repeat(pinhole, 256, axis=0)
+    lens_samples = np.random.default_rng(1).random((256, 2))
+    lens_origins, lens_directions = apply_thin_lens(origins, directions, forward, right, up, lens_samples, 0.2, 4.0)
+
+    # Origins spread over the aperture in the lens plane, and every ray meets the pinhole ray at the focus distance
+    assert np.all(np.linalg.norm(lens_origins, axis=1) <= 0.2 + 1e-12) and np.allclose(lens_origins @ forward, 0)
+    np.testing.assert_allclose(np.linalg.norm(lens_directions, axis=1), 1)
+    focus_points = lens_origins + lens_directions * (4.0 / (lens_directions @ forward))[:, None]
+    np.testing.assert_allclose(focus_points, np.repeat(pinhole * 4.0 / (pinhole @ forward), 256, axis=0), atol=1e-12)
+
+    # A closed aperture leaves the pinhole rays unchanged
+    pinhole_origins, pinhole_directions = apply_thin_lens(origins, directions, forward, right, up, lens_samples, 0.0, 4.0)
+    np.testing.assert_allclose(pinhole_origins, origins)
+    np.testing.assert_allclose(pinhole_directions, directions)
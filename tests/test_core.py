@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from core import PathBuffers, intersect_rays, pyramid_pixels, render_tile, sort_rays, split_tiles, upsample_edge_aware, PYRAMID_STRIDES
+from scene import load_scene
+
+def render(scene, depth=3, **options):
+    camera = scene.camera
+    return render_tile(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, depth, **options)
+
+def test_sort_rays_groups_octants_and_nearby_origins():
+    rng = np.random.default_rng(0)
+    origins, directions = rng.uniform(-1, 1, (500, 3)), rng.normal(size=(500, 3))
+    order = sort_rays(origins, directions)
+    np.testing.assert_array_equal(np.sort(order), np.arange(500))
+    octants = ((directions[:, 0] < 0) | ((directions[:, 1] < 0) << 1) | ((directions[:, 2] < 0) << 2))[order]
+    assert np.all(np.diff(octants) >= 0)
+    assert len(sort_rays(origins[:0], directions[:0])) == 0
+
+def test_coherence_sorting_keeps_the_image_and_counts_the_sorted_rays(scene_path):
+    scene = load_scene(scene_path)
+
+    # Hits are scattered back to the original ray order
+    rng = np.random.default_rng(1)
+    origins = rng.uniform(-2, 2, (300, 3)) + [0, 2, 3]
+    directions = rng.normal(size=(300, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    unsorted, coherent = intersect_rays(scene, origins, directions), intersect_rays(scene, origins, directions, coherence_sorting=True)
+    for name in ('t', 'primitive', 'material', 'normal'):
+        np.testing.assert_array_equal(coherent[name], unsorted[name])
+
+    # Whole renders match, and only the sorted render counts the secondary and shadow rays it sorted
+    unsorted_stats, coherent_stats = {}, {}
+    image = render(scene, samples_per_pixel=2, stats=unsorted_stats)['color']
+    np.testing.assert_array_equal(render(scene, samples_per_pixel=2, coherence_sorting=True, stats=coherent_stats)['color'], image)
+    assert 'sorted_rays' not in unsorted_stats
+    assert coherent_stats['sorted_rays'] > 32 * 24 * 2 and coherent_stats['sort_time'] > 0
+    assert coherent_stats['node_tests'] == unsorted_stats['node_tests'] > 0
+
+def test_path_buffers_reset_and_compact_in_place():
+    buffers = PathBuffers(8)
+    assert buffers.nbytes == PathBuffers.footprint(8)
+    with pytest.raises(ValueError):
+        buffers.reset(np.zeros((9, 3)), np.zeros((9, 3)))
+
+    # A reset fills the live rows and the per-path results of the batch
+    origins, directions = np.arange(18.0).reshape(6, 3), np.tile([0.0, 0, 1], (6, 1))
+    buffers.reset(origins, directions, background=(0.5, 0.5, 0.5), cone_spread=0.01)
+    assert buffers.count == buffers.path_count == 6
+    np.testing.assert_array_equal(buffers['origins'], origins)
+    np.testing.assert_array_equal(buffers['path_ids'], np.arange(6))
+    assert np.all(buffers['t_max'] == np.inf) and np.all(buffers['throughput'] == 1) and np.all(buffers['albedo'] == 0.5)
+    np.testing.assert_allclose(buffers['cones'], np.tile([0, 0.01], (6, 1)))
+
+    # Compaction keeps the order of the live rays, swaps the storage instead of allocating and leaves the paths alone
+    storage = {id(array) for fields in (buffers.rays, buffers.spare_rays) for array in fields.values()}
+    buffers['radiance'][:] = 1
+    buffers.compact(np.array([True, False, True, True, False, False]))
+    assert buffers.count == 3 and buffers.path_count == 6
+    np.testing.assert_array_equal(buffers['path_ids'], [0, 2, 3])
+    np.testing.assert_array_equal(buffers['origins'], origins[[0, 2, 3]])
+    assert {id(array) for fields in (buffers.rays, buffers.spare_rays) for array in fields.values()} == storage
+    assert np.all(buffers['radiance'] == 1) and len(buffers['radiance']) == 6
+    buffers.compact(np.array([False, True, False]))
+    np.testing.assert_array_equal(buffers['path_ids'], [2])
+
+def test_render_reports_the_path_buffers_of_its_largest_tile(scene_path):
+    scene = load_scene(scene_path)
+    stats = {}
+    for tile in split_tiles(32, 24, 16):
+        render(scene, 1, tile=tile, samples_per_pixel=2, stats=stats)
+    assert stats['path_buffer_bytes'] == PathBuffers.footprint(16 * 16)
+
+def test_pyramid_levels_cover_every_pixel_once():
+    for width, height in ((32, 24), (37, 23)):
+        levels = [pyramid_pixels(width, height, stride, coarser) for stride, coarser in zip(PYRAMID_STRIDES, (None,) + PYRAMID_STRIDES[:-1])]
+        np.testing.assert_array_equal(np.sort(np.concatenate(levels)), np.arange(width * height))
+
+        # Listing a level tile by tile gives the same pixels
+        for stride, coarser, level in zip(PYRAMID_STRIDES, (None,) + PYRAMID_STRIDES[:-1], levels):
+            tiled = [pyramid_pixels(width, height, stride, coarser, tile) for tile in split_tiles(width, height, 5)]
+            np.testing.assert_array_equal(np.sort(np.concatenate(tiled)), np.sort(level))
+
+def test_pyramid_first_pass_equals_a_one_sample_render(scene_path):
+    scene = load_scene(scene_path)
+    full = render(scene, 2, seed=3)
+    assembled = {name: np.zeros_like(full[name]) for name in ('color', 'normal', 'depth')}
+    for stride, coarser in zip(PYRAMID_STRIDES, (None,) + PYRAMID_STRIDES[:-1]):
+        pixels = pyramid_pixels(32, 24, stride, coarser)
+        level = render(scene, 2, seed=3, pixels=pixels)
+        for name, image in assembled.items():
+            image.reshape(-1, *image.shape[2:])[pixels] = level[name]
+    for name, image in assembled.items():
+        np.testing.assert_array_equal(image, full[name])
+
+def test_upsampling_keeps_level_pixels_and_does_not_blur_across_edges():
+    # A color ramp on one flat surface is filled in bilinearly, and the rendered pixels are kept
+    y, x = np.mgrid[0:9, 0:13]
+    color = np.repeat((x + 2 * y)[..., None], 3, axis=2).astype(float)
+    normal, depth = np.tile([0.0, 0, 1], (9, 13, 1)), np.ones((9, 13))
+    sparse = np.where(((y % 4 == 0) & (x % 4 == 0))[..., None], color, 0)
+    filled = upsample_edge_aware(sparse, normal, depth, 4)
+    np.testing.assert_allclose(filled[::4, ::4], color[::4, ::4])
+    np.testing.assert_allclose(filled, color, atol=1e-9)
+
+    # A near and a far surface keep their own colors on both sides of the silhouette
+    depth = np.where(x < 6, 1.0, 10.0)
+    sparse = np.where(((y % 4 == 0) & (x % 4 == 0))[..., None], np.where(x < 6, 1.0, 0.0)[..., None], 0)
+    filled = upsample_edge_aware(sparse, normal, depth, 4)
+    assert np.all(np.isin(np.round(filled, 6), [0, 1]))
@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+from core import render_tile, GBufferCache
+from scene import load_scene
+
+def write_scene(directory, name, description):
+    """Writes a scene description and returns its path."""
+    path = directory / name
+    path.write_text(json.dumps(description))
+    return str(path)
+
+def test_light_edit_reuses_hits_of_every_pass(tmp_path, scene_description):
+    scene = load_scene(write_scene(tmp_path, 'scene.json', scene_description))
+    camera = scene.camera
+    arguments = (camera['position'], camera['direction'], camera['fov'], 32, 24)
+    cache, stats = GBufferCache(), {}
+    for seed in range(3):
+        render_tile(*arguments, scene, 2, tile=(0, 0, 16, 24), seed=seed, gbuffer_cache=cache, stats=stats)
+
+    # Passes with their own seeds share the view, so all of them are reused after a light edit
+    scene_description['lights'][0]['color'] = [20, 40, 60]
+    edited = load_scene(write_scene(tmp_path, 'edited.json', scene_description))
+    for seed in range(3):
+        cached = render_tile(*arguments, edited, 2, tile=(0, 0, 16, 24), seed=seed, gbuffer_cache=cache, stats=stats)['color']
+        traced = render_tile(*arguments, edited, 2, tile=(0, 0, 16, 24), seed=seed)['color']
+        np.testing.assert_allclose(cached, traced, atol=1e-4)
+    assert stats['gbuffer_hits'] == 3 and stats['gbuffer_misses'] == 3
+
+def test_full_cache_keeps_the_first_passes(scene_path):
+    scene = load_scene(scene_path)
+    camera = scene.camera
+    cache = GBufferCache()
+    render_tile(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, 1, gbuffer_cache=cache)
+    cache.max_bytes = cache.nbytes
+    stats = {}
+    for seed in range(1, 3):
+        render_tile(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, 1, seed=seed, gbuffer_cache=cache)
+    render_tile(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, 1, gbuffer_cache=cache, stats=stats)
+    assert stats['gbuffer_hits'] == 1 and len(cache.entries) == 1
+
+def test_render_worker_uses_the_cache(scene_path):
+    pytest.importorskip('PyQt5')
+    from gui import RenderWorker
+    scene = load_scene(scene_path)
+    worker = RenderWorker(scene, 32, 24, depth=1)
+    worker.render_view(scene.camera, (0, 0, 32, 24), 32, 24, 0)
+    assert worker.gbuffer_cache.entries
@@ -0,0 +1,37 @@
+import pytest
+
+from core import PYRAMID_STRIDES
+from scene import load_scene
+
+pytest.importorskip('PyQt5')
+from gui import RenderWorker, PREVIEW_SCALES
+
+def test_preview_scale_fits_the_frame_budget(scene_path):
+    worker = RenderWorker(load_scene(scene_path), 64, 48, frame_budget=0.1)
+    assert worker.preview_scale() == PREVIEW_SCALES[-1]
+
+    # The smallest divisor whose frame fits the budget is picked, and the coarsest when none fits
+    worker.pixel_cost = 0.099 / (64 * 48)
+    assert worker.preview_scale() == PREVIEW_SCALES[0]
+    for scale in PREVIEW_SCALES[1:]:
+        worker.pixel_cost = 0.099 / (64 * 48 / scale**2)
+        assert worker.preview_scale() == scale
+    worker.pixel_cost *= 100
+    assert worker.preview_scale() == PREVIEW_SCALES[-1]
+
+def test_cancelled_generation_emits_no_more_tiles(scene_path):
+    scene = load_scene(scene_path)
+    worker = RenderWorker(scene, 32, 24, depth=1, tile_size=8, max_samples=4)
+    generation = worker.submit(scene.camera)
+    emitted, frames = [], []
+
+    # Move the camera when the third tile of the second pass arrives, after the pyramid levels of the first pass
+    def tile_finished(tile_generation, tile, color):
+        emitted.append(tile_generation)
+        if len(emitted) == len(PYRAMID_STRIDES) + 3:
+            worker.submit(dict(scene.camera, fov=0.5), moving=True)
+    worker.tile_finished.connect(tile_finished)
+    worker.frame_finished.connect(lambda frame_generation, samples, seconds: frames.append(samples))
+    worker.render_progressive(generation, worker.pending[1])
+    assert len(emitted) == len(PYRAMID_STRIDES) + 3 and frames == [1]
+    assert worker.cancelled(generation) and worker.pending[0] == generation + 1
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+from core import render_tile
+from imaging import denoise_image
+from scene import load_scene
+
+def test_denoise_one_sample_render(scene_path):
+    scene = load_scene(scene_path)
+    camera = scene.camera
+    arguments = (camera['position'], camera['direction'], camera['fov'], 48, 36, scene, 2)
+    reference = render_tile(*arguments, samples_per_pixel=32)['color']
+    buffers = render_tile(*arguments, samples_per_pixel=1, seed=5)
+    assert not buffers['variance'].any()
+
+    # The unknown variance of one sample falls back to the spatial estimate instead of disabling the filter
+    error = lambda image: np.sqrt(np.mean((image - reference)**2))
+    denoised = denoise_image(buffers['color'], buffers['normal'], buffers['albedo'], buffers['depth'], buffers['variance'], processes=1)
+    np.testing.assert_array_equal(denoised, denoise_image(buffers['color'], buffers['normal'], buffers['albedo'], buffers['depth'], processes=1))
+    assert error(denoised) < 0.7 * error(buffers['color'])
@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+
+from core import render_tile
+from irradiance import IrradianceCache
+from jobs import JobManager
+from scene import load_scene
+
+def scaled(description, factor):
+    """Scales the camera, lights and objects of a scene description."""
+    description = json.loads(json.dumps(description))
+    for entry in [description['camera']] + description['lights'] + description['objects']:
+        for name in ('position', 'radius', 'size'):
+            if name in entry:
+                entry[name] = (np.asarray(entry[name]) * factor).tolist()
+    return description
+
+def render(scene, irradiance_cache, depth=2, samples_per_pixel=1, stats=None):
+    camera = scene.camera
+    return render_tile(camera['position'], camera['direction'], camera['fov'], 24, 18, scene, depth, samples_per_pixel=samples_per_pixel,
+                       stats=stats, irradiance_cache=irradiance_cache)
+
+def test_spacing_follows_the_scene(tmp_path, scene_description):
+    scenes = []
+    for factor in (1, 100):
+        (tmp_path / f'scene{factor}.json').write_text(json.dumps(scaled(scene_description, factor)))
+        scenes.append(load_scene(str(tmp_path / f'scene{factor}.json')))
+
+    reused, fresh = IrradianceCache(), IrradianceCache()
+    render(scenes[0], reused)
+    small_spacing = reused.min_spacing, reused.max_spacing
+    render(scenes[1], reused)
+    render(scenes[1], fresh)
+    assert (reused.min_spacing, reused.max_spacing) == (fresh.min_spacing, fresh.max_spacing)
+    np.testing.assert_allclose(reused.max_spacing, 100 * small_spacing[1], rtol=0.05)
+
+    # Explicit spacing is kept across scenes
+    explicit = IrradianceCache(min_spacing=0.5, max_spacing=2.0)
+    for scene in scenes:
+        render(scene, explicit)
+        assert (explicit.min_spacing, explicit.max_spacing) == (0.5, 2.0)
+
+def test_cache_keeps_the_render_depth(scene_path):
+    scene = load_scene(scene_path)
+
+    # Paths without bounces left never look up or create records
+    stats = {}
+    uncached, cached = render(scene, None, 0, 16)['color'], render(scene, IrradianceCache(), 0, 16, stats)['color']
+    np.testing.assert_array_equal(uncached, cached)
+    assert stats.get('irradiance_records', 0) == 0
+
+    # One bounce of cached indirect light matches one traced bounce, and stays below two bounces
+    uncached, cached = render(scene, None, 1, 16)['color'], render(scene, IrradianceCache(), 1, 16)['color']
+    np.testing.assert_allclose(cached.mean(), uncached.mean(), rtol=0.01)
+    assert cached.mean() > 1.05 * render(scene, None, 0, 16)['color'].mean()
+
+    # Records estimated for shallower paths are not reused by deeper ones
+    shared = IrradianceCache()
+    render(scene, shared, 1, 4)
+    reused, fresh = render(scene, shared, 2, 4)['color'], render(scene, IrradianceCache(), 2, 4)['color']
+    np.testing.assert_allclose(reused.mean(), fresh.mean(), rtol=0.01)
+    assert set(np.unique(shared.depths)) == {1, 2}
+
+def test_scene_setting_enables_the_cache_in_jobs(tmp_path, scene_description):
+    scene_description['settings']['irradiance_cache'] = True
+    (tmp_path / 'cached.json').write_text(json.dumps(scene_description))
+    assert load_scene(str(tmp_path / 'cached.json')).irradiance_caching
+    with JobManager(processes=1, tile_size=16) as manager:
+        image = manager.submit(str(tmp_path / 'cached.json'), 32, 24).wait(60)
+    assert np.isfinite(image).all() and image.max() > 0
+
+def test_spacing_covers_planes_instances_and_streamed_chunks(tmp_path, scene_description):
+    room = [{'type': 'plane', 'position': [axis * side for axis in offset], 'normal': [-axis * side for axis in offset]}
+            for offset in np.eye(3).tolist() for side in (-5, 5)]
+    scene_description['objects'] = room + [{'type': 'sphere', 'position': [0, 0, 0], 'radius': 0.1}]
+    scene_description['meshes'] = {'slope': {'vertices': [[-0.5, -0.5, -0.5], [0.5, -0.5, 0.5], [0.5, 0.5, 0.5]], 'faces': [[0, 1, 2]]}}
+    big_box = {'type': 'instance', 'mesh': 'slope', 'transform': np.diag([16, 16, 16, 1]).tolist()}
+    streamed_box = {'type': 'cube', 'position': [0, 0, 0], 'size': 24, 'streamed': True}
+    expected = {'room': 10 * np.sqrt(3), 'instanced': 16 * np.sqrt(3), 'streamed': 24 * np.sqrt(3)}
+
+    for name, extra in (('room', []), ('instanced', [big_box]), ('streamed', [streamed_box])):
+        description = json.loads(json.dumps(scene_description))
+        description['objects'] += extra
+        (tmp_path / f'{name}.json').write_text(json.dumps(description))
+        scene = load_scene(str(tmp_path / f'{name}.json'))
+        irradiance_cache = IrradianceCache()
+        irradiance_cache.use_scene(scene)
+        np.testing.assert_allclose(irradiance_cache.max_spacing, 0.1 * expected[name], rtol=1e-5)
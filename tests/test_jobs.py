@@ -0,0 +1,32 @@
+import numpy as np
+
+from core import render_tile
+from jobs import JobManager
+from progress import estimate_render
+from scene import load_scene
+
+def test_depth_zero_after_rendering_in_process(scene_path):
+    # Render here first, so the workers start from a process whose thread pools have run
+    scene = load_scene(scene_path)
+    camera = scene.camera
+    direct = render_tile(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, 0)['color']
+    with JobManager(processes=1, tile_size=16) as manager:
+        image = manager.submit(scene_path, 32, 24, depth=0).wait(60)
+    np.testing.assert_allclose(image, direct, atol=1e-5)
+
+def test_empty_job_does_not_stop_the_dispatcher(scene_path):
+    with JobManager(processes=1, tile_size=16) as manager:
+        empty = manager.submit(scene_path, 0, 0)
+        assert empty.wait(10).shape == (0, 0, 3)
+        assert manager.dispatcher.is_alive()
+        assert manager.submit(scene_path, 16, 16, depth=1).wait(60).max() > 0
+
+def test_job_progress_shares_the_prediction_across_the_pool(scene_path):
+    scene = load_scene(scene_path)
+    camera = scene.camera
+    estimate = estimate_render(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, 1, tile_size=16, processes=2)
+    with JobManager(processes=2, tile_size=16) as manager:
+        job = manager.submit(scene_path, 32, 24, depth=1, estimate=estimate)
+        assert job.progress.processes == 2
+        job.wait(60)
+    assert job.progress.snapshot()['finished_units'] == 4
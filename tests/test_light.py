@@ -0,0 +1,118 @@
+import json
+import os
+import numpy as np
+import pytest
+
+from core import direct_lighting, intersect_rays
+from light import LightTable, compile_light_table
+from scene import load_scene
+
+def write_scene(scene_path, description):
+    """Writes a scene description next to the fixture scene and returns its path."""
+    path = os.path.join(os.path.dirname(scene_path), 'lights.json')
+    with open(path, 'w') as scene_file:
+        json.dump(description, scene_file)
+    return path
+
+def test_hdr_image_light_keeps_its_radiance(tmp_path, scene_description):
+    cv2 = pytest.importorskip('cv2')
+    cv2.imwrite(str(tmp_path / 'sky.hdr'), np.full((16, 32, 3), 8.0, dtype=np.float32))
+    scene_description['lights'] = [{'type': 'image', 'image': 'sky.hdr'}]
+    (tmp_path / 'sky.json').write_text(json.dumps(scene_description))
+    scene = load_scene(str(tmp_path / 'sky.json'))
+
+    normals = np.tile([0.0, 1.0, 0.0], (64, 1))
+    samples = np.random.default_rng(0).random((64, 2))
+    lights = scene.lights.evaluate_lights(np.zeros((64, 3)), normals, np.zeros(64, dtype=int), samples)
+    np.testing.assert_allclose(lights['radiance'], 8.0, rtol=0.02)
+
+def light_table(lights):
+    """Compiles a list of light entries into a LightTable."""
+    return LightTable(compile_light_table(lights))
+
+def irradiance(lights, points, normals, light_ids, samples=None):
+    """The unshadowed irradiance estimate radiance * cos / pdf of evaluate_lights."""
+    result = lights.evaluate_lights(points, normals, light_ids, samples)
+    cosine = np.maximum(0, np.einsum('ij,ij->i', normals, result['direction']))
+    return result['radiance'] * (cosine / result['pdf'])[:, None], result
+
+def test_point_and_directional_lights_match_the_per_type_formulas():
+    rng = np.random.default_rng(1)
+    points = rng.uniform(-1, 1, (32, 3))
+    normals = rng.normal(size=(32, 3))
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    lights = light_table([{'type': 'point', 'position': [0, 4, 1], 'color': [40, 20, 10]},
+                          {'type': 'directional', 'direction': [1, -2, 0], 'color': [2, 3, 4]}])
+
+    # The point light falls off with the inverse square of the distance over the full sphere
+    estimate, result = irradiance(lights, points, normals, np.zeros(32, dtype=int))
+    offsets = np.array([0, 4, 1]) - points
+    distance = np.linalg.norm(offsets, axis=1)
+    cosine = np.maximum(0, np.einsum('ij,ij->i', normals, offsets / distance[:, None]))
+    np.testing.assert_allclose(estimate, np.array([40, 20, 10]) * (cosine / (4 * np.pi * distance**2))[:, None], rtol=1e-6)
+    np.testing.assert_allclose(result['distance'], distance)
+
+    # The directional light arrives from its opposite direction at infinite distance
+    estimate, result = irradiance(lights, points, normals, np.ones(32, dtype=int))
+    direction = -np.array([1, -2, 0]) / np.sqrt(5)
+    np.testing.assert_allclose(result['direction'], np.tile(direction, (32, 1)), rtol=1e-6)
+    np.testing.assert_allclose(estimate, np.array([2, 3, 4]) * np.maximum(0, normals @ direction)[:, None], rtol=1e-6)
+    assert np.isinf(result['distance']).all()
+
+def test_spot_light_cone():
+    lights = light_table([{'type': 'spot', 'position': [0, 0, 0], 'direction': [0, -1, 0], 'color': [1, 1, 1],
+                           'inner_angle': 0.2, 'outer_angle': 0.4}])
+    angles = np.array([0.0, 0.1, 0.3, 0.5])
+    points = np.column_stack((np.sin(angles), -np.cos(angles), np.zeros(4)))
+    result = lights.evaluate_lights(points, -points, np.zeros(4, dtype=int))
+    point = 1 / (4 * np.pi)
+    cone = (np.cos(0.3) - np.cos(0.4)) / (np.cos(0.2) - np.cos(0.4))
+    np.testing.assert_allclose(result['radiance'][:, 0], [point, point, point * cone**2 * (3 - 2 * cone), 0], rtol=1e-5)
+
+def test_area_light_converges_to_the_small_light_limit():
+    # A small light far above a point delivers radiance * area * cos / distance**2
+    lights = light_table([{'type': 'area', 'position': [0, 5, 0], 'direction': [0, -1, 0], 'color': [3, 3, 3], 'size': [0.2, 0.1]}])
+    samples = np.random.default_rng(2).random((4096, 2))
+    points, normals = np.zeros((4096, 3)), np.tile([0.0, 1.0, 0.0], (4096, 1))
+    estimate, result = irradiance(lights, points, normals, np.zeros(4096, dtype=int), samples)
+    np.testing.assert_allclose(estimate.mean(axis=0), 3 * 0.02 / 25, rtol=1e-3)
+
+    # Points behind the light receive nothing
+    estimate, _ = irradiance(lights, points + [0, 10, 0], normals * -1, np.zeros(4096, dtype=int), samples)
+    assert not estimate.any()
+
+def test_environment_light_irradiance():
+    lights = light_table([{'type': 'environment', 'color': [0.5, 1, 2]}])
+    samples = np.random.default_rng(3).random((256, 2))
+    normals = np.tile([0.0, 0.0, 1.0], (256, 1))
+    estimate, result = irradiance(lights, np.zeros((256, 3)), normals, np.zeros(256, dtype=int), samples)
+    np.testing.assert_allclose(estimate, np.tile(np.pi * np.array([0.5, 1, 2]), (256, 1)), rtol=1e-6)
+    assert (result['direction'] @ [0, 0, 1] >= 0).all()
+
+def test_direct_lighting_matches_the_per_light_loop(scene_path, scene_description):
+    # The shadowed irradiance of the batched path against a loop over the point and directional lights
+    scene_description['lights'].append({'type': 'directional', 'direction': [-1, -1, -1], 'color': [1, 0.5, 0.25]})
+    scene = load_scene(write_scene(scene_path, scene_description))
+    rng = np.random.default_rng(4)
+    origins = np.tile([0.0, 1, 5], (256, 1))
+    directions = np.column_stack((rng.uniform(-0.5, 0.5, 256), rng.uniform(-0.5, 0.2, 256), -np.ones(256)))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    hit = intersect_rays(scene, origins, directions)
+    hits = hit['primitive'] >= 0
+    points, normals = hit['point'][hits], hit['normal'][hits]
+
+    expected = np.zeros((len(points), 3))
+    for light in scene_description['lights']:
+        if light['type'] == 'point':
+            offsets = np.array(light['position']) - points
+            distance = np.linalg.norm(offsets, axis=1)
+            towards, falloff = offsets / distance[:, None], 1 / (4 * np.pi * distance**2)
+        else:
+            distance = np.full(len(points), np.inf)
+            towards = np.tile(-np.array(light['direction']) / np.linalg.norm(light['direction']), (len(points), 1))
+            falloff = np.ones(len(points))
+        cosine = np.maximum(0, np.einsum('ij,ij->i', normals, towards))
+        shadow = intersect_rays(scene, points + normals * 1e-4, towards, t_max=distance)['primitive'] >= 0
+        expected += np.array(light['color']) * (cosine * falloff * ~shadow)[:, None]
+    np.testing.assert_allclose(direct_lighting(scene, points, normals), expected, rtol=1e-4, atol=1e-7)
+    assert expected.any() and not expected.all()
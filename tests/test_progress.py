@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import progress as progress_module
+from core import split_tiles
+from progress import RenderProgress, estimate_render, format_progress, render_tiles
+from scene import load_scene
+
+class Clock:
+    """A settable replacement for time.perf_counter."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def test_eta_starts_from_the_prediction_and_follows_the_measured_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(progress_module.time, 'perf_counter', clock)
+    predicted = {'a': 1.0, 'b': 3.0, 'c': 4.0}
+
+    # Before the first unit the prediction is shared by the workers, and without one the time is unknown
+    assert RenderProgress(predicted, predicted, processes=4).snapshot()['eta'] == 2.0
+    assert RenderProgress(predicted).snapshot()['eta'] is None
+
+    # Afterwards the remaining predicted cost is scaled by the measured throughput, here twice the prediction
+    progress = RenderProgress(predicted, predicted, processes=4)
+    snapshots = []
+    progress.add_listener(snapshots.append)
+    progress.start()
+    clock.now += 2.0
+    progress.update_progress('a', 2.0)
+    clock.now += 6.0
+    progress.update_progress('b', 6.0)
+    assert snapshots[-1]['fraction'] == 0.5 and snapshots[-1]['eta'] == pytest.approx(8.0)
+    assert snapshots[-1]['finished_units'] == 2 and snapshots[-1]['units_per_second'] == pytest.approx(0.25)
+
+    # A repeated unit counts once, and the clock stops with the last unit
+    progress.update_progress('b', 6.0)
+    clock.now += 8.0
+    progress.update_progress('c', 8.0)
+    clock.now += 50.0
+    assert progress.snapshot() == {'finished_units': 3, 'total_units': 3, 'fraction': 1.0, 'elapsed': 16.0, 'eta': 0.0,
+                                   'units_per_second': pytest.approx(3 / 16)}
+    assert len(snapshots) == 4
+
+def test_format_progress():
+    snapshot = {'finished_units': 9, 'total_units': 20, 'fraction': 0.45, 'eta': 3723.4}
+    assert format_progress(snapshot, width=20) == '[=========           ]  45.0% 9/20 ETA 1:02:03'
+    assert format_progress(dict(snapshot, fraction=1.0, eta=None), width=4) == '[====] 100.0% 9/20 ETA -:--:--'
+
+def test_estimate_render_covers_every_tile(scene_path):
+    scene = load_scene(scene_path)
+    camera = scene.camera
+    arguments = (camera['position'], camera['direction'], camera['fov'], 40, 24, scene, 1)
+    estimate = estimate_render(*arguments, samples_per_pixel=4, tile_size=16, pilot_scale=4, processes=2)
+    tiles = split_tiles(40, 24, 16)
+    assert list(estimate['tile_seconds']) == tiles and estimate['cost_map'].shape == (2, 3)
+    assert estimate['seconds'] == pytest.approx(estimate['cpu_seconds'] / 2) and estimate['cpu_seconds'] > 0
+    assert estimate['memory_bytes'] > scene.nbytes and estimate['pilot_seconds'] > 0
+
+    # Rendering with the tiles as progress units finishes with every unit counted
+    progress = RenderProgress(tiles, estimate['tile_seconds'], processes=1)
+    image = render_tiles(*arguments, tile_size=16, progress=progress)
+    assert image.shape == (24, 40, 3) and np.isfinite(image).all()
+    assert progress.snapshot()['fraction'] == 1.0 and progress.snapshot()['eta'] == 0.0
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from sampler import convergence_benchmark, generate_sample_block, generate_samples, DIMENSION_LENS, DIMENSION_PIXEL, SAMPLERS
+
+@pytest.mark.parametrize('sampler', SAMPLERS)
+def test_samples_are_deterministic_and_in_range(sampler):
+    pixel_ids = np.arange(100, 356)
+    samples = generate_samples(sampler, pixel_ids, 3, DIMENSION_PIXEL, 16, seed=7)
+    assert samples.shape == (256, 2) and np.all((samples >= 0) & (samples < 1))
+    np.testing.assert_array_equal(samples, generate_samples(sampler, pixel_ids, 3, DIMENSION_PIXEL, 16, seed=7))
+
+    # A pixel's samples do not depend on which other pixels share the block, so tiles can be rendered in any split
+    np.testing.assert_array_equal(samples[40:50], generate_samples(sampler, pixel_ids[40:50], 3, DIMENSION_PIXEL, 16, seed=7))
+
+@pytest.mark.parametrize('sampler', ['stratified', 'sobol'])
+def test_square_sample_counts_cover_every_stratum(sampler):
+    block = generate_sample_block(sampler, np.arange(64), DIMENSION_LENS, 16, seed=3)
+    strata = np.floor(block * 4).astype(int)
+    cells = strata[..., 1] * 4 + strata[..., 0]
+    assert all(sorted(pixel_cells) == list(range(16)) for pixel_cells in cells)
+
+def test_low_discrepancy_samplers_converge_faster_than_random():
+    errors = convergence_benchmark(sample_counts=(64,), pixel_count=1024)
+    assert errors['sobol'][0] < 0.5 * errors['random'][0]
+    assert errors['stratified'][0] < errors['random'][0] and errors['halton'][0] < errors['random'][0]
@@ -0,0 +1,140 @@
+import json
+import os
+
+import numpy as np
+
+import scene as scene_module
+from core import render_tile
+from scene import SceneCache, compile_scene, load_scene, read_scene_bundle, write_scene_bundle, BUNDLE_VERSION
+
+QUAD_OBJ = 'v -1 0 -1\nv 1 0 -1\nv 1 0 1\nv -1 0 1\nf 1 2 3 4\n'
+
+def wavy_mesh(size=12):
+    """An inline mesh of a rippled floor in front of the fixture scene's sphere."""
+    y, x = np.mgrid[0:size, 0:size]
+    vertices = np.column_stack((x.ravel() * 6 / (size - 1) - 3, 0.3 * np.sin(x.ravel()) + 0.5, y.ravel() * 4 / (size - 1) - 3))
+    corners = (y[:-1, :-1] * size + x[:-1, :-1]).ravel()
+    faces = np.concatenate((np.column_stack((corners, corners + 1, corners + size + 1)), np.column_stack((corners, corners + size + 1, corners + size))))
+    return {'type': 'mesh', 'vertices': vertices.tolist(), 'faces': faces.tolist(), 'material': 'floor'}
+
+def render(scene, stats=None):
+    camera = scene.camera
+    return render_tile(camera['position'], camera['direction'], camera['fov'], 32, 24, scene, 2, stats=stats)['color']
+
+def test_scene_cache_tracks_referenced_files(tmp_path, scene_description, monkeypatch):
+    (tmp_path / 'quad.obj').write_text(QUAD_OBJ)
+    scene_description['objects'].append({'type': 'mesh', 'file': 'quad.obj'})
+    path = tmp_path / 'scene.json'
+    path.write_text(json.dumps(scene_description))
+
+    # Repeated lookups of an unchanged scene only stat its files
+    parses = []
+    load_scene_description = scene_module.load_scene_description
+    monkeypatch.setattr(scene_module, 'load_scene_description', lambda *args: parses.append(args) or load_scene_description(*args))
+    cache = SceneCache()
+    first = cache.get(str(path))
+    for _ in range(5):
+        assert cache.get(str(path)) is first
+    assert cache.hits == 5 and len(parses) == 2
+
+    # Touching a referenced mesh reloads the scene without parsing the unchanged description again
+    status = os.stat(tmp_path / 'quad.obj')
+    os.utime(tmp_path / 'quad.obj', ns=(status.st_atime_ns, status.st_mtime_ns + 10**9))
+    assert cache.get(str(path)) is not first
+    assert cache.misses == 2 and len(parses) == 3
+
+def test_streamed_geometry_renders_like_resident_geometry(tmp_path, scene_description):
+    images = []
+    for streamed in (False, True):
+        description = json.loads(json.dumps(scene_description))
+        description['objects'].append(dict(wavy_mesh(), streamed=streamed))
+        description['settings']['chunk_triangles'] = 16
+        (tmp_path / f'streamed{streamed}.json').write_text(json.dumps(description))
+        scene = load_scene(str(tmp_path / f'streamed{streamed}.json'))
+        assert (scene.streamed_geometry is not None) == streamed
+        images.append(render(scene))
+    np.testing.assert_array_equal(images[0], images[1])
+
+def test_streamed_chunks_stay_within_the_memory_budget(tmp_path, scene_description):
+    scene_description['objects'].append(dict(wavy_mesh(), streamed=True))
+    scene_description['settings'].update({'chunk_triangles': 16, 'geometry_memory_budget': 4000})
+    (tmp_path / 'scene.json').write_text(json.dumps(scene_description))
+    scene = load_scene(str(tmp_path / 'scene.json'))
+    streamed = scene.streamed_geometry
+
+    # A budget of a few chunks evicts the least recently used ones and maps them in again when rays return
+    stats = {}
+    render(scene, stats)
+    chunk_count = len(streamed.index['chunk_bounds'])
+    assert 0 < streamed.nbytes <= 4000
+    assert stats['chunk_loads'] == streamed.loads > chunk_count
+    assert stats['chunk_evictions'] == streamed.evictions == streamed.loads - len(streamed.chunks)
+
+    # With room for every chunk, a second render loads nothing
+    streamed.memory_budget = 2**20
+    render(scene)
+    stats = {}
+    render(scene, stats)
+    assert stats['chunk_loads'] == stats['chunk_evictions'] == 0 and stats['chunk_batches'] > 0
+
+def test_instances_render_like_flattened_meshes(tmp_path, scene_description):
+    mesh = wavy_mesh()
+    angle = 0.4
+    transform = np.array([[np.cos(angle), 0, np.sin(angle), 0.3], [0, 1, 0, -0.2], [-np.sin(angle), 0, np.cos(angle), -0.5], [0, 0, 0, 1]])
+    transform = transform @ np.diag([0.6, 1.8, 0.9, 1])
+    vertices = np.asarray(mesh['vertices']) @ transform[:3, :3].T + transform[:3, 3]
+
+    # A non-uniform scale only keeps the normals right through the inverse transpose
+    images = []
+    for name, objects, meshes in (('flattened', [dict(mesh, vertices=vertices.tolist())], {}),
+                                  ('instanced', [{'type': 'instance', 'mesh': 'waves', 'transform': transform.tolist(), 'material': 'floor'}],
+                                   {'waves': {'vertices': mesh['vertices'], 'faces': mesh['faces']}})):
+        description = json.loads(json.dumps(scene_description))
+        description['objects'] += objects
+        description['meshes'] = meshes
+        (tmp_path / f'{name}.json').write_text(json.dumps(description))
+        images.append(render(load_scene(str(tmp_path / f'{name}.json'))))
+    np.testing.assert_allclose(images[0], images[1], atol=1e-5)
+
+def test_scene_bundle_round_trip(tmp_path, scene_description):
+    arrays = compile_scene(scene_description)
+    arrays['empty'] = np.zeros((0, 3), dtype=np.float32)
+    metadata = {'content_hash': 'abc', 'camera': scene_description['camera']}
+    write_scene_bundle(str(tmp_path / 'scene.ptb'), arrays, metadata)
+    read_arrays, read_metadata = read_scene_bundle(str(tmp_path / 'scene.ptb'))
+    assert read_metadata == metadata and list(read_arrays) == list(arrays)
+    for name, array in arrays.items():
+        assert read_arrays[name].dtype == array.dtype and not read_arrays[name].flags.writeable
+        np.testing.assert_array_equal(read_arrays[name], array)
+
+def test_load_scene_reuses_the_bundle_until_the_source_changes(tmp_path, scene_description, monkeypatch):
+    (tmp_path / 'quad.obj').write_text(QUAD_OBJ)
+    scene_description['objects'].append({'type': 'mesh', 'file': 'quad.obj'})
+    path = tmp_path / 'scene.json'
+    path.write_text(json.dumps(scene_description))
+    compiles = []
+    monkeypatch.setattr(scene_module, 'compile_scene', lambda description: compiles.append(1) or compile_scene(description))
+    cache_directory = tmp_path / '.pythtracer_cache'
+
+    # An unchanged source opens the cached bundle without compiling
+    first = load_scene(str(path))
+    second = load_scene(str(path))
+    assert len(compiles) == 1 and second.content_hash == first.content_hash
+    assert sorted(os.listdir(cache_directory)) == [first.content_hash + '.ptb']
+    np.testing.assert_array_equal(render(second), render(first))
+
+    # Editing the description or a referenced mesh file compiles a new bundle
+    scene_description['lights'][0]['color'] = [20, 20, 20]
+    path.write_text(json.dumps(scene_description))
+    edited = load_scene(str(path))
+    (tmp_path / 'quad.obj').write_text(QUAD_OBJ.replace('v -1 0 -1', 'v -2 0 -1'))
+    remeshed = load_scene(str(path))
+    assert len(compiles) == 3 and len({first.content_hash, edited.content_hash, remeshed.content_hash}) == 3
+
+    # A bundle of another format version is rebuilt in place
+    bundle_path = cache_directory / (remeshed.content_hash + '.ptb')
+    data = bytearray(bundle_path.read_bytes())
+    data[len(scene_module.BUNDLE_MAGIC):len(scene_module.BUNDLE_MAGIC) + 4] = np.array([BUNDLE_VERSION - 1], dtype='<u4').tobytes()
+    bundle_path.write_bytes(bytes(data))
+    load_scene(str(path))
+    assert len(compiles) == 4 and read_scene_bundle(str(bundle_path))[1]['content_hash'] == remeshed.content_hash
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+
+pytest.importorskip('aiohttp')
+from aiohttp import WSMsgType
+from aiohttp.test_utils import TestClient, TestServer
+from service import create_app, parse_settings, MAX_IMAGE_PIXELS
+
+async def stream_image(client, job_id, width, height):
+    """Assembles the streamed tiles of a job and counts every tile received."""
+    image = np.zeros((height, width, 3), dtype=np.float32)
+    received, tile = [], None
+    async with client.ws_connect(f'/jobs/{job_id}/stream') as socket:
+        async for message in socket:
+            if message.type == WSMsgType.BINARY:
+                x0, y0, x1, y1 = tile['tile']
+                image[y0:y1, x0:x1] = np.frombuffer(message.data, dtype='<f4').reshape(tile['shape'])
+                received.append(tuple(tile['tile']))
+            elif json.loads(message.data)['type'] == 'tile':
+                tile = json.loads(message.data)
+            elif json.loads(message.data)['type'] == 'end':
+                return image, received, json.loads(message.data)['state']
+
+def test_submit_and_stream(tmp_path, scene_description):
+    async def run():
+        app = create_app(str(tmp_path / 'uploads'), processes=2, tile_size=16)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/scenes', data=json.dumps(scene_description).encode())
+            assert response.status == 201
+            scene = (await response.json())['scene']
+            assert (await client.post('/jobs', json={'scene': scene})).status == 400
+            assert (await client.post('/jobs', json={'scene': '0' * 64, 'image_width': 8, 'image_height': 8})).status == 404
+            huge = {'scene': scene, 'image_width': 16384, 'image_height': 16384}
+            assert (await client.post('/jobs', json=huge)).status == 400
+
+            # Streams opened before, during and after the render all receive every tile exactly once
+            jobs = []
+            for seed in range(3):
+                response = await client.post('/jobs', json={'scene': scene, 'image_width': 48, 'image_height': 32, 'seed': seed})
+                assert response.status == 201
+                jobs.append((await response.json())['job_id'])
+            streams = [stream_image(client, job_id, 48, 32) for job_id in jobs]
+            results = await asyncio.gather(*streams)
+            late = await stream_image(client, jobs[0], 48, 32)
+            for job_id, (image, received, state) in zip(jobs + jobs[:1], results + [late]):
+                assert state == 'done'
+                assert sorted(received) == sorted(set(received)) and len(received) == 6
+                response = await client.get(f'/jobs/{job_id}/image')
+                final = np.frombuffer(await response.read(), dtype='<f4').reshape(32, 48, 3)
+                np.testing.assert_array_equal(image, final)
+                assert final.max() > 0
+
+    asyncio.run(run())
+
+def test_settings_cap_the_image_size():
+    assert parse_settings({'image_width': 16384, 'image_height': MAX_IMAGE_PIXELS // 16384})['image_width'] == 16384
+    with pytest.raises(ValueError):
+        parse_settings({'image_width': 16384, 'image_height': MAX_IMAGE_PIXELS // 16384 + 1})
+    with pytest.raises(ValueError):
+        parse_settings({'image_width': 16385, 'image_height': 1})
@@ -0,0 +1,82 @@
+import json
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+from texture import (Texture, TileCache, build_mip_chain, convert_texture, read_image, write_texture, SRGB_TO_LINEAR,
+                     TEXTURE_HALF, TEXTURE_SRGB8)
+
+def gradient_image(height=50, width=70):
+    """A smooth linear image with values in [0, 1]."""
+    y, x = np.mgrid[0:height, 0:width]
+    return np.stack((x / (width - 1), y / (height - 1), 0.5 * np.ones_like(x, dtype=float)), axis=2).astype(np.float32)
+
+def test_srgb8_round_trip(tmp_path):
+    image = gradient_image()
+    path = str(tmp_path / 'gradient.ptt')
+    write_texture(path, image, tile_size=16)
+    texture = Texture(path, TileCache())
+    assert texture.encoding == TEXTURE_SRGB8 and (texture.width, texture.height) == (70, 50)
+
+    # Every texel of every level comes back within the 8-bit quantization step
+    for level, expected in enumerate(build_mip_chain(image)):
+        y, x = np.mgrid[0:expected.shape[0], 0:expected.shape[1]]
+        texels = texture.texels(level, x.ravel(), y.ravel()).reshape(expected.shape)
+        np.testing.assert_allclose(texels, expected, atol=0.01)
+    assert len(texture.levels) == 8 and texture.levels[-1]['width'] == 1
+
+def test_half_round_trip_keeps_high_dynamic_range(tmp_path):
+    image = gradient_image() * 8 + 0.25
+    path = str(tmp_path / 'sky.ptt')
+    write_texture(path, image, tile_size=16, encoding=TEXTURE_HALF)
+    texture = Texture(path, TileCache())
+    y, x = np.mgrid[0:50, 0:70]
+    np.testing.assert_allclose(texture.texels(0, x.ravel(), y.ravel()).reshape(image.shape), image, rtol=1e-3)
+
+    # A footprint covering the whole texture reads the last level
+    np.testing.assert_allclose(texture.sample([[0.5, 0.5]], 1.0)[0], build_mip_chain(image)[-1][0, 0], rtol=1e-3)
+
+def test_convert_texture_picks_half_floats_for_hdr_images(tmp_path):
+    sky = np.full((8, 16, 3), 8.0, dtype=np.float32)
+    cv2.imwrite(str(tmp_path / 'sky.hdr'), sky)
+    name = convert_texture(str(tmp_path / 'sky.hdr'), str(tmp_path / 'cache'))
+    texture = Texture(str(tmp_path / 'cache' / name), TileCache())
+    assert texture.encoding == TEXTURE_HALF
+    np.testing.assert_allclose(texture.sample([[0.3, 0.6]], 0.0), [[8, 8, 8]], rtol=0.02)
+
+    # Low dynamic range images keep the compact 8-bit encoding and are decoded from sRGB
+    cv2.imwrite(str(tmp_path / 'gray.png'), np.full((4, 4, 3), 128, dtype=np.uint8))
+    name = convert_texture(str(tmp_path / 'gray.png'), str(tmp_path / 'cache'))
+    assert Texture(str(tmp_path / 'cache' / name)).encoding == TEXTURE_SRGB8
+    np.testing.assert_allclose(read_image(str(tmp_path / 'gray.png')), SRGB_TO_LINEAR[128])
+
+def test_tile_cache_stays_within_budget(tmp_path):
+    path = str(tmp_path / 'gradient.ptt')
+    write_texture(path, gradient_image(), tile_size=16)
+    tile_cache = TileCache(max_bytes=3 * 16 * 16 * 3 * 4)
+    texture = Texture(path, tile_cache)
+    y, x = np.mgrid[0:50, 0:70]
+    texture.texels(0, x.ravel(), y.ravel())
+    assert tile_cache.nbytes <= tile_cache.max_bytes and tile_cache.misses == 20
+
+def test_texture_budget_is_set_per_process_not_per_scene(tmp_path, monkeypatch, scene_description):
+    import texture
+    from scene import load_scene
+    monkeypatch.setattr(texture, '_tile_cache', TileCache())
+    path = str(tmp_path / 'gradient.ptt')
+    write_texture(path, gradient_image(), tile_size=16)
+    y, x = np.mgrid[0:50, 0:70]
+    Texture(path).texels(0, x.ravel(), y.ravel())
+
+    # Shrinking the process budget evicts the least recently used tiles at once
+    texture.configure_tile_cache(2 * 16 * 16 * 3 * 4)
+    tile_cache = texture.get_tile_cache()
+    assert len(tile_cache.tiles) == 2 and tile_cache.nbytes <= tile_cache.max_bytes
+
+    # Loading a textured scene leaves the budget alone, whatever its settings say
+    cv2.imwrite(str(tmp_path / 'sky.hdr'), np.full((16, 32, 3), 8.0, dtype=np.float32))
+    scene_description['lights'] = [{'type': 'image', 'image': 'sky.hdr'}]
+    scene_description['settings']['texture_memory_budget'] = 1
+    (tmp_path / 'sky.json').write_text(json.dumps(scene_description))
+    assert load_scene(str(tmp_path / 'sky.json')).textures
+    assert tile_cache.max_bytes == 2 * 16 * 16 * 3 * 4
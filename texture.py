@@ -0,0 +1,344 @@
+# Texture Files
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+TEXTURE_MAGIC = b'PYTHTXTR'
+TEXTURE_VERSION = 2
+TEXTURE_ALIGNMENT = 64
+TEXTURE_TILE_SIZE = 64
+
+# Texel encodings: 8-bit sRGB codes for colors in [0, 1], and linear half floats for high dynamic range images
+TEXTURE_SRGB8, TEXTURE_HALF = 'srgb8', 'half'
+TEXTURE_DTYPES = {TEXTURE_SRGB8: np.uint8, TEXTURE_HALF: np.float16}
+HALF_MAX = float(np.finfo(np.float16).max)
+
+# Linear values of the 8-bit sRGB codes
+SRGB_TO_LINEAR = np.where(np.arange(256) / 255 <= 0.04045, np.arange(256) / 255 / 12.92,
+                          ((np.arange(256) / 255 + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+def linear_to_srgb(values):
+    """Encodes linear values in [0, 1] as 8-bit sRGB codes.
+
+    Args:
+        values (np.array): An array of linear values.
+
+    Returns:
+        np.array: The uint8 sRGB codes.
+    """
+    values = np.clip(values, 0, 1)
+    encoded = np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055)
+    return np.round(encoded * 255).astype(np.uint8)
+
+def read_image(path):
+    """Reads an image file as linear RGB.
+
+    8-bit and 16-bit images are decoded from sRGB, while floating-point images such as OpenEXR and Radiance HDR
+    files are taken as linear. Alpha is dropped and gray images are expanded to RGB.
+
+    Args:
+        path (str): The path of the image file.
+
+    Returns:
+        np.array: An (H, W, 3) float32 array of linear RGB values.
+    """
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED | cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR)
+    if image is None:
+        raise ValueError(f"Unreadable texture image: {path}")
+    if image.ndim == 2:
+        image = np.repeat(image[:, :, None], 3, axis=2)
+    image = cv2.cvtColor(np.ascontiguousarray(image[:, :, :3]), cv2.COLOR_BGR2RGB)
+    if image.dtype == np.uint8:
+        return SRGB_TO_LINEAR[image]
+    if image.dtype == np.uint16:
+        return np.asarray(SRGB_TO_LINEAR[(image >> 8).astype(np.uint8)])
+    return image.astype(np.float32)
+
+def build_mip_chain(image):
+    """Builds the mipmap pyramid of an image by averaging 2x2 blocks down to a single texel.
+
+    Args:
+        image (np.array): An (H, W, 3) array of linear RGB values.
+
+    Returns:
+        list: The (H, W, 3) float32 levels, from the full image to 1x1.
+    """
+    levels = [np.asarray(image, dtype=np.float32)]
+    while max(levels[-1].shape[:2]) > 1:
+        level = levels[-1]
+
+        # Repeat the last row and column of odd sizes before averaging
+        level = np.pad(level, ((0, level.shape[0] % 2), (0, level.shape[1] % 2), (0, 0)), mode='edge')
+        levels.append((level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2]) / 4)
+    return levels
+
+def encode_texels(values, encoding):
+    """Encodes linear values as the texels of a texture encoding.
+
+    Args:
+        values (np.array): An array of linear values.
+        encoding (str): TEXTURE_SRGB8, which clamps to [0, 1], or TEXTURE_HALF, which keeps values up to 65504.
+
+    Returns:
+        np.array: The encoded texels.
+    """
+    if encoding == TEXTURE_HALF:
+        return np.clip(values, 0, HALF_MAX).astype(np.float16)
+    return linear_to_srgb(values)
+
+def write_texture(path, image, tile_size=TEXTURE_TILE_SIZE, encoding=TEXTURE_SRGB8):
+    """Writes an image as a tiled, mipmapped texture file.
+
+    The file is a magic number, the format version, a JSON header with the level sizes and the texel encoding, and
+    the texels of all levels as square tiles aligned to 64 bytes, so it can be memory-mapped and read one tile at a
+    time. Levels are padded to whole tiles by repeating their edges.
+
+    Args:
+        path (str): The path of the texture file.
+        image (np.array): An (H, W, 3) array of linear RGB values.
+        tile_size (int): The edge length of the tiles in texels.
+        encoding (str): TEXTURE_SRGB8 for colors or TEXTURE_HALF for high dynamic range images such as lights.
+    """
+    levels, tiles, tile_offset = [], [], 0
+    for level in build_mip_chain(image):
+        height, width = level.shape[:2]
+        tiles_y, tiles_x = -(-height // tile_size), -(-width // tile_size)
+        padded = np.pad(level, ((0, tiles_y * tile_size - height), (0, tiles_x * tile_size - width), (0, 0)), mode='edge')
+        tiles.append(encode_texels(padded, encoding).reshape(tiles_y, tile_size, tiles_x, tile_size, 3).swapaxes(1, 2).reshape(-1, tile_size, tile_size, 3))
+        levels.append({'width': width, 'height': height, 'tiles_x': tiles_x, 'tiles_y': tiles_y, 'first_tile': tile_offset})
+        tile_offset += tiles_x * tiles_y
+    header = json.dumps({'tile_size': tile_size, 'encoding': encoding, 'levels': levels}).encode('utf-8')
+    data_start = -(-(len(TEXTURE_MAGIC) + 8 + len(header)) // TEXTURE_ALIGNMENT) * TEXTURE_ALIGNMENT
+
+    # Write to a temporary file first, so concurrent readers never see a partial texture
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as texture_file:
+        texture_file.write(TEXTURE_MAGIC)
+        texture_file.write(np.array([TEXTURE_VERSION, len(header)], dtype='<u4').tobytes())
+        texture_file.write(header)
+        texture_file.seek(data_start)
+        for level_tiles in tiles:
+            texture_file.write(level_tiles.tobytes())
+    os.replace(temporary_path, path)
+
+def convert_texture(image_path, cache_directory, tile_size=TEXTURE_TILE_SIZE, encoding=None):
+    """Converts an image into a texture file once, keyed by the hash of the image file.
+
+    Args:
+        image_path (str): The path of the source image.
+        cache_directory (str): The directory holding converted textures.
+        tile_size (int): The edge length of the tiles in texels.
+        encoding (str): The texel encoding. Defaults to TEXTURE_HALF for images with values above one, such as
+            OpenEXR and Radiance HDR files, and to TEXTURE_SRGB8 otherwise.
+
+    Returns:
+        str: The file name of the texture inside the cache directory.
+    """
+    with open(image_path, 'rb') as image_file:
+        digest = hashlib.sha256(f'{TEXTURE_VERSION}:{tile_size}:{encoding}:'.encode('utf-8'))
+        digest.update(image_file.read())
+    name = digest.hexdigest() + '.ptt'
+    path = os.path.join(cache_directory, name)
+    if not os.path.exists(path):
+        os.makedirs(cache_directory, exist_ok=True)
+        image = read_image(image_path)
+        if encoding is None:
+            encoding = TEXTURE_HALF if image.max() > 1 else TEXTURE_SRGB8
+        write_texture(path, image, tile_size, encoding)
+    return name
+
+# Tile Cache
+
+class TileCache:
+    """Keeps recently used texture tiles decoded to linear float32, evicting the least recently used beyond a budget.
+
+    One cache is shared by all textures of a process, see get_tile_cache, so the memory spent on texels stays
+    bounded however many scenes and textures a worker has open. Only the tiles that lookups touch are read from
+    the memory-mapped files.
+
+    Args:
+        max_bytes (int): The memory budget of the decoded tiles.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, texture, level, tile_id):
+        """Returns a decoded tile, reading it from the texture file if it is not cached.
+
+        Args:
+            texture (Texture): The texture.
+            level (int): The mipmap level.
+            tile_id (int): The row-major index of the tile in its level.
+
+        Returns:
+            np.array: The (T, T, 3) float32 linear texels of the tile.
+        """
+        key = (texture.path, level, tile_id)
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+            self.misses += 1
+
+        # Decode outside the lock and evict the least recently used tiles beyond the budget
+        tile = texture.read_tile(level, tile_id)
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = tile
+                self.nbytes += tile.nbytes
+            self._evict()
+        return tile
+
+    def resize(self, max_bytes):
+        """Changes the memory budget, evicting the least recently used tiles beyond it.
+
+        Args:
+            max_bytes (int): The new memory budget of the decoded tiles.
+        """
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        # Keep at least the newest tile, so a tile larger than the budget can still be sampled
+        while len(self.tiles) > 1 and self.nbytes > self.max_bytes:
+            self.nbytes -= self.tiles.popitem(last=False)[1].nbytes
+
+_tile_cache = None
+
+def get_tile_cache():
+    """Returns the tile cache shared by all textures of this process."""
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = TileCache()
+    return _tile_cache
+
+def configure_tile_cache(max_bytes):
+    """Sets the texture memory budget of this process.
+
+    The budget belongs to the process rather than to a scene, since every open texture shares the one tile cache.
+    Call it once at startup, e.g. from a worker initializer or an application's settings.
+
+    Args:
+        max_bytes (int): The memory budget of the decoded tiles.
+    """
+    get_tile_cache().resize(max_bytes)
+
+# Texture Lookup
+
+class Texture:
+    """A memory-mapped texture file with filtered, vectorized lookups.
+
+    Args:
+        path (str): The path of a texture file written by write_texture.
+        tile_cache (TileCache): The cache the tiles are read through. Defaults to the process-wide cache.
+    """
+
+    def __init__(self, path, tile_cache=None):
+        self.path = os.path.abspath(path)
+        self.tile_cache = tile_cache
+        with open(path, 'rb') as texture_file:
+            magic = texture_file.read(len(TEXTURE_MAGIC))
+            version, header_length = np.frombuffer(texture_file.read(8), dtype='<u4')
+            if magic != TEXTURE_MAGIC or version != TEXTURE_VERSION:
+                raise ValueError(f"Unsupported texture file: {path}")
+            header = json.loads(texture_file.read(int(header_length)))
+        data_start = -(-(len(TEXTURE_MAGIC) + 8 + int(header_length)) // TEXTURE_ALIGNMENT) * TEXTURE_ALIGNMENT
+        self.tile_size = header['tile_size']
+        self.encoding = header['encoding']
+        self.levels = header['levels']
+        self.width, self.height = self.levels[0]['width'], self.levels[0]['height']
+        tile_count = sum(level['tiles_x'] * level['tiles_y'] for level in self.levels)
+        self.data = np.memmap(path, dtype=TEXTURE_DTYPES[self.encoding], mode='r', offset=data_start,
+                              shape=(tile_count, self.tile_size, self.tile_size, 3))
+
+    def read_tile(self, level, tile_id):
+        """Reads and decodes one tile from the file.
+
+        Args:
+            level (int): The mipmap level.
+            tile_id (int): The row-major index of the tile in its level.
+
+        Returns:
+            np.array: The (T, T, 3) float32 linear texels of the tile.
+        """
+        texels = self.data[self.levels[level]['first_tile'] + tile_id]
+        if self.encoding == TEXTURE_HALF:
+            return texels.astype(np.float32)
+        return SRGB_TO_LINEAR[texels]
+
+    def texels(self, level, x, y):
+        """Gathers texels of a level, wrapping coordinates outside the level around.
+
+        Args:
+            level (int): The mipmap level.
+            x (np.array): An (N,) array of integer texel columns.
+            y (np.array): An (N,) array of integer texel rows.
+
+        Returns:
+            np.array: An (N, 3) array of linear texel values.
+        """
+        level_info = self.levels[level]
+        x, y = x % level_info['width'], y % level_info['height']
+
+        # Fetch every touched tile once and index into the stacked tiles
+        tile_ids, inverse = np.unique((y // self.tile_size) * level_info['tiles_x'] + x // self.tile_size, return_inverse=True)
+        tile_cache = self.tile_cache or get_tile_cache()
+        tiles = np.stack([tile_cache.get(self, level, int(tile_id)) for tile_id in tile_ids])
+        return tiles[inverse.ravel(), y % self.tile_size, x % self.tile_size]
+
+    def bilinear(self, level, uv):
+        """Filters a level bilinearly at texture coordinates, with (0, 0) at the bottom left and wrapping repeat.
+
+        Args:
+            level (int): The mipmap level.
+            uv (np.array): An (N, 2) array of texture coordinates.
+
+        Returns:
+            np.array: An (N, 3) array of filtered linear values.
+        """
+        x = uv[:, 0] * self.levels[level]['width'] - 0.5
+        y = (1 - uv[:, 1]) * self.levels[level]['height'] - 0.5
+        x_0, y_0 = np.floor(x).astype(np.int64), np.floor(y).astype(np.int64)
+        f_x, f_y = (x - x_0)[:, None], (y - y_0)[:, None]
+        return ((1 - f_y) * ((1 - f_x) * self.texels(level, x_0, y_0) + f_x * self.texels(level, x_0 + 1, y_0)) +
+                f_y * ((1 - f_x) * self.texels(level, x_0, y_0 + 1) + f_x * self.texels(level, x_0 + 1, y_0 + 1)))
+
+    def sample(self, uv, footprint):
+        """Filters the texture trilinearly, picking the mipmap levels from the footprint of every lookup.
+
+        Args:
+            uv (np.array): An (N, 2) array of texture coordinates.
+            footprint (np.array): An (N,) array of the lookup widths in texture coordinates, for example from ray
+                differentials. A footprint of one texel selects the full-resolution level.
+
+        Returns:
+            np.array: An (N, 3) array of filtered linear values.
+        """
+        uv = np.asarray(uv, dtype=np.float64).reshape(-1, 2)
+        footprint = np.broadcast_to(np.asarray(footprint, dtype=np.float64), len(uv))
+        lod = np.clip(np.log2(np.maximum(footprint * max(self.width, self.height), 1e-12)), 0, len(self.levels) - 1)
+        lower = np.floor(lod).astype(np.int64)
+        upper = np.minimum(lower + 1, len(self.levels) - 1)
+        blend = (lod - lower)[:, None]
+
+        # Filter each level once for all lookups that touch it
+        result = np.zeros((len(uv), 3))
+        for level in np.unique(np.concatenate((lower, upper))):
+            for rows, weights in ((lower == level, 1 - blend), (upper == level, blend)):
+                if rows.any():
+                    result[rows] += weights[rows] * self.bilinear(int(level), uv[rows])
+        return result